@@ -10,6 +10,8 @@ sys.path.append(str(src_dir.absolute()))
 
 from TATSSI.notebooks.helpers.time_series_interpolation import \
         TimeSeriesInterpolation
+from TATSSI.input_output.cache import ResultCache
+from TATSSI.input_output.pixel_cache import get_pixel_cache
 
 import numpy as np
 
@@ -134,7 +136,8 @@ class PlotInterpolation(QtWidgets.QMainWindow):
         # Enable progress bar
         self.progressBar.setEnabled(True)
         self.progressBar.setValue(1)
-        tsi.interpolate(progressBar=self.progressBar)
+        tsi.interpolate(progressBar=self.progressBar,
+                        cache=ResultCache())
 
         # Standard cursor
         QtWidgets.QApplication.restoreOverrideCursor()
@@ -257,19 +260,22 @@ class PlotInterpolation(QtWidgets.QMainWindow):
         self.right_p.plot(event.xdata, event.ydata,
                 marker='o', color='red', markersize=7, alpha=0.7)
 
-        # Non-masked data
-        left_plot_sd = self.left_ds.sel(longitude=event.xdata,
-                                        latitude=event.ydata,
-                                        method='nearest')
-        if left_plot_sd.chunks is not None:
-            left_plot_sd = left_plot_sd.compute()
+        # Non-masked data, from the time-major pixel cache of the
+        # data variable layer stack
+        data_var = self.data_vars.currentText()
+        fname = os.path.join(self.source_dir, data_var[1::],
+                             f'{data_var[1::]}.vrt')
+        pixel_cache = get_pixel_cache(self.left_ds, fname)
+        left_plot_sd = pixel_cache.get(event.xdata, event.ydata)
 
         # Masked data
-        right_plot_sd = self.right_ds.sel(longitude=event.xdata,
-                                          latitude=event.ydata,
-                                          method='nearest')
-        if right_plot_sd.chunks is not None:
-            right_plot_sd = right_plot_sd.compute()
+        if self.mask is None:
+            right_plot_sd = left_plot_sd.copy(deep=True)
+        else:
+            _mask = self.mask.sel(longitude=event.xdata,
+                                  latitude=event.ydata,
+                                  method='nearest')
+            right_plot_sd = left_plot_sd * _mask.data
 
         # Plots
         left_plot_sd.plot(ax=self.ts_p, color='black',
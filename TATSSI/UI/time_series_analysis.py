@@ -10,10 +10,23 @@ sys.path.append(str(src_dir.absolute()))
 
 from TATSSI.time_series.smoothn import smoothn
 from TATSSI.time_series.analysis import Analysis
-from TATSSI.time_series.mk_test import mk_test
+from TATSSI.time_series.mk_test import mk_test, mk_test_chunk
+from TATSSI.time_series.peaks import peak_flags, peak_frequency
+from TATSSI.time_series.change_points import binseg_meanvar, \
+        get_penalty, change_points
+from TATSSI.time_series.climatology import save_climatology, \
+        open_climatology, anomalies, save_anomalies
+from TATSSI.time_series.decomposition import save_decomposition, \
+        stl_decomposition
+from TATSSI.time_series.phenology import save_phenology, \
+        phenology_methods
+from TATSSI.time_series.events import build_event_table, \
+        rasterize_counts
 from TATSSI.UI.plots_time_series_analysis import PlotAnomalies
 from TATSSI.input_output.utils import save_dask_array, \
-        get_geotransform_from_xarray
+        save_dask_arrays, get_geotransform_from_xarray
+from TATSSI.input_output.pixel_cache import get_pixel_cache
+from TATSSI.input_output.execution import get_execution_config
 from TATSSI.UI.helpers.utils import *
 
 #from TATSSI.notebooks.helpers.time_series_analysis import \
@@ -25,7 +38,6 @@ import numpy as np
 from rasterio import logging as rio_logging
 from statsmodels.tsa.seasonal import seasonal_decompose
 from scipy.signal import find_peaks
-from scipy.stats import norm
 
 import seaborn as sbn
 
@@ -50,11 +62,6 @@ from PyQt5 import QtCore, QtGui, QtWidgets, uic
 from PyQt5.QtCore import Qt, pyqtSlot
 from PyQt5.QtGui import QFont
 
-# Experimental
-from rpy2.robjects.packages import importr
-from rpy2.robjects import FloatVector
-from rpy2.robjects import numpy2ri
-
 def get_projection(proj4_string):
     """
     Get spatial reference system from PROJ4 string
@@ -80,9 +87,6 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
         log = rio_logging.getLogger()
         log.setLevel(rio_logging.ERROR)
 
-        # Change point R library
-        self.cpt = importr('changepoint')
-
         # Plot input data
         self._plot()
 
@@ -140,6 +144,9 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
         # MK test
         self.pbMKTest.clicked.connect(
                 self.on_pbMKTest_click)
+        # Phenology button
+        self.pbPhenology.clicked.connect(
+                self.on_pbPhenology_click)
 
         # Change Point Detection button
         self.pbCPD.clicked.connect(
@@ -163,6 +170,12 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
         # Decomposition model
         self.model.addItems(self.__fill_model())
 
+        # Phenology methods, the threshold is only used by the
+        # threshold method
+        self.phenology_method.addItems(list(phenology_methods.keys()))
+        self.phenology_method.currentTextChanged.connect(
+                self.__on_phenology_method_change)
+
         # Create plot objects
         self.__create_plot_objects()
 
@@ -202,88 +215,55 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
         else:
             _data = self.left_ds
 
-        def __get_z(x, s=None):
-            n = x.shape[2]
-
-            for k in range(n-1):
-                for j in range(k+1, n):
-                    if s is None:
-                        s = np.sign(x[:,:,j] - x[:,:,k])
-                    else:
-                        s += np.sign(x[:,:,j] - x[:,:,k])
-
-            var_s = (n*(n-1)*(2*n+5))/18
-
-            z = np.where(s > 0,
-                    (s - 1)/np.sqrt(var_s),
-                    (s + 1)/np.sqrt(var_s)).astype(np.float32)
-
-            z[s==0] = 0.0
+        # Only pixels with enough valid observations are tested
+        fill_value, min_data_available = self.__get_min_data_available()
 
-            return z
+        def __mk_test(x):
+            # Time is the last dimension, see input_core_dims
+            trend, h, p, z, slope = mk_test_chunk(x, axis=-1,
+                    fill_value=fill_value,
+                    min_data_available=min_data_available)
 
-        def __get_p(z):
-            # Two tail test
-            p = (2*(1-norm.cdf(abs(z)))).astype(np.float32)
+            return np.stack([z, p, h, trend, slope],
+                    axis=-1).astype(np.float32)
 
-            return p
-
-        def __get_h(z, alpha=0.05):
-            h = (abs(z) > norm.ppf(1-alpha/2)).astype(np.int8)
-
-            return h
-
-        def __get_trend(z, h):
-            trend = np.where((z < 0) & (h == True), -1, 0).astype(np.int16)
-
-            trend = np.where((z > 0) & (h == True), 1, trend)
-
-            return trend
-
-        z = xr.apply_ufunc(__get_z, _data,
+        # All products are computed in a single pass
+        mk = xr.apply_ufunc(__mk_test, _data,
                 input_core_dims=[['time']],
+                output_core_dims=[['product']],
+                output_sizes={'product' : 5},
                 dask='parallelized',
                 output_dtypes=[np.float32])
 
-        z = z.compute()
-
-        p = xr.apply_ufunc(__get_p, z,
-                dask='parallelized',
-                output_dtypes=[np.float32])
-
-        h = xr.apply_ufunc(__get_h, z,
-                dask='parallelized',
-                output_dtypes=[np.int16])
-
-        trend = xr.apply_ufunc(__get_trend, z, h,
-                dask='parallelized',
-                output_dtypes=[np.int16])
-
         # Save products
         var = self.data_vars.currentText()
-        products = [z, p, h, trend]
-        product_names = ['z', 'p', 'h', 'trend']
+        product_names = ['z', 'p', 'h', 'trend', 'slope']
+        # h is saved bit-packed, see save_dask_array
+        product_dtypes = [np.float32, np.float32, np.bool_, np.int16,
+                          np.float32]
 
+        products = {}
         for i, product in enumerate(product_names):
             fname = (f'{os.path.splitext(self.fname)[0]}'
                      f'_mann-kendall_test_{product}.tif')
 
-            msg = f"Saving Mann-Kendal test - {product}..."
-            self.progressBar.setFormat(msg)
-            self.progressBar.setValue(1)
+            _product = mk.isel(product=i).astype(product_dtypes[i])
 
             # Set attributes from input data
-            products[i].attrs = _data.attrs
+            _product.attrs = _data.attrs
 
             # Add time dimension
-            products[i] = products[i].expand_dims(
-                    dim='time', axis=0)
+            products[fname] = _product.expand_dims(dim='time', axis=0)
 
-            save_dask_array(fname=fname, data=products[i],
-                    data_var=var, method=None,
-                    n_workers=4, progressBar=self.progressBar)
+        msg = f"Saving Mann-Kendal test..."
+        self.progressBar.setFormat(msg)
+        self.progressBar.setValue(1)
 
-            self.progressBar.setValue(1)
+        # All products are written from a single computation of every
+        # strip, the kernel is already parallel over pixels, chunks are
+        # processed one at a time to avoid nested parallelism
+        save_dask_arrays(products, data_var=var, scheduler='synchronous',
+                progressBar=self.progressBar)
 
         self.progressBar.setValue(0)
         self.progressBar.setEnabled(False)
@@ -291,6 +271,16 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
         # Standard cursor
         QtWidgets.QApplication.restoreOverrideCursor()
 
+    def __get_min_data_available(self):
+        """
+        Fill value and minimum percentage of valid observations a pixel
+        needs to be processed by the per-pixel analysis kernels
+        """
+        fill_value = self.left_ds.attrs.get('nodatavals', (None,))[0]
+        min_data_available = float(self.min_data_available.value())
+
+        return fill_value, min_data_available
+
     def __frequency_analysis(self):
         """
         Computes the annual frequency of peaks and valleys
@@ -300,43 +290,44 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
         self.progressBar.setFormat(msg)
         self.progressBar.setValue(1)
 
-        # Ouput xarrays
-        peaks = xr.zeros_like(self.left_ds)
-        peaks = peaks.compute()
-
-        layers, rows, cols = self.left_ds.shape
-
         # Set required distance to be consider an independent peak
         # The assumption is that a peak should occure on a different
         # season, hence getting all time steps on a single year / 4
         distance = int(np.ceil(len(self.single_year_ds.time) / 4))
 
-        # TODO Extremely inefficient way to compute peaks and valleys
-        # must be changes for a array-based solution!
-        for c in range(cols):
-            self.progressBar.setValue(int(((c+1) / cols) * 100))
-            for r in range(rows):
-                idx, _ = find_peaks(self.left_ds[:,r,c], distance=distance)
-                peaks[idx,r,c] = 1
-
-        # Get the number of peaks and valleys on a calendar year
-        annual_peaks = peaks.groupby("time.year")
-        annual_peaks = annual_peaks.sum(dim='time').astype(np.int8)
+        # Year of every time step
+        years = self.left_ds.time.dt.year.data
+
+        # Only pixels with enough valid observations are processed
+        fill_value, min_data_available = self.__get_min_data_available()
+
+        def __peak_flags(x):
+            return peak_flags(x, distance, axis=0, fill_value=fill_value,
+                    min_data_available=min_data_available)
+
+        # Sparse table with the peaks of all pixels, saved along the
+        # frequencies, see TATSSI.time_series.events
+        peaks = build_event_table(self.left_ds, __peak_flags, 'peak')
+
+        fname = (f'{os.path.splitext(self.fname)[0]}'
+                     f'_peaks_events.npz')
+        peaks.save(fname)
+
+        # Get the number of peaks on a calendar year
+        _annual_peaks = rasterize_counts(peaks, groups=years)
+        _annual_peaks = _annual_peaks.rename({'group' : 'year'})
         # Copy attributes
-        annual_peaks.attrs = self.left_ds.attrs
+        _annual_peaks.attrs = self.left_ds.attrs
 
         # Get the frequency of one and two peaks
-        n_years = len(annual_peaks.year)
-        freq_one_peak = annual_peaks.where(annual_peaks==1).count(dim='year')
-        freq_one_peak = freq_one_peak / n_years
+        freq_one_peak = peak_frequency(_annual_peaks, 1, axis=0)
         # Copy attributes
         freq_one_peak.attrs = self.left_ds.attrs
         # Add time dimension
         freq_one_peak = freq_one_peak.expand_dims(
                 dim='time', axis=0)
 
-        freq_two_peak = annual_peaks.where(annual_peaks==2).count(dim='year')
-        freq_two_peak = freq_two_peak / n_years
+        freq_two_peak = peak_frequency(_annual_peaks, 2, axis=0)
         # Copy attributes
         freq_two_peak.attrs = self.left_ds.attrs
         # Add time dimension
@@ -350,23 +341,23 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
         fname = (f'{os.path.splitext(self.fname)[0]}'
                      f'_peaks.tif')
 
-        save_dask_array(fname=fname, data=annual_peaks,
+        save_dask_array(fname=fname, data=_annual_peaks,
                 data_var=self.data_vars.currentText(), method=None,
-                n_workers=4, progressBar=self.progressBar)
+                progressBar=self.progressBar)
 
         fname = (f'{os.path.splitext(self.fname)[0]}'
                      f'_one_peak_frequency.tif')
 
         save_dask_array(fname=fname, data=freq_one_peak,
                 data_var=self.data_vars.currentText(), method=None,
-                n_workers=4, progressBar=self.progressBar)
+                progressBar=self.progressBar)
 
         fname = (f'{os.path.splitext(self.fname)[0]}'
                      f'_two_peaks_frequency.tif')
 
         save_dask_array(fname=fname, data=freq_two_peak,
                 data_var=self.data_vars.currentText(), method=None,
-                n_workers=4, progressBar=self.progressBar)
+                progressBar=self.progressBar)
 
         self.progressBar.setValue(0)
 
@@ -388,57 +379,42 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
 
         # Extract period from the current single year
         period = int(self.bandwidth.currentText())
-        nobs = len(self.left_ds)
-
-        # Get data type
-        dtype = self.left_ds.dtype
-
-        # Get trend based on a moving window
-        trend = self.left_ds.rolling(time=period, min_periods=1,
-                center=True).mean().astype(dtype)
-        trend.attrs = self.left_ds.attrs
-
-        period_averages = self.left_ds.groupby("time.dayofyear")
-        period_averages = period_averages.mean(axis=0).astype(dtype)
-
-        if self.model.currentText()[0] == 'a':
-            period_averages -= period_averages.mean(axis=0).astype(dtype)
-            seasonal = np.tile(period_averages.T, nobs // period + 1).T[:nobs]
-            residuals = (self.left_ds - trend - seasonal).astype(dtype)
-        else:
-            period_averages /= period_averages.mean(axis=0).astype(dtype)
-            seasonal = np.tile(period_averages.T, nobs // period + 1).T[:nobs]
-            residuals = (self.left_ds / seasonal / trend).astype(dtype)
-
-        seasonal = None
-        del(seasonal)
-
-        period_averages.attrs = self.left_ds.attrs
-        residuals.attrs = self.left_ds.attrs
-
-        # Save to disk
-        products = [trend, period_averages, residuals]
-        product_names = ['trend', 'seasonality', 'residuals']
 
         var = self.data_vars.currentText()
 
-        for i, product in enumerate(product_names):
-            fname = (f'{os.path.splitext(self.fname)[0]}'
-                     f'_seasonal_decomposition_{product}.tif')
+        # Trend, seasonality and residuals from a single computation
+        # of every chunk, one multi-band file per product
+        save_decomposition(data=self.left_ds,
+                output_fname=f'{os.path.splitext(self.fname)[0]}.tif',
+                data_var=var, window=period,
+                model=self.model.currentText(),
+                progressBar=self.progressBar)
 
-            msg = f"Computing time series decomposition - {product}..."
-            self.progressBar.setFormat(msg)
-            self.progressBar.setValue(1)
+        self.progressBar.setValue(0)
+        self.progressBar.setEnabled(False)
 
-            save_dask_array(fname=fname, data=products[i],
-                            data_var=var, method=None,
-                            n_workers=4, progressBar=self.progressBar)
+        # Standard cursor
+        QtWidgets.QApplication.restoreOverrideCursor()
+
+    def on_pbPhenology_click(self):
+        """
+        Save the annual phenology metrics, one multi-band file per
+        metric with one band per year
+        """
+        # Wait cursor
+        QtWidgets.QApplication.setOverrideCursor(Qt.WaitCursor)
 
-            self.progressBar.setValue(1)
+        msg = f"Computing annual phenology metrics..."
+        self.progressBar.setEnabled(True)
+        self.progressBar.setFormat(msg)
+        self.progressBar.setValue(1)
 
-        # Delete big arrays onced they are saved
-        period_averages, residuals = None, None
-        del(period_averages, residuals)
+        save_phenology(data=self.left_ds,
+                output_fname=f'{os.path.splitext(self.fname)[0]}.tif',
+                data_var=self.data_vars.currentText(),
+                method=self.phenology_method.currentText(),
+                threshold=self.phenology_threshold.value(),
+                progressBar=self.progressBar)
 
         self.progressBar.setValue(0)
         self.progressBar.setEnabled(False)
@@ -446,6 +422,13 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
         # Standard cursor
         QtWidgets.QApplication.restoreOverrideCursor()
 
+    @pyqtSlot(str)
+    def __on_phenology_method_change(self, method):
+        """
+        Enables the threshold only for the threshold method
+        """
+        self.phenology_threshold.setEnabled(method == 'threshold')
+
     @pyqtSlot(int)
     def __on_time_steps_change(self, index):
         """
@@ -480,128 +463,38 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
         # Wait cursor
         QtWidgets.QApplication.setOverrideCursor(Qt.WaitCursor)
 
-        # Compute climatology
-        self.ts.climatology()
-
         self.progressBar.setEnabled(True)
         self.progressBar.setValue(1)
-        msg = f"Computing quartiles and saving outliers..."
+        msg = f"Computing climatology..."
         self.progressBar.setFormat(msg)
-        
-        quartiles = [0.25, 0.5, 0.75]
-        n_quartiles = len(quartiles)
-        quartile_names = ['Q1', 'median', 'Q2', 'minimum', 'maximum']
-        var = self.data_vars.currentText()
-
-        # Group by day of year to compute quartiles
-        grouped_by_doy = self.ts.data[var].time.groupby("time.dayofyear")
-        # Get the number of time steps
-        n_time_steps = len(grouped_by_doy.groups.keys())
-        # rows and cols
-        rows, cols = self.ts.data[var].shape[1:]
-        # Create output array
-        # Layers
-        # 0 - Q1
-        # 1 - Median
-        # 2 - Q3
-        # 3 - Q1 - 1.5 * IQR
-        # 4 - Q3 + 1.5 * IQR
-        q_data = np.zeros((n_quartiles+2, n_time_steps, rows, cols))
-
-        # Store Days of Year
-        doys = []
-
-        for i, (doy, _times) in enumerate(grouped_by_doy):
-            self.progressBar.setValue(int((i/len(grouped_by_doy))*100))
-
-            doys.append(doy)
-
-            # Get time series for DoY
-            ts_doy = self.ts.data[var].sel(time=_times.data)
-            # Get quartiles for DoY
-            q_data[0:3,i] = np.quantile(ts_doy, q=quartiles, axis=0)
-
-            # Get IQR
-            iqr = q_data[2,i] - q_data[0,i]
-            # Get boundaries
-            q_data[3,i] = q_data[0,i] - (1.5 * iqr)
-            q_data[4,i] = q_data[2,i] + (1.5 * iqr)
-
-            # Upper boundary outliers
-            upper_boundary_outliers = ts_doy < q_data[3,i]
-            upper_boundary_outliers.attrs = ts_doy.attrs
-            fname = (f'{os.path.splitext(self.fname)[0]}'
-                     f'_upper_boundary_outliers_DoY_{doy:03d}.tif')
-
-            save_dask_array(fname=fname,
-                            data=upper_boundary_outliers,
-                            data_var=var, method=None,
-                            n_workers=4)
-
-            # Lower boundary outliers
-            lower_boundary_outliers = ts_doy < q_data[4,i]
-            lower_boundary_outliers.attrs = ts_doy.attrs
-            fname = (f'{os.path.splitext(self.fname)[0]}'
-                     f'_lower_boundary_outliers_DoY_{doy:03d}.tif')
-
-            save_dask_array(fname=fname,
-                            data=lower_boundary_outliers,
-                            data_var=var, method=None,
-                            n_workers=4)
-
-        # Save quartiles
-        self.progressBar.setValue(0)
-        msg = f"Saving quartiles..."
-        self.progressBar.setFormat(msg)
-
-        for i, quartile_name in enumerate(quartile_names):
-            self.progressBar.setValue(int((i/len(quartile_names))*100))
 
-            fname = (f'{os.path.splitext(self.fname)[0]}'
-                     f'_climatology_quartile_{quartile_name}.tif')
+        var = self.data_vars.currentText()
+        data = self.ts.data[var]
 
-            tmp_ds = xr.zeros_like(self.ts.climatology_mean)
-            tmp_ds.data = q_data[i]
+        # Mean, std, quartiles and whisker bounds for all days of
+        # year in a single pass, one multi-band file per statistic,
+        # outliers of all time steps saved in the same pass as a
+        # single bit-packed cube, see decode_outliers
+        output_fnames = save_climatology(data=data,
+                output_fname=f'{os.path.splitext(self.fname)[0]}.tif',
+                data_var=var, outliers=True,
+                progressBar=self.progressBar)
 
-            save_dask_array(fname=fname, data=tmp_ds,
-                            data_var=var, method=None,
-                            n_workers=4)
-
-        # Save climatology and per-year standard anomalies
-        fname = (f'{os.path.splitext(self.fname)[0]}'
-                     f'_climatology_mean.tif')
-        save_dask_array(fname=fname, data=self.ts.climatology_mean,
-                data_var=var, method=None, n_workers=4)
-        fname = (f'{os.path.splitext(self.fname)[0]}'
-                     f'_climatology_std.tif')
-        save_dask_array(fname=fname, data=self.ts.climatology_std,
-                data_var=var, method=None, n_workers=4)
+        climatology_mean = open_climatology(output_fnames['mean'])
+        climatology_std = open_climatology(output_fnames['std'])
 
         self.progressBar.setValue(0)
-        msg = f"Saving climatologies and per-year anomalies..."
+        msg = f"Saving anomalies..."
         self.progressBar.setFormat(msg)
 
-        grouped_by_year = self.ts.data[var].time.groupby("time.year")
-
-        for i, (_year, _times) in enumerate(grouped_by_year):
-            self.progressBar.setValue(int((i/len(grouped_by_year))*100))
-
-            # Get time series for year
-            ts_year = self.ts.data[var].sel(time=_times.data)
+        # Anomalies for all time steps, including partial years,
+        # saved as scaled int16 in a single multi-band file
+        _anomalies = anomalies(data, climatology_mean, climatology_std)
 
-            # Anomalies (only for full years)
-            if not len(ts_year.time) == n_time_steps:
-                continue
-
-            anomalies = (ts_year - self.ts.climatology_mean.data) \
-                    / self.ts.climatology_std.data
-
-            fname = (f'{os.path.splitext(self.fname)[0]}'
-                     f'_anomalies{_year}.tif')
-
-            anomalies.attrs = ts_year.attrs
-            save_dask_array(fname=fname, data=anomalies,
-                    data_var=var, method=None, n_workers=4)
+        fname = f'{os.path.splitext(self.fname)[0]}_anomalies.tif'
+        save_anomalies(data=_anomalies, output_fname=fname,
+                data_var=var, scale_factor=0.001,
+                progressBar=self.progressBar)
 
         self.progressBar.setValue(0)
         self.progressBar.setEnabled(False)
@@ -680,7 +573,7 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
             # Compute climatology
             self.ts.climatology()
 
-            with ProgressBar():
+            with get_execution_config(), ProgressBar():
                 self.ts.climatology_mean = self.ts.climatology_mean.compute()
                 self.ts.climatology_std = self.ts.climatology_std.compute()
 
@@ -705,7 +598,7 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
             anomalies = (self.single_year_ds - self.ts.climatology_mean.data) \
                             / self.ts.climatology_std.data
 
-            with ProgressBar():
+            with get_execution_config(), ProgressBar():
                 self.anomalies = anomalies.compute()
 
             first_run = False
@@ -773,7 +666,7 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
         """
         Fill time series decompostion model
         """
-        _models = ['additive', 'multiplicative']
+        _models = ['additive', 'multiplicative', 'STL']
 
         return _models
 
@@ -822,18 +715,11 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
         self.right_p.plot(event.xdata, event.ydata,
                 marker='o', color='red', markersize=7, alpha=0.7)
 
-        # Non-masked data
-        left_plot_sd = self.left_ds.sel(longitude=event.xdata,
-                                        latitude=event.ydata,
-                                        method='nearest')
+        # Non-masked data, from the time-major pixel cache
+        pixel_cache = get_pixel_cache(self.left_ds, self.fname)
+        left_plot_sd = pixel_cache.get(event.xdata, event.ydata)
         # Sinlge year dataset
-        single_year_ds = self.single_year_ds.sel(longitude=event.xdata,
-                                                 latitude=event.ydata,
-                                                 method='nearest')
-
-        if left_plot_sd.chunks is not None:
-            left_plot_sd = left_plot_sd.compute()
-            single_year_ds = single_year_ds.compute()
+        single_year_ds = left_plot_sd.sel(time=self.single_year_ds.time)
 
         ts_df = left_plot_sd.to_dataframe()
 
@@ -861,23 +747,34 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
         period = int(self.bandwidth.currentText())
         nobs = len(left_plot_sd)
 
-        # TODO interpolate and extrapolate trend
-        trend = left_plot_sd.rolling(time=period, min_periods=1,
-                center=True).mean()
-        self.trend_p.plot(left_plot_sd.time.data, trend.data,
-                label=f'Trend (window = {period})')
-
-        period_averages = left_plot_sd.groupby("time.dayofyear").mean()
-
-        if self.model.currentText()[0] == 'a':
-            period_averages -= period_averages.mean(axis=0)
-            seasonal = np.tile(period_averages.T, nobs // period + 1).T[:nobs]
-            resid = (left_plot_sd - trend) - seasonal
+        if self.model.currentText() == 'STL':
+            # Same engine used for the STL raster products
+            trend, seasonal, resid = stl_decomposition(
+                    left_plot_sd.data, period)
+            trend = left_plot_sd.copy(data=trend)
+            resid = left_plot_sd.copy(data=resid)
+            trend_label = f'STL trend (period = {period})'
         else:
-            period_averages /= period_averages.mean(axis=0)
-            seasonal = np.tile(period_averages.T, nobs // period + 1).T[:nobs]
-            resid = left_plot_sd / seasonal / trend
+            # TODO interpolate and extrapolate trend
+            trend = left_plot_sd.rolling(time=period, min_periods=1,
+                    center=True).mean()
+            trend_label = f'Trend (window = {period})'
+
+            period_averages = left_plot_sd.groupby("time.dayofyear").mean()
+
+            if self.model.currentText()[0] == 'a':
+                period_averages -= period_averages.mean(axis=0)
+                seasonal = np.tile(period_averages.T,
+                        nobs // period + 1).T[:nobs]
+                resid = (left_plot_sd - trend) - seasonal
+            else:
+                period_averages /= period_averages.mean(axis=0)
+                seasonal = np.tile(period_averages.T,
+                        nobs // period + 1).T[:nobs]
+                resid = left_plot_sd / seasonal / trend
 
+        self.trend_p.plot(left_plot_sd.time.data, trend.data,
+                label=trend_label)
         self.seasonal_p.plot(left_plot_sd.time.data, seasonal,
                 label='Seasonality')
         self.resid_p.plot(left_plot_sd.time.data, resid.data,
@@ -899,13 +796,8 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
         self.climatology.tick_params(axis='x', rotation=70)
 
         # Change point
-        r_vector = FloatVector(trend.data)
-        #changepoint_r = self.cpt.cpt_mean(r_vector)
-        #changepoints_r = self.cpt.cpt_var(r_vector, method='PELT',
-        #        penalty='Manual', pen_value='2*log(n)')
-        changepoints_r = self.cpt.cpt_meanvar(r_vector,
-                test_stat='Normal', method='BinSeg', penalty="SIC")
-        changepoints = numpy2ri.rpy2py(self.cpt.cpts(changepoints_r))
+        changepoints = binseg_meanvar(trend.data.astype(np.float64),
+                get_penalty(nobs, penalty='SIC'))
 
         if changepoints.shape[0] > 0:
             # Plot vertical line where the changepoint was found
@@ -1198,48 +1090,55 @@ class TimeSeriesAnalysisUI(QtWidgets.QMainWindow):
         # Get trend based on a moving window
         trend = self.left_ds.rolling(time=period, min_periods=1,
                 center=True).mean().astype(dtype)
-        trend = trend.compute()
-        trend.attrs = self.left_ds.attrs
-
-        # Output data
-        output = xr.zeros_like(trend).astype(np.int16).load()
-        output.attrs = self.left_ds.attrs
-
-        layers, rows, cols = trend.shape
-
-        for x in range(cols):
-            self.progressBar.setValue(int((x / cols) * 100))
-            for y in range(rows):
-                _data = trend[:,y,x]
-                r_vector = FloatVector(_data)
+        # Pixels without enough valid observations in the input data
+        # are masked, the masked trend is not finite and these pixels
+        # are left out by change_points
+        fill_value, min_data_available = self.__get_min_data_available()
+        if fill_value is None or np.isnan(fill_value):
+            valid = self.left_ds.notnull()
+        else:
+            valid = self.left_ds != fill_value
 
-                #changepoint_r = self.cpt.cpt_mean(r_vector)
-                #changepoints_r = self.cpt.cpt_var(r_vector, method='PELT',
-                #        penalty='Manual', pen_value='2*log(n)')
+        _pct_data_available = (valid.sum(dim='time') * 100.0) / nobs
+        trend = trend.where((_pct_data_available >= min_data_available) &
+                            (_pct_data_available > 0.0))
 
-                # CPD methods
-                _method = 'BinSeg'
-                _penalty = 'SIC'
+        # Full time series on every chunk
+        trend = trend.chunk({'time' : -1})
+        trend.attrs = self.left_ds.attrs
 
-                changepoints_r = self.cpt.cpt_meanvar(r_vector,
-                        test_stat='Normal', method=_method, penalty=_penalty)
+        # CPD methods
+        _method = 'BinSeg'
+        _penalty = 'SIC'
 
-                changepoints = numpy2ri.rpy2py(
-                        self.cpt.cpts(changepoints_r)).astype(int)
+        def __change_points(x):
+            # Flag the time step after the change point
+            return change_points(x, method=_method, penalty=_penalty,
+                    shift=1, axis=0, min_data_available=0.0) > 0
 
-                if changepoints.shape[0] > 0:
-                    output[changepoints+1, y, x] = True
+        # Change points are stored as a sparse event table, the dense
+        # cube is almost all zeros, the magnitude is the trend value
+        output = build_event_table(trend, __change_points,
+                'change_point', progressBar=self.progressBar)
 
         fname = (f'{os.path.splitext(self.fname)[0]}'
-                     f'_change_points.tif')
+                     f'_change_points.npz')
 
         msg = f"Saving change points..."
         self.progressBar.setFormat(msg)
         self.progressBar.setValue(1)
 
-        save_dask_array(fname=fname, data=output,
+        output.save(fname)
+
+        # Number of change points of every pixel
+        fname = (f'{os.path.splitext(self.fname)[0]}'
+                     f'_change_points_count.tif')
+
+        counts = rasterize_counts(output).expand_dims(dim='time', axis=0)
+
+        save_dask_array(fname=fname, data=counts,
                 data_var=self.data_vars.currentText(), method=None,
-                n_workers=4, progressBar=self.progressBar)
+                progressBar=self.progressBar)
 
         self.progressBar.setValue(0)
         self.progressBar.setEnabled(False)
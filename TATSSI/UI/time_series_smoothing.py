@@ -13,12 +13,13 @@ sys.path.append(str(src_dir.absolute()))
 from TATSSI.time_series.smoothn import smoothn
 from TATSSI.time_series.analysis import Analysis
 from TATSSI.time_series.smoothing import Smoothing
+from TATSSI.time_series.savgol import savgol
+from TATSSI.time_series.exp_smoothing import exp_smoothing
+from TATSSI.input_output.cache import ResultCache
+from TATSSI.input_output.pixel_cache import get_pixel_cache
 #from TATSSI.notebooks.helpers.time_series_smoothing import \
 #        TimeSeriesSmoothing
 
-# Smoothing methods
-import statsmodels.tsa.api as tsa
-
 import matplotlib
 matplotlib.use("Qt5Agg")
 import matplotlib.pyplot as plt
@@ -38,6 +39,9 @@ class TimeSeriesSmoothingUI(QtWidgets.QMainWindow):
         # Set input file name
         self.fname = fname
 
+        # Cache of smoothing outputs
+        self.cache = ResultCache()
+
         # Plot input data
         self._plot()
 
@@ -118,10 +122,12 @@ class TimeSeriesSmoothingUI(QtWidgets.QMainWindow):
             self.progressBar.setValue(1)
 
             # Perform smoothing
-            smoother = Smoothing(data=self.ts.data,
+            smoother = Smoothing(data=self.ts.data, fname=self.fname,
                     output_fname=output_fname,
                     smoothing_method=smoothing_method,
                     s=self.smooth_factor.value(),
+                    min_data_available=self.min_data_available.value(),
+                    cache=self.cache,
                     progressBar=self.progressBar)
 
             smoother.smooth()
@@ -161,12 +167,11 @@ class TimeSeriesSmoothingUI(QtWidgets.QMainWindow):
         Fill smoothing methods
         """
         # TODO document smoothing methods
-        # smoothing_methods = ['smoothn',
-        #                      'ExponentialSmoothing',
-        #                      'SimpleExpSmoothing',
-        #                      'Holt']
-
-        smoothing_methods = ['smoothn']
+        smoothing_methods = ['smoothn',
+                             'savgol',
+                             'ExponentialSmoothing',
+                             'SimpleExpSmoothing',
+                             'Holt']
 
         self.smoothing_methods.addItems(smoothing_methods)
 
@@ -191,11 +196,8 @@ class TimeSeriesSmoothingUI(QtWidgets.QMainWindow):
                 marker='o', color='red', markersize=7, alpha=0.7)
 
         # Interpolated data to smooth
-        img_plot_sd = self.img_ds.sel(longitude=event.xdata,
-                                      latitude=event.ydata,
-                                      method='nearest')
-        if img_plot_sd.chunks is not None:
-            img_plot_sd = img_plot_sd.compute()
+        pixel_cache = get_pixel_cache(self.img_ds, self.fname)
+        img_plot_sd = pixel_cache.get(event.xdata, event.ydata)
 
         # Plots
         img_plot_sd.plot(ax=self.ts_p, color='black',
@@ -213,15 +215,14 @@ class TimeSeriesSmoothingUI(QtWidgets.QMainWindow):
                 fittedvalues = smoothn(y, isrobust=True,
                         s=s, TolZ=1e-6, axis=0)[0]
 
+            elif method == 'savgol':
+                # Savitzky-Golay with default window and order
+                fittedvalues = savgol(y, axis=0)
+
             else:
-                _method = getattr(tsa, method)
-                # Smoothing
-                #fit = _method(y).fit(smoothing_level=s, optimized=False)
-                fit = _method(y.astype(float)).fit(smoothing_level=s)
-                # Re-cast to original data type
-                fittedvalues = np.zeros_like(fit.fittedvalues)
-                fittedvalues[0:-1] = fit.fittedvalues[1::]
-                fittedvalues[-1] = y[-1]
+                # Exponential smoothing methods
+                fittedvalues = exp_smoothing(y, method,
+                        smoothing_level=s, axis=0)
 
             # Plot
             tmp_ds = img_plot_sd.copy(deep=True,
@@ -0,0 +1,381 @@
+
+"""
+Asynchronous download engine used by the MODIS and VIIRS downloaders.
+
+All transfers run on a single event loop with a bounded pool of
+connections. Files are streamed into a .partial file that is resumed
+with an HTTP Range request when a transfer is interrupted, failed
+transfers are retried with exponential backoff and the size of every
+file is verified against the size announced by the server.
+
+aiohttp is used when available, otherwise transfers are made with
+requests on a pool of n_connections threads.
+"""
+
+import os
+import re
+import asyncio
+from functools import partial
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from urllib.parse import urljoin, urlparse
+
+from .download_index import get_checksum, md5sum
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+import logging
+LOG = logging.getLogger(__name__)
+
+# EarthData login host, credentials are kept when redirected to it
+AUTH_HOST = 'urs.earthdata.nasa.gov'
+
+# HTTP redirect status codes
+REDIRECTS = [301, 302, 303, 307, 308]
+
+def keep_auth(original, redirect):
+    """
+    Credentials are kept when redirected to the same host, to the
+    EarthData login host or from it, e.g. back to the data server
+    :param original: Host name of the request
+    :param redirect: Host name the request is redirected to
+    """
+    return original == redirect or AUTH_HOST in [original, redirect]
+
+class _AiohttpTransport():
+    """
+    Transfers with an aiohttp session, the connector limits the
+    number of connections. Redirects are followed by the transport,
+    aiohttp drops the session credentials on cross-origin redirects,
+    e.g. to the EarthData login host, see keep_auth
+    """
+    def __init__(self, n_connections, username, password, chunk_size,
+                 timeout, max_redirects=10):
+        self.n_connections = n_connections
+        self.auth = None
+        if username is not None:
+            self.auth = aiohttp.BasicAuth(username, password)
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.n_connections)
+        timeout = aiohttp.ClientTimeout(sock_read=self.timeout)
+        self.session = aiohttp.ClientSession(connector=connector,
+                timeout=timeout)
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.session.close()
+
+    @asynccontextmanager
+    async def get(self, url, headers):
+        """
+        GET request
+        :return: status, response headers and an async iterator with
+                 the content
+        """
+        auth = self.auth
+
+        for redirect in range(self.max_redirects + 1):
+            _headers = dict(headers)
+            if auth is not None:
+                _headers['Authorization'] = auth.encode()
+
+            async with self.session.get(url, headers=_headers,
+                    allow_redirects=False) as r:
+                if r.status in REDIRECTS and 'Location' in r.headers:
+                    _url = urljoin(url, r.headers['Location'])
+                    if not keep_auth(urlparse(url).hostname,
+                                     urlparse(_url).hostname):
+                        auth = None
+
+                    url = _url
+                    continue
+
+                yield r.status, r.headers, \
+                        r.content.iter_chunked(self.chunk_size)
+                return
+
+        msg = f"Too many redirects, {self.max_redirects}, for {url}"
+        raise Exception(msg)
+
+class _Session(requests.Session):
+    """
+    requests session that keeps the credentials when the data server
+    redirects to the EarthData login host
+    """
+    def rebuild_auth(self, prepared_request, response):
+        headers = prepared_request.headers
+        url = prepared_request.url
+
+        if 'Authorization' in headers:
+            original = urlparse(response.request.url).hostname
+            redirect = urlparse(url).hostname
+
+            if not keep_auth(original, redirect):
+                del headers['Authorization']
+
+class _RequestsTransport():
+    """
+    Transfers with a requests session, every transfer is run by one
+    of n_connections threads
+    """
+    def __init__(self, n_connections, username, password, chunk_size,
+                 timeout):
+        self.n_connections = n_connections
+        self.auth = None
+        if username is not None:
+            self.auth = (username, password)
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.session = None
+        self.executor = None
+
+    async def __aenter__(self):
+        self.session = _Session()
+        self.session.auth = self.auth
+        self.executor = ThreadPoolExecutor(max_workers=self.n_connections)
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.executor.shutdown()
+        self.session.close()
+
+    @asynccontextmanager
+    async def get(self, url, headers):
+        """
+        GET request
+        :return: status, response headers and an async iterator with
+                 the content
+        """
+        loop = asyncio.get_event_loop()
+        r = await loop.run_in_executor(self.executor,
+                partial(self.session.get, url, headers=headers,
+                        stream=True, timeout=self.timeout))
+        try:
+            yield r.status_code, r.headers, self.__iter_content(r)
+        finally:
+            r.close()
+
+    async def __iter_content(self, r):
+        loop = asyncio.get_event_loop()
+        blocks = r.iter_content(self.chunk_size)
+
+        while True:
+            block = await loop.run_in_executor(self.executor,
+                    next, blocks, None)
+            if block is None:
+                break
+
+            yield block
+
+def get_transport(n_connections, username=None, password=None,
+                  chunk_size=65536, timeout=300):
+    """
+    Gets the transport for the download engine, aiohttp if available,
+    requests otherwise
+    :param n_connections: Maximum number of concurrent connections
+    :param username: Username, e.g. EarthData login
+    :param password: Password
+    :param chunk_size: Size in bytes of the blocks written to disk
+    :param timeout: Seconds without receiving data before a transfer
+                    is considered failed
+    """
+    if aiohttp is not None:
+        transport = _AiohttpTransport
+    else:
+        transport = _RequestsTransport
+
+    return transport(n_connections, username, password, chunk_size,
+                     timeout)
+
+def get_total_size(status, headers):
+    """
+    Size of the full file from the response headers, Content-Range for
+    partial content, Content-Length otherwise
+    :return: Size in bytes, None if the server does not provide it
+    """
+    if status == 206:
+        content_range = headers.get('Content-Range', '')
+        match = re.match(r'bytes \d+-\d+/(\d+)', content_range)
+        if match is not None:
+            return int(match.group(1))
+        return None
+
+    if 'Content-Length' in headers:
+        return int(headers['Content-Length'])
+
+    return None
+
+async def download_file(transport, url, output_dir, semaphore,
+                        max_retries=5, backoff=1.0, index=None):
+    """
+    Downloads a single file into output_dir. Data is written into a
+    .partial file that is resumed with a Range request on every
+    retry, the file is renamed once its size matches the size
+    announced by the server and its checksum, when the server
+    provides one, is verified.
+    :param transport: Transport, see get_transport
+    :param url: File URL
+    :param output_dir: Output directory
+    :param semaphore: asyncio.Semaphore limiting the concurrent
+                      transfers
+    :param max_retries: Maximum number of retries
+    :param backoff: Seconds to wait before the first retry, the wait
+                    is doubled on every retry
+    :param index: DownloadIndex where the file is recorded once
+                  downloaded
+    :return: Output file name full path, None if the download failed
+    """
+    fname = url.split("/")[-1]
+    output_fname = os.path.join(output_dir, fname)
+    partial_fname = f'{output_fname}.partial'
+    checksum = None
+
+    for attempt in range(max_retries + 1):
+        if attempt > 0:
+            wait = backoff * (2 ** (attempt - 1))
+            LOG.info(f"Retrying {fname} in {wait} seconds...")
+            await asyncio.sleep(wait)
+
+        offset = 0
+        if os.path.exists(partial_fname):
+            offset = os.path.getsize(partial_fname)
+
+        headers = {}
+        if offset > 0:
+            headers['Range'] = f'bytes={offset}-'
+
+        try:
+            async with semaphore, transport.get(url, headers) as \
+                    (status, _headers, content):
+
+                if status == 416:
+                    # Partial file is not valid, start from byte zero
+                    os.remove(partial_fname)
+                    msg = f"Range not satisfiable for {fname}"
+                    raise Exception(msg)
+
+                if status not in [200, 206]:
+                    msg = f"Can't download {fname}, HTTP status {status}"
+                    raise Exception(msg)
+
+                # Server ignored the range, start from byte zero
+                if status == 200:
+                    offset = 0
+                    checksum = get_checksum(_headers)
+
+                file_size = get_total_size(status, _headers)
+                LOG.debug(f"{fname} file size: {file_size}, "
+                          f"resuming from byte {offset}")
+
+                mode = 'ab' if offset > 0 else 'wb'
+                with open(partial_fname, mode) as fp:
+                    async for block in content:
+                        fp.write(block)
+
+            size = os.path.getsize(partial_fname)
+            if file_size is not None and size != file_size:
+                if size > file_size:
+                    os.remove(partial_fname)
+
+                msg = (f"File {fname} has {size} bytes, "
+                       f"{file_size} bytes expected")
+                raise Exception(msg)
+
+            if checksum is not None:
+                loop = asyncio.get_event_loop()
+                _checksum = await loop.run_in_executor(None, md5sum,
+                                                       partial_fname)
+                if _checksum != checksum:
+                    os.remove(partial_fname)
+                    msg = f"File {fname} checksum does not match"
+                    raise Exception(msg)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            LOG.warning(f"Download of {fname} failed: {e}")
+            continue
+
+        # Rename to definitive filename
+        os.replace(partial_fname, output_fname)
+        if index is not None:
+            index.add(fname, size, checksum)
+        LOG.info(f"Done with {output_fname}")
+
+        return output_fname
+
+    LOG.error(f"Can't download {fname} after {max_retries} retries")
+
+    return None
+
+async def _download_files(urls, output_dir, transport, max_retries,
+                           backoff, index, progressBar):
+    """
+    Downloads all files on the current event loop
+    """
+    semaphore = asyncio.Semaphore(transport.n_connections)
+    output_fnames = [None] * len(urls)
+
+    async def __download(i, url):
+        output_fnames[i] = await download_file(transport, url,
+                output_dir, semaphore, max_retries, backoff, index)
+
+        return output_fnames[i]
+
+    async with transport:
+        tasks = [__download(i, url) for i, url in enumerate(urls)]
+
+        for n_done, task in enumerate(asyncio.as_completed(tasks)):
+            await task
+            if progressBar is not None:
+                progressBar.setValue(((n_done + 1) / len(urls)) * 100.0)
+
+    return output_fnames
+
+def download_files(urls, output_dir, username=None, password=None,
+                   n_connections=5, max_retries=5, backoff=1.0,
+                   transport=None, index=None, progressBar=None):
+    """
+    Downloads a list of files concurrently, see download_file
+    :param urls: List of file URLs
+    :param output_dir: Output directory
+    :param username: Username, e.g. EarthData login
+    :param password: Password
+    :param n_connections: Maximum number of concurrent connections
+    :param max_retries: Maximum number of retries of every file
+    :param backoff: Seconds to wait before the first retry, the wait
+                    is doubled on every retry
+    :param transport: Transport, default is get_transport
+    :param index: DownloadIndex where the files are recorded once
+                  downloaded
+    :param progressBar: Progress bar object
+    :return: List with the output file name of every URL, None for
+             the files that could not be downloaded
+    """
+    if transport is None:
+        transport = get_transport(n_connections, username, password)
+
+    coroutine = _download_files(urls, output_dir, transport,
+                                max_retries, backoff, index,
+                                progressBar)
+
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    # Called from a running event loop, e.g. a Jupyter notebook
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
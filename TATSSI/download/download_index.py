@@ -0,0 +1,245 @@
+
+"""
+Local index of the files downloaded into a directory.
+
+Every completed download is appended to a JSON lines file in the
+output directory with its name, size and checksum when the server
+provides one, so that checking whether a file needs to be downloaded
+is a dictionary lookup and a stat instead of listing the directory.
+"""
+
+import os
+import json
+import base64
+import hashlib
+from concurrent import futures
+
+import gdal
+
+import logging
+LOG = logging.getLogger(__name__)
+
+# Index file name, stored in the output directory
+INDEX_FNAME = '.download_index.jsonl'
+
+# GDAL drivers of the downloaded products
+DRIVERS = {'.hdf' : 'HDF4', '.h5' : 'HDF5', '.he5' : 'HDF5',
+           '.nc' : 'netCDF', '.tif' : 'GTiff'}
+
+def get_checksum(headers):
+    """
+    MD5 checksum provided by the server in the Content-MD5 or Digest
+    headers of a full (200) response
+    :param headers: Response headers
+    :return: Hexadecimal MD5 checksum, None if not provided
+    """
+    value = headers.get('Content-MD5')
+
+    if value is None:
+        for digest in headers.get('Digest', '').split(','):
+            algorithm, _, _value = digest.strip().partition('=')
+            if algorithm.lower() == 'md5':
+                value = _value
+                break
+
+    if value is None or len(value) == 0:
+        return None
+
+    if len(value) == 32:
+        # Already hexadecimal
+        return value.lower()
+
+    try:
+        return base64.b64decode(value).hex()
+    except ValueError:
+        LOG.warning(f"MD5 checksum {value} is not valid")
+        return None
+
+def md5sum(fname, block_size=1048576):
+    """
+    Hexadecimal MD5 checksum of a file
+    """
+    md5 = hashlib.md5()
+
+    with open(fname, 'rb') as fp:
+        for block in iter(lambda: fp.read(block_size), b''):
+            md5.update(block)
+
+    return md5.hexdigest()
+
+def has_driver(fname):
+    """
+    The GDAL driver of a file extension is available, e.g. GDAL can be
+    built without HDF4 support
+    :param fname: File name
+    :return: True if the driver is available or the extension is not
+             known
+    """
+    extension = os.path.splitext(fname)[1].lower()
+    if extension not in DRIVERS:
+        return True
+
+    return gdal.GetDriverByName(DRIVERS[extension]) is not None
+
+def can_open(fname):
+    """
+    Sanity check of a downloaded file, the file has to be opened by
+    GDAL, e.g. truncated HDF files can't be opened
+    :param fname: File name full path
+    :return: True if the file can be opened
+    """
+    try:
+        d = gdal.Open(fname)
+    except Exception:
+        d = None
+
+    if d is None:
+        return False
+
+    d = None
+    return True
+
+class DownloadIndex():
+    """
+    Index of the files downloaded into a directory, entries are
+    appended to output_dir/.download_index.jsonl when a download
+    completes, see add
+    """
+    def __init__(self, output_dir):
+        """
+        :param output_dir: Directory with the downloaded files
+        """
+        self.output_dir = output_dir
+        self.fname = os.path.join(output_dir, INDEX_FNAME)
+        self.entries = {}
+
+        self.__load()
+
+    def __load(self):
+        if os.path.exists(self.fname) is False:
+            return
+
+        with open(self.fname) as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line of an interrupted run
+                    continue
+
+                if entry.get('size') is None:
+                    self.entries.pop(entry['name'], None)
+                else:
+                    self.entries[entry['name']] = entry
+
+    def __append(self, entry):
+        with open(self.fname, 'a') as fp:
+            fp.write(json.dumps(entry) + '\n')
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def add(self, name, size, checksum=None):
+        """
+        Records a completed download
+        :param name: File name
+        :param size: File size in bytes
+        :param checksum: Hexadecimal MD5 checksum, None if the server
+                         does not provide one
+        """
+        entry = {'name' : name, 'size' : size, 'md5' : checksum}
+        self.entries[name] = entry
+        self.__append(entry)
+
+    def remove(self, name):
+        """
+        Removes a file from the index
+        :param name: File name
+        """
+        if self.entries.pop(name, None) is not None:
+            self.__append({'name' : name, 'size' : None})
+
+    def is_valid(self, name):
+        """
+        The file is in the index and its size on disk is the one
+        recorded when it was downloaded
+        :param name: File name
+        """
+        entry = self.entries.get(name)
+        if entry is None:
+            return False
+
+        try:
+            size = os.path.getsize(os.path.join(self.output_dir, name))
+        except OSError:
+            return False
+
+        return size == entry['size']
+
+    def check(self, names, verify=False, n_threads=5):
+        """
+        Checks files on disk, files in the index with the recorded
+        size are valid, files in the index with a different size are
+        not, other files are opened with GDAL in parallel and added to
+        the index if they can be opened, e.g. files downloaded before
+        the index existed. Files are not opened if the GDAL driver is
+        not available. Invalid files are renamed to <name>.invalid
+        and removed from the index, hence they are downloaded again.
+        :param names: List of file names
+        :param verify: If True every file is opened with GDAL and its
+                       checksum, if available, is verified
+        :param n_threads: Number of files checked concurrently
+        :return: Set of the valid file names
+        """
+        valid, to_check = set(), []
+
+        for name in names:
+            if verify is False and self.is_valid(name):
+                valid.add(name)
+            elif os.path.exists(os.path.join(self.output_dir, name)):
+                to_check.append(name)
+
+        if len(to_check) == 0:
+            return valid
+
+        LOG.info(f"Checking {len(to_check)} files in {self.output_dir}")
+
+        no_driver = set([os.path.splitext(name)[1].lower()
+                for name in to_check if has_driver(name) is False])
+        for extension in no_driver:
+            LOG.warning(f"GDAL driver {DRIVERS[extension]} not available, "
+                        f"{extension} files won't be opened")
+
+        def __check(name):
+            fname = os.path.join(self.output_dir, name)
+
+            # Truncated or overwritten since it was downloaded
+            entry = self.entries.get(name)
+            if entry is not None and \
+                    os.path.getsize(fname) != entry['size']:
+                return False
+
+            if os.path.splitext(name)[1].lower() not in no_driver and \
+                    can_open(fname) is False:
+                return False
+
+            if verify is True and entry is not None and \
+                    entry['md5'] is not None:
+                return md5sum(fname) == entry['md5']
+
+            return True
+
+        with futures.ThreadPoolExecutor(max_workers=n_threads) as executor:
+            for name, ok in zip(to_check, executor.map(__check, to_check)):
+                fname = os.path.join(self.output_dir, name)
+                if ok is True:
+                    if name not in self:
+                        self.add(name, os.path.getsize(fname))
+                    valid.add(name)
+                else:
+                    LOG.warning(f"File {fname} is not valid, "
+                                f"renamed to {fname}.invalid")
+                    os.replace(fname, f'{fname}.invalid')
+                    self.remove(name)
+
+        return valid
@@ -19,6 +19,9 @@ from pathlib import Path
 import requests
 from concurrent import futures
 
+from .async_downloader import download_files
+from .download_index import DownloadIndex
+
 import logging
 logging.basicConfig(level=logging.INFO)
 
@@ -141,47 +144,27 @@ def download_tile_list(url, tiles):
                 grab.append(url + "/" + fname)
     return grab
 
-def download_tiles(url, session, username, password, output_dir):
-
-    r1 = session.request('get', url)
-    r = session.get(r1.url, stream=True)
-    fname = url.split("/")[-1]
-    LOG.debug("Getting %s from %s(-> %s)" % (fname, url, r1.url))
-
-    if not r.ok:
-        # raise IOError(f"Can't start download... {fname}")
-        print(f"Can't start download... {fname}. Try download again.")
-        return
-
-    file_size = int(r.headers['content-length'])
-    LOG.debug("\t%s file size: %d" % (fname, file_size))
-    output_fname = os.path.join(output_dir, fname)
-
-    # Save with temporary filename...
-    with open(output_fname+".partial", 'wb') as fp:
-        for block in r.iter_content(65536):
-            fp.write(block)
-
-    # Rename to definitive filename
-    os.rename(output_fname+".partial", output_fname)
-    LOG.info("Done with %s" % output_fname)
-    return output_fname
-
-def required_files (url_list, output_dir):
+def required_files (url_list, output_dir, index=None, verify=False):
     """
-    Checks for files that are already available in the system.
+    Checks for files that are already available in the system. Files
+    recorded in the download index with the same size on disk are
+    kept, any other file already on disk is kept only if GDAL can
+    open it.
+    :param url_list: List of URLs
+    :param output_dir: Output directory
+    :param index: DownloadIndex of output_dir
+    :param verify: If True all the files on disk are opened with GDAL
+                   and their checksums verified
+    :return: List of URLs to download
     """
-    
-    all_files_present = os.listdir (output_dir)
-    hdf_files_present = [fich 
-                        for fich in all_files_present if fich.endswith(".hdf")]
-    hdf_files_present = set(hdf_files_present)
-    
-    flist= [url.split("/")[-1] for url in url_list]
-    file_list = dict(zip(flist, url_list))
-    flist = set(flist)
-    files_to_download = list(flist.difference(hdf_files_present))
-    to_download = [ file_list[k] for k in files_to_download]
+    if index is None:
+        index = DownloadIndex(output_dir)
+
+    flist = [url.split("/")[-1] for url in url_list]
+    files_present = index.check(flist, verify=verify)
+
+    to_download = [url for fich, url in zip(flist, url_list)
+                   if fich not in files_present]
 
     return to_download
     
@@ -266,7 +249,8 @@ def get_modis_data(platform, product, tiles,
     gr.sort()
 
     # Check whether we have some files available already
-    gr_to_dload = required_files(gr, output_dir)
+    index = DownloadIndex(output_dir)
+    gr_to_dload = required_files(gr, output_dir, index)
     gr = gr_to_dload
   
     msg = f"Will download {len(gr)} files..."
@@ -277,21 +261,11 @@ def get_modis_data(platform, product, tiles,
     # Wait for a few seconds before downloading the data
     time.sleep(5)
 
-    # The main download loop. This will get all the URLs with the filenames,
-    # and start downloading them in parallel.
-    dload_files = []
-    with requests.Session() as s:
-        s.auth = (username, password)
-        download_tile_patch = partial(download_tiles,
-                session=s,
-                output_dir=output_dir,
-                username=username,
-                password=password )
-        
-        with futures.ThreadPoolExecutor(max_workers=n_threads) as executor:
-            for i, fich in enumerate(executor.map(download_tile_patch, gr)):
-                dload_files.append(fich)
-                if progressBar is not None:
-                    progressBar.setValue((len(dload_files) / len(gr)) * 100.0)
-        
+    # The main download loop. All the URLs are downloaded concurrently
+    # with a bounded pool of connections, interrupted downloads are
+    # resumed from their .partial files.
+    dload_files = download_files(gr, output_dir, username=username,
+            password=password, n_connections=n_threads, index=index,
+            progressBar=progressBar)
+
     return dload_files
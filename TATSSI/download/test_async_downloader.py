@@ -0,0 +1,129 @@
+import os
+import re
+import base64
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+import pytest
+
+from TATSSI.download import async_downloader
+from TATSSI.download.async_downloader import download_files, \
+        _AiohttpTransport, _RequestsTransport
+
+DATA = bytes(range(256)) * 4096
+USERNAME, PASSWORD = 'user', 'password'
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Serves DATA at /data/<name> with Range support, the first full
+    transfer is dropped halfway. /redirect/<name> redirects to
+    /data/<name> on localhost, a different host than 127.0.0.1
+    """
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+
+        if self.path.startswith('/redirect/'):
+            name = self.path.split('/')[-1]
+            self.send_response(302)
+            self.send_header('Location', f'http://localhost:'
+                    f'{self.server.server_port}/data/{name}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        match = re.match(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        if match is not None:
+            offset = int(match.group(1))
+            self.send_response(206)
+            self.send_header('Content-Range',
+                    f'bytes {offset}-{len(DATA) - 1}/{len(DATA)}')
+        else:
+            offset = 0
+            self.send_response(200)
+
+        self.send_header('Content-Length', str(len(DATA) - offset))
+        self.end_headers()
+
+        if offset == 0 and self.server.dropped is False:
+            # Connection closed mid-transfer
+            self.server.dropped = True
+            self.wfile.write(DATA[:len(DATA) // 2])
+            return
+
+        self.wfile.write(DATA[offset:])
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    _server = _Server(('127.0.0.1', 0), _Handler)
+    _server.requests = []
+    _server.dropped = False
+
+    thread = threading.Thread(target=_server.serve_forever, daemon=True)
+    thread.start()
+
+    yield _server
+
+    _server.shutdown()
+    _server.server_close()
+
+transports = [
+    pytest.param(_AiohttpTransport, marks=pytest.mark.skipif(
+        async_downloader.aiohttp is None, reason='aiohttp not installed')),
+    _RequestsTransport]
+
+def get_authorization(requests, path):
+    return [headers.get('Authorization')
+            for _path, headers in requests if _path == path]
+
+@pytest.mark.parametrize('transport', transports)
+def test_resume_dropped_transfer(server, transport, tmpdir):
+    url = f'http://127.0.0.1:{server.server_port}/data/file.hdf'
+
+    output_fnames = download_files([url], str(tmpdir), backoff=0.0,
+            transport=transport(2, None, None, 65536, 10))
+
+    assert output_fnames == [os.path.join(str(tmpdir), 'file.hdf')]
+    with open(output_fnames[0], 'rb') as fp:
+        assert fp.read() == DATA
+
+    ranges = [headers.get('Range') for path, headers in server.requests]
+    assert ranges[0] is None
+    assert ranges[-1] == f'bytes={len(DATA) // 2}-'
+    assert not os.path.exists(f'{output_fnames[0]}.partial')
+
+@pytest.mark.parametrize('transport', transports)
+@pytest.mark.parametrize('auth_host', ['localhost', 'auth.example.com'])
+def test_credentials_on_redirect(server, transport, auth_host,
+                                 monkeypatch, tmpdir):
+    monkeypatch.setattr(async_downloader, 'AUTH_HOST', auth_host)
+    url = f'http://127.0.0.1:{server.server_port}/redirect/file.hdf'
+
+    output_fnames = download_files([url], str(tmpdir), backoff=0.0,
+            transport=transport(2, USERNAME, PASSWORD, 65536, 10))
+
+    with open(output_fnames[0], 'rb') as fp:
+        assert fp.read() == DATA
+
+    credentials = base64.b64encode(
+            f'{USERNAME}:{PASSWORD}'.encode()).decode()
+    authorization = f'Basic {credentials}'
+
+    assert set(get_authorization(server.requests,
+            '/redirect/file.hdf')) == {authorization}
+
+    # Credentials are only sent to a different host if it is the
+    # EarthData login host
+    if auth_host == 'localhost':
+        expected = {authorization}
+    else:
+        expected = {None}
+
+    assert set(get_authorization(server.requests,
+            '/data/file.hdf')) == expected
@@ -0,0 +1,271 @@
+
+import os
+import json
+import time
+import shutil
+import hashlib
+from pathlib import Path
+
+import logging
+LOG = logging.getLogger(__name__)
+
+class ResultCache():
+    """
+    Content-addressed cache for the outputs of the TATSSI processing
+    stages, e.g. smoothing, interpolation, climatology or QA analytics.
+    Every output is stored under a key computed from the identity
+    (path, size and modification time) of the input files, the stage
+    name and the stage parameters, hence a change in any of them
+    produces a different key. The cache is kept below a maximum size
+    evicting the least recently used entries.
+    """
+    # Cache index file name
+    INDEX = 'index.json'
+
+    def __init__(self, cache_dir=None, max_size=10 * 1024**3):
+        """
+        :param cache_dir: Cache directory, default is $HOME/.TATSSI/cache
+        :param max_size: Maximum size of the cache in bytes
+        """
+        if cache_dir is None:
+            homedir = os.path.expanduser("~")
+            cache_dir = os.path.join(homedir, '.TATSSI', 'cache')
+
+        # Create cache dir
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    @staticmethod
+    def get_size(fname):
+        """
+        Size in bytes of a file or of all files in a directory, e.g. a
+        Zarr store
+        :param fname: File or directory name full path
+        """
+        if os.path.isdir(fname) is False:
+            return os.path.getsize(fname)
+
+        size = 0
+        for root, dirs, files in os.walk(fname):
+            size += sum([os.path.getsize(os.path.join(root, _fname))
+                         for _fname in files])
+
+        return size
+
+    @staticmethod
+    def copy(src, dst):
+        """
+        Copies a file or a directory, e.g. a Zarr store, an existing
+        destination is replaced
+        :param src: Source file or directory name full path
+        :param dst: Destination file or directory name full path
+        """
+        if os.path.isdir(src) is False:
+            shutil.copyfile(src, dst)
+            return
+
+        if os.path.isdir(dst):
+            shutil.rmtree(dst)
+        elif os.path.exists(dst):
+            os.remove(dst)
+
+        shutil.copytree(src, dst)
+
+    @staticmethod
+    def get_file_identity(fname):
+        """
+        Get the identity of a file as its absolute path, size in bytes
+        and modification time in nanoseconds
+        :param fname: File name full path
+        :return: List with path, size and modification time
+        """
+        if os.path.exists(fname) is False:
+            msg = f"File {fname} does not exist"
+            raise Exception(msg)
+
+        stat = os.stat(fname)
+
+        return [os.path.abspath(fname), stat.st_size, stat.st_mtime_ns]
+
+    def get_key(self, stage, input_fnames, parameters=None):
+        """
+        Computes the cache key of a stage output
+        :param stage: Stage name, e.g. 'smoothing'
+        :param input_fnames: List of input file names full path
+        :param parameters: Dictionary with the stage parameters,
+                           e.g. {'method' : 'smoothn', 's' : 0.75}
+        :return: Key as a SHA-256 hexadecimal string
+        """
+        if parameters is None:
+            parameters = {}
+
+        identity = {'stage' : stage,
+                    'inputs' : [self.get_file_identity(fname)
+                                for fname in input_fnames],
+                    'parameters' : parameters}
+
+        identity = json.dumps(identity, sort_keys=True, default=str)
+
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+    def get(self, key, output_fname=None):
+        """
+        Gets a cached stage output
+        :param key: Cache key from get_key
+        :param output_fname: If set the cached output is copied to
+                             this file or directory name full path
+        :return: File name of the cached output, output_fname if set,
+                 None if key is not in the cache
+        """
+        index = self.__read_index()
+
+        if key not in index:
+            return None
+
+        cached_fname = os.path.join(self.cache_dir, key,
+                                    index[key]['fname'])
+
+        if os.path.exists(cached_fname) is False:
+            # Entry removed outside the cache
+            self.invalidate(key=key)
+            return None
+
+        # Update last access
+        index[key]['last_access'] = time.time()
+        self.__write_index(index)
+
+        LOG.info(f"Using cached {index[key]['stage']} output {key}")
+
+        if output_fname is None:
+            return cached_fname
+
+        self.copy(cached_fname, output_fname)
+
+        return output_fname
+
+    def put(self, key, fname, stage=None):
+        """
+        Stores a stage output in the cache
+        :param key: Cache key from get_key
+        :param fname: Stage output file name full path, or directory
+                      name of an array store, e.g. a Zarr store
+        :param stage: Stage name
+        :return: File name of the cached output, None if the output
+                 is larger than the maximum size of the cache
+        """
+        size = self.get_size(fname)
+
+        if size > self.max_size:
+            LOG.info(f"File {fname} is larger than the cache maximum size")
+            return None
+
+        cached_dir = os.path.join(self.cache_dir, key)
+        Path(cached_dir).mkdir(parents=True, exist_ok=True)
+
+        cached_fname = os.path.join(cached_dir, os.path.basename(fname))
+        self.copy(fname, cached_fname)
+
+        index = self.__read_index()
+        index[key] = {'stage' : stage,
+                      'fname' : os.path.basename(fname),
+                      'size' : size,
+                      'last_access' : time.time()}
+
+        self.__evict(index, keep=key)
+        self.__write_index(index)
+
+        return cached_fname
+
+    def invalidate(self, key=None, stage=None):
+        """
+        Removes entries from the cache. If key and stage are not set
+        all entries are removed
+        :param key: Cache key to remove
+        :param stage: Remove all entries of this stage
+        :return: Number of entries removed
+        """
+        index = self.__read_index()
+
+        keys = []
+        for _key, entry in index.items():
+            if key is not None and _key != key:
+                continue
+            if stage is not None and entry['stage'] != stage:
+                continue
+            keys.append(_key)
+
+        for _key in keys:
+            self.__remove(index, _key)
+
+        self.__write_index(index)
+
+        return len(keys)
+
+    def size(self):
+        """
+        Total size in bytes of the cached outputs
+        """
+        index = self.__read_index()
+
+        return sum([entry['size'] for entry in index.values()])
+
+    def __evict(self, index, keep=None):
+        """
+        Removes the least recently used entries until the total size
+        of the cache is below the maximum size
+        """
+        total_size = sum([entry['size'] for entry in index.values()])
+
+        # Least recently used first
+        keys = sorted(index, key=lambda _key: index[_key]['last_access'])
+
+        for _key in keys:
+            if total_size <= self.max_size:
+                break
+            if _key == keep:
+                continue
+
+            total_size -= index[_key]['size']
+            self.__remove(index, _key)
+            LOG.info(f"Cached output {_key} evicted")
+
+    def __remove(self, index, key):
+        """
+        Removes a single entry from the index and from disk
+        """
+        shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+        index.pop(key, None)
+
+    def __read_index(self):
+        """
+        Reads the cache index
+        """
+        fname = os.path.join(self.cache_dir, self.INDEX)
+
+        if os.path.exists(fname) is False:
+            return {}
+
+        try:
+            with open(fname, 'r') as f:
+                index = json.load(f)
+        except ValueError:
+            # Corrupted index, start from scratch
+            LOG.info(f"Cache index {fname} is not valid, resetting cache")
+            index = {}
+
+        return index
+
+    def __write_index(self, index):
+        """
+        Writes the cache index, a temporary file is used so that
+        the index is always valid
+        """
+        fname = os.path.join(self.cache_dir, self.INDEX)
+        tmp_fname = f'{fname}.{os.getpid()}.tmp'
+
+        with open(tmp_fname, 'w') as f:
+            json.dump(index, f)
+
+        os.replace(tmp_fname, fname)
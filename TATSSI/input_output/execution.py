@@ -0,0 +1,283 @@
+
+import os
+import json
+import functools
+import multiprocessing
+
+import dask
+from dask.utils import parse_bytes
+
+import logging
+LOG = logging.getLogger(__name__)
+
+# Valid schedulers
+#   synchronous - Single thread, useful for debugging
+#   threads - Local thread pool
+#   processes - Local process pool
+#   distributed - Local dask.distributed cluster, workers spill to
+#                 disk when they reach a fraction of the memory limit
+schedulers = ['synchronous', 'threads', 'processes', 'distributed']
+
+class ExecutionConfig():
+    """
+    Execution configuration used by all TATSSI compute paths, the
+    dask scheduler, number of workers, memory limit and spill to disk
+    directory are set once and honored by the smoothing,
+    interpolation, analysis and QA analytics outputs.
+    A configuration is active within a with block:
+        with ExecutionConfig(scheduler='distributed', n_workers=7,
+                             memory_limit='8GB'):
+            smoother.smooth()
+    otherwise the default configuration is used, see
+    get_execution_config. Blocks are reentrant, a cluster is only
+    started by the outermost block.
+    """
+    def __init__(self, scheduler='threads', n_workers=None,
+                 threads_per_worker=1, memory_limit='4GB',
+                 spill_dir=None):
+        """
+        :param scheduler: A valid scheduler, see schedulers
+        :param n_workers: Number of workers, default is the number of
+                          CPUs, it is also the number of blocks computed
+                          concurrently by the block writers
+        :param threads_per_worker: Number of threads per worker,
+                                   threads and distributed only
+        :param memory_limit: Memory limit per worker, e.g. '4GB', it
+                             also bounds the size of the blocks kept
+                             in memory waiting to be written
+        :param spill_dir: Directory for the data spilled to disk,
+                          default is the dask temporary directory
+        """
+        if scheduler not in schedulers:
+            msg = f"Scheduler {scheduler} is not valid"
+            raise Exception(msg)
+
+        if n_workers is None:
+            n_workers = os.cpu_count()
+
+        self.scheduler = scheduler
+        self.n_workers = max(1, int(n_workers))
+        self.threads_per_worker = max(1, int(threads_per_worker))
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir
+
+        self.__depth = 0
+        self.__dask_config = None
+        self.__pool = None
+        self.__cluster = None
+        self.__client = None
+
+    def __repr__(self):
+        return (f"ExecutionConfig(scheduler='{self.scheduler}', "
+                f"n_workers={self.n_workers}, "
+                f"threads_per_worker={self.threads_per_worker}, "
+                f"memory_limit='{self.memory_limit}', "
+                f"spill_dir={self.spill_dir!r})")
+
+    def to_dict(self):
+        """
+        Configuration as a dictionary, see from_dict
+        """
+        return {'scheduler' : self.scheduler,
+                'n_workers' : self.n_workers,
+                'threads_per_worker' : self.threads_per_worker,
+                'memory_limit' : self.memory_limit,
+                'spill_dir' : self.spill_dir}
+
+    @classmethod
+    def from_dict(cls, config):
+        """
+        Creates a configuration from a dictionary with any of the
+        ExecutionConfig parameters
+        """
+        return cls(**config)
+
+    @property
+    def memory_limit_bytes(self):
+        """
+        Memory limit in bytes, None if there is no limit
+        """
+        if self.memory_limit in [None, 0, 'auto']:
+            return None
+
+        return parse_bytes(self.memory_limit)
+
+    def max_blocks(self, block_nbytes):
+        """
+        Maximum number of blocks of block_nbytes that can be in
+        memory at the same time, computed or waiting to be written,
+        given the number of workers and the memory limit
+        :param block_nbytes: Size of a single block in bytes
+        :return: Number of blocks, at least 1
+        """
+        n_blocks = 2 * self.n_workers
+
+        memory_limit = self.memory_limit_bytes
+        if memory_limit is not None and block_nbytes > 0:
+            n_blocks = min(n_blocks,
+                    int(memory_limit * self.n_workers // block_nbytes))
+
+        return max(1, n_blocks)
+
+    @property
+    def is_active(self):
+        return self.__depth > 0
+
+    def __enter__(self):
+        if self.__depth == 0:
+            self.__start()
+
+        self.__depth += 1
+        _active_configs.append(self)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _active_configs.remove(self)
+        self.__depth -= 1
+
+        if self.__depth == 0:
+            self.__stop()
+
+    def __start(self):
+        """
+        Sets the dask configuration and starts the process pool or
+        local cluster
+        """
+        settings = {}
+        if self.spill_dir is not None:
+            settings['temporary-directory'] = self.spill_dir
+
+        if self.scheduler == 'threads':
+            settings['scheduler'] = 'threads'
+            settings['num_workers'] = \
+                    self.n_workers * self.threads_per_worker
+        elif self.scheduler == 'processes':
+            # Single pool for all the computations of the block
+            self.__pool = multiprocessing.Pool(self.n_workers)
+            settings['scheduler'] = 'processes'
+            settings['num_workers'] = self.n_workers
+            settings['pool'] = self.__pool
+        elif self.scheduler == 'synchronous':
+            settings['scheduler'] = 'synchronous'
+
+        elif self.scheduler == 'distributed':
+            from dask.distributed import Client, LocalCluster
+
+            self.__cluster = LocalCluster(n_workers=self.n_workers,
+                    threads_per_worker=self.threads_per_worker,
+                    memory_limit=self.memory_limit,
+                    local_directory=self.spill_dir)
+
+            # The client is set as the default scheduler
+            self.__client = Client(self.__cluster)
+
+        self.__dask_config = dask.config.set(settings)
+
+        LOG.info(f"Execution configuration {self} started")
+
+    def __stop(self):
+        """
+        Closes the client, cluster and process pool and restores the
+        dask configuration
+        """
+        if self.__client is not None:
+            self.__client.close()
+            self.__cluster.close()
+            self.__client, self.__cluster = None, None
+
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+
+        self.__dask_config.__exit__(None, None, None)
+        self.__dask_config = None
+
+# Configurations within a with block, the innermost one is in use
+_active_configs = []
+
+# Default configuration
+_default_config = None
+
+def read_execution_config(fname=None):
+    """
+    Reads an execution configuration from a JSON file with any of
+    the ExecutionConfig parameters, e.g.
+        {"scheduler" : "distributed", "n_workers" : 7,
+         "memory_limit" : "8GB"}
+    :param fname: File name full path, default is the
+                  TATSSI_EXECUTION_CONFIG environment variable or
+                  $HOME/.TATSSI/execution.json
+    :return: ExecutionConfig object, default parameters are used
+             if the file does not exist
+    """
+    if fname is None:
+        homedir = os.path.expanduser("~")
+        fname = os.environ.get('TATSSI_EXECUTION_CONFIG',
+                os.path.join(homedir, '.TATSSI', 'execution.json'))
+
+    if os.path.exists(fname) is False:
+        return ExecutionConfig()
+
+    with open(fname) as f:
+        config = json.load(f)
+
+    return ExecutionConfig.from_dict(config)
+
+def set_execution_config(config):
+    """
+    Sets the default execution configuration
+    :param config: ExecutionConfig object or dictionary with any of
+                   the ExecutionConfig parameters, None to read it
+                   again from file
+    """
+    global _default_config
+
+    if isinstance(config, dict):
+        config = ExecutionConfig.from_dict(config)
+
+    if _default_config is not None and _default_config.is_active:
+        msg = "Default execution configuration is in use"
+        raise Exception(msg)
+
+    _default_config = config
+
+def get_execution_config(**overrides):
+    """
+    Gets the execution configuration in use, the innermost active
+    one or the default configuration, see read_execution_config
+    :param overrides: ExecutionConfig parameters that override the
+                      ones of the configuration in use, parameters
+                      set to None are ignored
+    :return: ExecutionConfig object
+    """
+    global _default_config
+
+    if len(_active_configs) > 0:
+        config = _active_configs[-1]
+    else:
+        if _default_config is None:
+            _default_config = read_execution_config()
+        config = _default_config
+
+    overrides = {k : v for k, v in overrides.items()
+                 if v is not None and v != getattr(config, k)}
+    if len(overrides) > 0:
+        _config = config.to_dict()
+        _config.update(overrides)
+        config = ExecutionConfig.from_dict(_config)
+
+    return config
+
+def uses_execution_config(func):
+    """
+    Decorator for the compute paths, func runs within the execution
+    configuration in use
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with get_execution_config():
+            return func(*args, **kwargs)
+
+    return wrapper
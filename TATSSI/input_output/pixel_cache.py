@@ -0,0 +1,291 @@
+
+import os
+import json
+import shutil
+import hashlib
+from pathlib import Path
+from collections import OrderedDict
+
+import numpy as np
+
+from .cache import ResultCache
+from .execution import uses_execution_config
+
+import logging
+LOG = logging.getLogger(__name__)
+
+# The cache can be disabled with TATSSI_PIXEL_CACHE=0, pixels are
+# then read directly from the data, see set_pixel_cache
+_enabled = os.environ.get('TATSSI_PIXEL_CACHE', '1').lower() not in \
+        ['0', 'false', 'off', 'no']
+
+# Maximum size in bytes of the tiles on disk of all datasets
+_max_size = 4 * 1024**3
+
+def set_pixel_cache(enabled=True, max_size=None):
+    """
+    Enables or disables the pixel cache for the next calls to
+    get_pixel_cache and sets the maximum size of the tiles on disk
+    :param enabled: If False pixels are read directly from the data
+                    and no tiles are stored on disk
+    :param max_size: Maximum size in bytes of the tiles on disk of
+                     all datasets
+    """
+    global _enabled, _max_size
+
+    _enabled = enabled
+    if max_size is not None:
+        _max_size = max_size
+
+def get_data_identity(data):
+    """
+    Identity of the data selected from a file, name, shape and the
+    first and last coordinates, e.g. two time subsets of the same
+    layer stack with the same number of time steps are different
+    :param data: xarray DataArray with dimensions time, latitude
+                 and longitude
+    :return: Dictionary with the data identity
+    """
+    identity = {'data_var' : data.name, 'shape' : data.shape}
+
+    for dim in data.dims:
+        coords = data[dim].data
+        identity[dim] = [str(coords[0]), str(coords[-1])]
+
+    return identity
+
+class PixelDrillCache():
+    """
+    Time-major cache of the pixel time series of a (time, latitude,
+    longitude) DataArray, e.g. a layer stack backed by a VRT of
+    hundreds of COGs where extracting a single pixel reads a block
+    from every time step.
+    The first request in a tile reads the tile once and stores it on
+    disk transposed to (rows, cols, time), then the full time series
+    of any pixel of the tile is a single small contiguous read. The
+    most recently requested pixels are also kept in memory.
+    Tiles on disk of all datasets are kept below a maximum size
+    removing the least recently used ones.
+    """
+    def __init__(self, data, fname, cache_dir=None, tile_size=None,
+                 max_pixels=1024, max_size=None):
+        """
+        :param data: xarray DataArray with dimensions time, latitude
+                     and longitude
+        :param fname: File name full path of the data, its identity
+                      (path, size and modification time) is used to
+                      invalidate the cache when the file changes
+        :param cache_dir: Cache directory, default is
+                          $HOME/.TATSSI/pixel_cache
+        :param tile_size: Number of rows and columns of every tile,
+                          default is the spatial chunk size of data
+                          or 256 if data is not chunked
+        :param max_pixels: Maximum number of pixels kept in memory
+        :param max_size: Maximum size in bytes of the tiles on disk of
+                         all datasets in cache_dir, default is 4GB, see
+                         set_pixel_cache
+        """
+        if cache_dir is None:
+            homedir = os.path.expanduser("~")
+            cache_dir = os.path.join(homedir, '.TATSSI', 'pixel_cache')
+
+        if tile_size is None:
+            if data.chunks is not None:
+                tile_size = data.chunks[1][0]
+            else:
+                tile_size = 256
+
+        if max_size is None:
+            max_size = _max_size
+
+        self.data = data
+        self.tile_size = tile_size
+        self.max_pixels = max_pixels
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+        # Cache dir for this dataset, variable and subset
+        identity = get_data_identity(data)
+        identity['file'] = ResultCache.get_file_identity(fname)
+        identity['tile_size'] = tile_size
+
+        identity = json.dumps(identity, sort_keys=True, default=str)
+        key = hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+        self.tile_dir = os.path.join(cache_dir, key)
+        Path(self.tile_dir).mkdir(parents=True, exist_ok=True)
+
+        # Recently requested pixels, least recently used first
+        self.__pixels = OrderedDict()
+
+    def get(self, longitude, latitude):
+        """
+        Gets the time series of the pixel nearest to a location, same
+        as data.sel(longitude=longitude, latitude=latitude,
+        method='nearest').compute()
+        :param longitude: Longitude or x coordinate
+        :param latitude: Latitude or y coordinate
+        :return: xarray DataArray with dimension time
+        """
+        row = int(np.abs(self.data.latitude.data - latitude).argmin())
+        col = int(np.abs(self.data.longitude.data - longitude).argmin())
+
+        return self.get_pixel(row, col)
+
+    def get_pixel(self, row, col):
+        """
+        Gets the time series of a pixel
+        :param row: Row index
+        :param col: Column index
+        :return: xarray DataArray with dimension time
+        """
+        if (row, col) in self.__pixels:
+            self.__pixels.move_to_end((row, col))
+            series = self.__pixels[(row, col)]
+        else:
+            tile = self.__get_tile(row // self.tile_size,
+                                   col // self.tile_size)
+            series = np.array(tile[row % self.tile_size,
+                                   col % self.tile_size])
+
+            self.__pixels[(row, col)] = series
+            if len(self.__pixels) > self.max_pixels:
+                self.__pixels.popitem(last=False)
+
+        # Lazy selection, only the coordinates are used
+        return self.data[:, row, col].copy(data=series)
+
+    @uses_execution_config
+    def build(self, progressBar=None):
+        """
+        Stores all tiles on disk
+        :param progressBar: Progress bar object
+        """
+        layers, rows, cols = self.data.shape
+        tile_rows = range(int(np.ceil(rows / self.tile_size)))
+        tile_cols = range(int(np.ceil(cols / self.tile_size)))
+
+        for tile_row in tile_rows:
+            if progressBar is not None:
+                progressBar.setValue(max(1, (tile_row/len(tile_rows)) * 100.0))
+
+            for tile_col in tile_cols:
+                self.__get_tile(tile_row, tile_col)
+
+    def __get_tile(self, tile_row, tile_col):
+        """
+        Gets a time-major tile, the tile is read from the data and
+        stored on disk if it is not already in the cache
+        """
+        fname = os.path.join(self.tile_dir,
+                             f'tile_{tile_row:04d}_{tile_col:04d}.npy')
+
+        if os.path.exists(fname) is False:
+            start_row = tile_row * self.tile_size
+            start_col = tile_col * self.tile_size
+
+            _data = self.data[:, start_row:start_row + self.tile_size,
+                                 start_col:start_col + self.tile_size]
+            if _data.chunks is not None:
+                _data = _data.compute()
+
+            # Time as the fastest varying dimension
+            tile = np.ascontiguousarray(np.moveaxis(_data.data, 0, -1))
+
+            # Temporary file so that tiles on disk are always complete
+            Path(self.tile_dir).mkdir(parents=True, exist_ok=True)
+            tmp_fname = f'{fname[:-4]}.{os.getpid()}.tmp.npy'
+            np.save(tmp_fname, tile)
+            os.replace(tmp_fname, fname)
+
+            LOG.info(f"Pixel cache tile {tile_row}, {tile_col} saved")
+
+            self.__evict(keep=fname)
+        else:
+            # Last access, used to evict the least recently used tiles
+            os.utime(fname)
+
+        return np.load(fname, mmap_mode='r')
+
+    def __evict(self, keep=None):
+        """
+        Removes the least recently used tiles of all datasets until the
+        total size of the tiles on disk is below the maximum size,
+        directories left without tiles are removed
+        """
+        tiles = []
+        for tile_dir in os.scandir(self.cache_dir):
+            if not tile_dir.is_dir():
+                continue
+
+            for tile in os.scandir(tile_dir.path):
+                try:
+                    stat = tile.stat()
+                except OSError:
+                    # Removed by another process
+                    continue
+                tiles.append((stat.st_mtime, stat.st_size, tile.path))
+
+        total_size = sum([tile[1] for tile in tiles])
+
+        # Least recently used first
+        for mtime, size, fname in sorted(tiles):
+            if total_size <= self.max_size:
+                break
+            if fname == keep:
+                continue
+
+            try:
+                os.remove(fname)
+            except OSError:
+                continue
+            total_size -= size
+
+            tile_dir = os.path.dirname(fname)
+            if tile_dir != self.tile_dir and len(os.listdir(tile_dir)) == 0:
+                shutil.rmtree(tile_dir, ignore_errors=True)
+
+            LOG.info(f"Pixel cache tile {fname} evicted")
+
+class _PixelReader():
+    """
+    Reads the pixel time series directly from the data, used when the
+    pixel cache is disabled, see set_pixel_cache
+    """
+    def __init__(self, data):
+        self.data = data
+
+    def get(self, longitude, latitude):
+        return self.data.sel(longitude=longitude, latitude=latitude,
+                             method='nearest').compute()
+
+    def get_pixel(self, row, col):
+        return self.data[:, row, col].compute()
+
+# Pixel caches of the datasets in use
+_pixel_caches = {}
+
+def get_pixel_cache(data, fname, **kwargs):
+    """
+    Gets the pixel cache of a dataset, a single cache is kept for every
+    file, data variable and subset so that the in-memory pixels are
+    shared between the plots of a session
+    :param data: xarray DataArray with dimensions time, latitude
+                 and longitude
+    :param fname: File name full path of the data
+    :param kwargs: Other PixelDrillCache parameters
+    :return: PixelDrillCache object, or an object with the same get
+             and get_pixel methods reading directly from the data if
+             the cache is disabled, see set_pixel_cache
+    """
+    if _enabled is False:
+        return _PixelReader(data)
+
+    key = (json.dumps(ResultCache.get_file_identity(fname)),
+           json.dumps(get_data_identity(data), sort_keys=True, default=str),
+           kwargs.get('tile_size'))
+
+    if key not in _pixel_caches:
+        _pixel_caches[key] = PixelDrillCache(data, fname, **kwargs)
+
+    return _pixel_caches[key]
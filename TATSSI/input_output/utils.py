@@ -4,9 +4,13 @@ import gdal
 from osgeo import osr
 import numpy as np
 import xarray as xr
+import dask
+from collections import deque
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
 from osgeo import gdal_array
-from dask.distributed import Client
 from .helpers import Constants
+from .execution import get_execution_config
 """
 Utilities to handle data.
 """
@@ -15,6 +19,12 @@ import logging
 logging.basicConfig(level=logging.INFO)
 LOG = logging.getLogger(__name__)
 
+# Chunked array store formats, selected by the output file extension
+array_store_formats = {'.nc' : 'NetCDF', '.zarr' : 'Zarr'}
+
+# HDF5 is not thread safe, NetCDF4 stores are written one at a time
+_netcdf_lock = Lock()
+
 def get_geotransform_from_xarray(data):
     """
     Get the GeoTransform tuple from xarray latitude and longitude
@@ -32,6 +42,29 @@ def get_geotransform_from_xarray(data):
 
     return gt
 
+def get_gt_proj_from_xarray(data):
+    """
+    Get the GDAL like GeoTransform and the projection in WKT format
+    from the attributes of a xarray DataArray
+    :param data: xarray DataArray with transform and crs attributes
+    :return gt, proj: GeoTransform tuple and projection WKT string
+    """
+    # GeoTransform
+    gt = data.attrs['transform']
+
+    # For xarray 0.11.x or higher in order to make the
+    # GeoTransform GDAL like
+    gt = (gt[2], gt[0], gt[1], gt[5], gt[3], gt[4])
+
+    # Coordinate Reference System (CRS) in a PROJ4 string to a
+    # Spatial Reference System Well known Text (WKT)
+    crs = data.attrs['crs']
+    srs = osr.SpatialReference()
+    srs.ImportFromProj4(crs)
+    proj = srs.ExportToWkt()
+
+    return gt, proj
+
 def get_image_dimensions(fname):
     """
     Get dimensions in rows, columns and number of bands of an image
@@ -98,7 +131,8 @@ def get_user_dst_dataset(dst_img, cols, rows, layers,
     gdal.DontUseExceptions()
     return dst_ds
 
-def get_dst_dataset(dst_img, cols, rows, layers, dtype, proj, gt):
+def get_dst_dataset(dst_img, cols, rows, layers, dtype, proj, gt,
+                    nbits=None):
     """
     Create a GDAL data set in TATSSI default format
     Cloud Optimized GeoTIFF (COG)
@@ -109,6 +143,8 @@ def get_dst_dataset(dst_img, cols, rows, layers, dtype, proj, gt):
     :param dtype: GDAL type code
     :param proj: Projection information in WKT format
     :param gt: GeoTransform tupple
+    :param nbits: Number of bits per pixel of a GDT_Byte dataset,
+                  e.g. 1 for boolean data, values are bit-packed
     :return dst_ds: GDAL destination dataset object
     """
     gdal.UseExceptions()
@@ -121,6 +157,9 @@ def get_dst_dataset(dst_img, cols, rows, layers, dtype, proj, gt):
                           'TILED=YES',
                           'COPY_SRC_OVERVIEWS=YES']
 
+        if nbits is not None:
+            driver_options.append(f'NBITS={nbits}')
+
         # Create driver
         dst_ds = driver.Create(dst_img, cols, rows, layers,
                                dtype, driver_options)
@@ -272,106 +311,653 @@ def check_source_img(source_img):
 
     return 0
 
+def get_scaled_encoding(encoding):
+    """
+    Validates a scaled integer encoding, values are stored as
+    round((value - add_offset) / scale_factor) and decoded as
+    stored * scale_factor + add_offset. The fill value is the minimum
+    of int16 and the maximum of uint16, non-finite values are stored
+    as the fill value.
+    :param encoding: Dictionary with scale_factor and optionally
+                     add_offset, default 0.0, and dtype, 'int16'
+                     (default) or 'uint16'
+    :return: Dictionary with scale_factor, add_offset, dtype and
+             fill_value, None if encoding is None
+    """
+    if encoding is None:
+        return None
+
+    dtype = np.dtype(encoding.get('dtype', 'int16'))
+    if dtype not in [np.int16, np.uint16]:
+        msg = f"Data type {dtype} is not valid for a scaled encoding"
+        raise Exception(msg)
+
+    if 'scale_factor' not in encoding or encoding['scale_factor'] == 0:
+        msg = f"Encoding {encoding} does not have a valid scale_factor"
+        raise Exception(msg)
+
+    if dtype == np.int16:
+        fill_value = np.iinfo(dtype).min
+    else:
+        fill_value = np.iinfo(dtype).max
+
+    return {'scale_factor' : float(encoding['scale_factor']),
+            'add_offset' : float(encoding.get('add_offset', 0.0)),
+            'dtype' : dtype.name,
+            'fill_value' : int(fill_value)}
+
+def encode_scaled(data, scale_factor, add_offset=0.0, dtype='int16'):
+    """
+    Encodes a float array as scaled integers, see get_scaled_encoding,
+    values out of the range of dtype are clipped
+    :param data: NumPy array
+    :param scale_factor: Scale factor
+    :param add_offset: Offset
+    :param dtype: 'int16' or 'uint16'
+    :return: NumPy array of dtype
+    """
+    encoding = get_scaled_encoding({'scale_factor' : scale_factor,
+            'add_offset' : add_offset, 'dtype' : dtype})
+
+    _data = np.asarray(data, dtype=np.float64)
+    mask = ~np.isfinite(_data)
+
+    # The fill value is not used by valid data
+    info = np.iinfo(encoding['dtype'])
+    if encoding['fill_value'] == info.min:
+        _min, _max = info.min + 1, info.max
+    else:
+        _min, _max = info.min, info.max - 1
+
+    with np.errstate(invalid='ignore'):
+        _data = np.clip(np.round((_data - add_offset) / scale_factor),
+                        _min, _max)
+
+    _data[mask] = encoding['fill_value']
+
+    return _data.astype(encoding['dtype'])
+
+# Band metadata item set in files encoded by TATSSI, files from other
+# sources, e.g. MODIS HDF4 derived VRTs, can have a scale_factor with
+# a different convention, stored = value * scale_factor
+SCALED_ENCODING_METADATA = 'TATSSI_scaled'
+
+def set_scaled_band_metadata(dst_band, scale_factor, add_offset=0.0):
+    """
+    Sets the scaled integer encoding in the band metadata, see
+    get_scaled_encoding
+    :param dst_band: GDAL band
+    :param scale_factor: Scale factor
+    :param add_offset: Offset
+    """
+    dst_band.SetMetadataItem('scale_factor', str(scale_factor))
+    dst_band.SetMetadataItem('add_offset', str(add_offset))
+    dst_band.SetMetadataItem(SCALED_ENCODING_METADATA, 'true')
+
+def decode_scaled(data, scale_factor, add_offset=0.0, fill_value=None):
+    """
+    Decodes lazily scaled integers, see get_scaled_encoding
+    :param data: xarray DataArray with the stored integers
+    :param scale_factor: Scale factor
+    :param add_offset: Offset
+    :param fill_value: Stored fill value, decoded as NaN
+    :return: float32 xarray DataArray, with the data attributes and
+             NaN as fill value, the encoding is kept in the DataArray
+             encoding so that data can be saved again as it was read
+    """
+    attrs = dict(data.attrs)
+    encoding = {'scale_factor' : scale_factor, 'add_offset' : add_offset,
+                'dtype' : data.dtype.name}
+
+    if fill_value is not None:
+        data = data.where(data != fill_value)
+
+    _data = ((data * scale_factor) + add_offset).astype(np.float32)
+
+    attrs['nodatavals'] = tuple([np.nan] * data.shape[0])
+    _data.attrs = attrs
+    _data.encoding = encoding
+
+    return _data
+
 def save_dask_array(fname, data, data_var, method, tile_size=256,
-                   n_workers=1, threads_per_worker=1, memory_limit='4GB',
-                   dask=True, progressBar=None):
+                   n_workers=None, threads_per_worker=None,
+                   memory_limit=None, dask=True, compression=None,
+                   complevel=4, encoding=None, progressBar=None):
     """
     Saves to file an interpolated time series for a specific
-    data variable using a selected interpolation method
+    data variable using a selected interpolation method.
+    Data is processed in row strips aligned with the data chunks,
+    up to n_workers strips are computed concurrently while the
+    strips already computed are written in order.
+    Strips are computed with the execution configuration in use, see
+    TATSSI.input_output.execution, n_workers, threads_per_worker and
+    memory_limit override it for this call only.
+    If fname has a .nc or .zarr extension data is saved as a chunked
+    NetCDF4 or Zarr store instead, see save_array_store.
+    Boolean data is bit-packed, as a NBITS=1 GeoTIFF or with the Zarr
+    PackBits filter, NetCDF4 stores it as compressed bytes.
+    Float data can be stored as scaled integers, the scale_factor and
+    add_offset are saved in the band metadata, see
+    set_scaled_band_metadata, or as CF attributes,
+    and data is decoded on read by Analysis and Smoothing.
     :param fname: Full path of file where to save the data
     :param data: xarray Dataset/DataArray with the interpolated data
     :param data_var: String with the data variable name
     :param method: String with the interpolation method name
-    :tile size: Integer, number of lines to use as tile size
-    # TODO Document DASK variables
+    :param tile_size: Integer, number of lines to use as tile size
+                      when data is not chunked
+    :param n_workers: Number of workers, also the number of strips
+                      computed concurrently
+    :param threads_per_worker: Number of threads per worker
+    :param memory_limit: Memory limit per worker, e.g. '4GB', it also
+                         bounds the number of strips kept in memory
+    :param dask: If False strips are not computed, data must be
+                 already in memory
+    :param compression: Compression codec, NetCDF and Zarr only
+    :param complevel: Compression level, NetCDF and Zarr only
+    :param encoding: Scaled integer encoding, a dictionary with
+                     scale_factor and optionally add_offset and dtype,
+                     see get_scaled_encoding, e.g. {'scale_factor' :
+                     0.0001} for a vegetation index in [-1, 1]
+    :param progressBar: Progress bar object
     """
-    if dask == True:
-        pass
-        #client = Client(n_workers=n_workers,
-        #        threads_per_worker=threads_per_worker,
-        #        memory_limit=memory_limit)
+    config = get_execution_config(n_workers=n_workers,
+            threads_per_worker=threads_per_worker,
+            memory_limit=memory_limit)
 
-    # Get temp dataset extract the metadata
+    # Get the data variable
     if type(data) == xr.core.dataset.Dataset:
-        tmp_ds = getattr(data, data_var)
-    else:
-        # It should be a xr.core.dataarray.DataArray
-        tmp_ds = data
+        data = getattr(data, data_var)
 
-    # GeoTransform
-    gt = tmp_ds.attrs['transform']
+    with config:
+        _save_strips({fname : data}, data_var, tile_size, config, None,
+                     dask, compression, complevel, {fname : encoding},
+                     progressBar)
 
-    # For xarray 0.11.x or higher in order to make the
-    # GeoTransform GDAL like
-    gt = (gt[2], gt[0], gt[1], gt[5], gt[3], gt[4])
+def save_dask_arrays(data, data_var, tile_size=256, n_workers=None,
+                     threads_per_worker=None, memory_limit=None,
+                     scheduler=None, compression=None, complevel=4,
+                     encoding=None, progressBar=None):
+    """
+    Saves several products that share a dask graph, e.g. the outputs
+    of a single xr.apply_ufunc, computing every row strip only once
+    for all products, intermediate results shared by the products are
+    not computed again. Strips of the different products are written
+    concurrently, every file by a single thread. The output format of
+    every product is selected by its file extension, see
+    save_dask_array.
+    :param data: Dictionary with the output file names full path as
+                 keys and xarray DataArrays as values, the DataArrays
+                 must have the same rows and row chunks
+    :param data_var: String with the data variable name
+    :param tile_size: Integer, number of lines to use as tile size
+                      when data is not chunked
+    :param n_workers: Number of workers, also the number of strips
+                      computed concurrently
+    :param threads_per_worker: Number of threads per worker
+    :param memory_limit: Memory limit per worker
+    :param scheduler: dask scheduler used to compute the strips,
+                      default is the execution configuration in use,
+                      'synchronous' for kernels that are already
+                      parallel, strips are then computed one at a time
+    :param compression: Compression codec, NetCDF and Zarr only
+    :param complevel: Compression level, NetCDF and Zarr only
+    :param encoding: Dictionary with the output file names as keys
+                     and the scaled integer encoding of every product
+                     as values, see save_dask_array, products not in
+                     the dictionary are not encoded
+    :param progressBar: Progress bar object
+    """
+    config = get_execution_config(n_workers=n_workers,
+            threads_per_worker=threads_per_worker,
+            memory_limit=memory_limit)
 
-    # Coordinate Reference System (CRS) in a PROJ4 string to a
-    # Spatial Reference System Well known Text (WKT)
-    crs = tmp_ds.attrs['crs']
-    srs = osr.SpatialReference()
-    srs.ImportFromProj4(crs)
-    proj = srs.ExportToWkt()
+    if encoding is None:
+        encoding = {}
 
-    # Get GDAL datatype from NumPy datatype
+    with config:
+        _save_strips(data, data_var, tile_size, config, scheduler,
+                     True, compression, complevel, encoding, progressBar)
+
+def _get_dst_dataset_from_xarray(fname, data, data_var, encoding=None):
+    """
+    Creates the destination dataset of a DataArray and sets the band
+    metadata, fill value, date, data variable name and the scaled
+    integer encoding, see get_scaled_encoding
+    """
+    # GeoTransform and projection
+    gt, proj = get_gt_proj_from_xarray(data)
+
+    # Get GDAL datatype from NumPy datatype, booleans are bit-packed
     if data.dtype == 'bool':
-        dtype = gdal.GDT_Byte
+        dtype, nbits = gdal.GDT_Byte, 1
+    elif encoding is not None:
+        dtype = gdal_array.NumericTypeCodeToGDALTypeCode(
+                np.dtype(encoding['dtype']))
+        nbits = None
     else:
         dtype = gdal_array.NumericTypeCodeToGDALTypeCode(data.dtype)
+        nbits = None
 
     # Dimensions
     layers, rows, cols = data.shape
 
     # Create destination dataset
     dst_ds = get_dst_dataset(dst_img=fname, cols=cols, rows=rows,
-            layers=layers, dtype=dtype, proj=proj, gt=gt)
+            layers=layers, dtype=dtype, proj=proj, gt=gt, nbits=nbits)
+
+    # Band metadata
+    for layer in range(layers):
+        dst_band = dst_ds.GetRasterBand(layer + 1)
+
+        if data.dtype == 'bool':
+            # No fill value, data type for the readers
+            dst_band.SetMetadataItem('dtype', 'bool')
+        elif encoding is not None:
+            dst_band.SetMetadataItem('_FillValue',
+                    str(encoding['fill_value']))
+            set_scaled_band_metadata(dst_band, encoding['scale_factor'],
+                    encoding['add_offset'])
+        else:
+            # Fill value
+            dst_band.SetMetadataItem('_FillValue',
+                    str(data.nodatavals[layer]))
+        # Date
+        if 'time' in data.dims:
+            dst_band.SetMetadataItem('RANGEBEGINNINGDATE',
+                    data.time.data[layer].astype(str))
+        elif 'year' in data.dims:
+            dst_band.SetMetadataItem('RANGEBEGINNINGDATE',
+                    data.year.data[layer].astype(str))
+        else:
+            dst_band.SetMetadataItem('RANGEBEGINNINGDATE',
+                    data.dayofyear.data[layer].astype(str))
 
-    block = tile_size
-    for start_row in range(0, rows, block):
-        if progressBar is not None:
-            _progressBar_val = (start_row/rows) * 100.0
-            if _progressBar_val == 0:
-                progressBar.setValue(1)
-            else:
-                progressBar.setValue(_progressBar_val)
+        # Data variable name
+        dst_band.SetMetadataItem('data_var', data_var)
+
+    return dst_ds
+
+class _RasterWriter():
+    """
+    Writes row strips of a DataArray into a GeoTIFF file
+    """
+    def __init__(self, fname, data, data_var, encoding=None):
+        self.fname = fname
+        self.dst_ds = _get_dst_dataset_from_xarray(fname, data, data_var,
+                                                   encoding)
+
+    def write(self, _data, start_row):
+        if _data.dtype == 'bool':
+            _data = _data.astype(np.uint8)
 
-        if start_row + block > rows:
-            end_row = rows
+        for layer in range(_data.shape[0]):
+            self.dst_ds.GetRasterBand(layer + 1).WriteArray(
+                    _data[layer], xoff=0, yoff=start_row)
+
+    def close(self):
+        # Flush to disk
+        self.dst_ds = None
+
+class _ArrayStoreWriter():
+    """
+    Writes row strips of a DataArray into a NetCDF4 or Zarr store.
+    Coordinates, CRS and attributes are written by xarray, the data
+    variable is created with the store chunks and written by strips
+    """
+    def __init__(self, fname, data, data_var, tile_size, compression,
+                 complevel, encoding=None):
+        name, extension = os.path.splitext(fname.rstrip(os.sep))
+        extension = extension.lower()
+
+        if extension not in array_store_formats:
+            msg = f"File {fname} is not a NetCDF or Zarr store"
+            raise Exception(msg)
+
+        self.fname = fname
+        self.extension = extension
+
+        # GeoTransform and projection
+        gt, proj = get_gt_proj_from_xarray(data)
+
+        # Chunks with the full time series of a block of pixels,
+        # rows are the ones of the strips
+        layers, rows, cols = data.shape
+        if data.chunks is not None:
+            chunks = (layers, data.chunks[1][0], data.chunks[2][0])
         else:
-            end_row = start_row + block
+            chunks = (layers, min(tile_size, rows), min(tile_size, cols))
 
-        _data = data[:, start_row:end_row + 1, :]
-        if dask == True:
-            _data = _data.compute()
+        # Attributes as NetCDF and JSON compatible types
+        attrs = {}
+        for key, value in data.attrs.items():
+            if key == 'nodatavals' or value is None:
+                continue
+            if isinstance(value, (tuple, list, np.ndarray)):
+                value = [float(v) for v in value]
+            attrs[key] = value
 
-        for layer in range(layers):
-            dst_band = dst_ds.GetRasterBand(layer + 1)
+        attrs['data_var'] = data_var
+        attrs['grid_mapping'] = 'spatial_ref'
 
-            # Fill value
-            dst_band.SetMetadataItem('_FillValue', str(tmp_ds.nodatavals[layer]))
-            # Date
-            if 'time' in tmp_ds.dims:
-                dst_band.SetMetadataItem('RANGEBEGINNINGDATE',
-                        tmp_ds.time.data[layer].astype(str))
-            elif 'year' in tmp_ds.dims:
-                dst_band.SetMetadataItem('RANGEBEGINNINGDATE',
-                        tmp_ds.year.data[layer].astype(str))
+        # Fill value
+        fill_value = None
+        if data.dtype != 'bool' and 'nodatavals' in data.attrs:
+            _fill_value = data.nodatavals[0]
+            if np.isfinite(_fill_value) or data.dtype.kind == 'f':
+                fill_value = data.dtype.type(_fill_value)
+
+        # Scaled integers, as CF packed data
+        dtype = data.dtype
+        if encoding is not None:
+            dtype = np.dtype(encoding['dtype'])
+            fill_value = dtype.type(encoding['fill_value'])
+            attrs['scale_factor'] = encoding['scale_factor']
+            attrs['add_offset'] = encoding['add_offset']
+
+        # Coordinates and grid mapping, as written by GDAL
+        coords = xr.Dataset(coords={dim : data[dim] for dim in data.dims})
+        coords['spatial_ref'] = xr.DataArray(0, attrs={
+                'spatial_ref' : proj, 'crs_wkt' : proj,
+                'GeoTransform' : ' '.join([str(v) for v in gt])})
+
+        if extension == '.nc':
+            if compression not in [None, 'zlib', 'none']:
+                msg = f"Compression {compression} is not valid for NetCDF"
+                raise Exception(msg)
+
+            import netCDF4
+
+            # Temporary file, the output might be open by a reader
+            self.output_fname = f'{fname}.{os.getpid()}.tmp'
+            coords.to_netcdf(self.output_fname, mode='w', engine='netcdf4')
+
+            # Booleans are stored as bytes, as done by xarray
+            if dtype == 'bool':
+                dtype = np.dtype(np.int8)
+                attrs['dtype'] = 'bool'
+
+            self.store = netCDF4.Dataset(self.output_fname, 'a')
+            self.variable = self.store.createVariable(data_var, dtype,
+                    data.dims, zlib=compression != 'none',
+                    complevel=complevel, chunksizes=chunks,
+                    fill_value=fill_value)
+            self.variable.set_auto_maskandscale(False)
+            self.variable.setncatts(attrs)
+        else:
+            try:
+                import zarr
+                from numcodecs import Blosc, PackBits
+            except ImportError:
+                msg = "Zarr output requires the zarr package"
+                raise Exception(msg)
+
+            if compression == 'none':
+                compressor = None
             else:
-                dst_band.SetMetadataItem('RANGEBEGINNINGDATE',
-                        tmp_ds.dayofyear.data[layer].astype(str))
+                if compression is None:
+                    compression = 'zstd'
 
-            # Data variable name
-            dst_band.SetMetadataItem('data_var', data_var)
+                compressor = Blosc(cname=compression, clevel=complevel,
+                                   shuffle=Blosc.SHUFFLE)
 
-            # Data
-            dst_band.WriteArray(_data[layer].data,
-                    xoff=0, yoff=start_row)
+            # Booleans are bit-packed before compression
+            filters = None
+            if data.dtype == 'bool':
+                filters = [PackBits()]
 
-    dst_ds = None
+            self.output_fname = fname
+            coords.to_zarr(fname, mode='w')
+
+            self.store = zarr.open_group(fname, mode='a')
+            self.variable = self.store.create_dataset(data_var,
+                    shape=data.shape, chunks=chunks, dtype=dtype,
+                    compressor=compressor, filters=filters,
+                    fill_value=fill_value)
+
+            # Dimension names, as written by xarray
+            attrs['_ARRAY_DIMENSIONS'] = list(data.dims)
+            self.variable.attrs.update(attrs)
+
+    def write(self, _data, start_row):
+        end_row = start_row + _data.shape[1]
+        _data = _data.astype(self.variable.dtype)
+
+        if self.extension == '.nc':
+            with _netcdf_lock:
+                self.variable[:, start_row:end_row, :] = _data
+        else:
+            self.variable[:, start_row:end_row, :] = _data
+
+    def close(self):
+        if self.extension == '.nc':
+            self.store.close()
+            os.replace(self.output_fname, self.fname)
+        else:
+            # Metadata of coordinates and data variable in a single read
+            import zarr
+            zarr.consolidate_metadata(self.fname)
+
+        self.store, self.variable = None, None
+
+def _save_strips(data, data_var, tile_size, config, scheduler, compute,
+                 compression, complevel, encoding, progressBar):
+    """
+    Saves DataArrays in row strips, see save_dask_arrays. Strips are
+    aligned with the data chunks to read every block once, up to
+    config.n_workers strips are computed concurrently while the
+    strips already computed are handed, in order, to the writers.
+    """
+    fnames = list(data.keys())
+    arrays = list(data.values())
+
+    rows = arrays[0].shape[1]
+    row_chunks = set([_data.chunks[1] for _data in arrays
+                      if _data.chunks is not None])
+
+    if len(set([_data.shape[1] for _data in arrays])) > 1 or \
+            len(row_chunks) > 1:
+        msg = f"Products must have the same rows and row chunks"
+        raise Exception(msg)
+
+    # Row strips, aligned with the data chunks to read every block once
+    is_chunked = len(row_chunks) > 0
+    if is_chunked:
+        row_chunks = row_chunks.pop()
+    else:
+        row_chunks = [min(tile_size, rows - start_row)
+                      for start_row in range(0, rows, tile_size)]
+
+    strips = []
+    start_row = 0
+    for row_chunk in row_chunks:
+        strips.append((start_row, start_row + row_chunk))
+        start_row += row_chunk
+
+    # Scaled integer encoding of every product
+    encodings = [get_scaled_encoding(encoding.get(fname))
+                 for fname in fnames]
+
+    # Destination datasets
+    writers = []
+    for fname, _data, _encoding in zip(fnames, arrays, encodings):
+        if is_array_store(fname):
+            writers.append(_ArrayStoreWriter(fname, _data, data_var,
+                    tile_size, compression, complevel, _encoding))
+        else:
+            writers.append(_RasterWriter(fname, _data, data_var,
+                    _encoding))
+
+    def __compute_strip(start_row, end_row):
+        _strips = [_data[:, start_row:end_row, :] for _data in arrays]
+        if compute == True and is_chunked:
+            # Single graph, shared tasks are computed once
+            _strips = dask.compute(*_strips, scheduler=scheduler)
+
+        _strips = [_strip.data for _strip in _strips]
+
+        # Encoded by the compute threads
+        for i, _encoding in enumerate(encodings):
+            if _encoding is not None:
+                _strips[i] = encode_scaled(_strips[i],
+                        _encoding['scale_factor'],
+                        _encoding['add_offset'], _encoding['dtype'])
+
+        return _strips
+
+    def __write_strip(start_row, future):
+        _strips = future.result()
+
+        if progressBar is not None:
+            progressBar.setValue(max(1, (start_row/rows) * 100.0))
+
+        writes = [executor_writers.submit(writer.write, _strip, start_row)
+                  for writer, _strip in zip(writers, _strips)]
+
+        for write in writes:
+            write.result()
+
+    # Computed strips waiting to be written, bounded to limit memory
+    pending = deque()
+    strip_nbytes = sum([_data.shape[0] * max(row_chunks) * _data.shape[2]
+                        * _data.dtype.itemsize for _data in arrays])
+    max_pending = config.max_blocks(strip_nbytes)
+
+    if scheduler == 'synchronous':
+        n_threads = 1
+    else:
+        n_threads = min(config.n_workers, max_pending)
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor, \
+            ThreadPoolExecutor(max_workers=len(writers)) as executor_writers:
+        try:
+            for start_row, end_row in strips:
+                pending.append((start_row, executor.submit(
+                        __compute_strip, start_row, end_row)))
+
+                # Write the oldest strip while the next ones are computed
+                if len(pending) >= max_pending:
+                    __write_strip(*pending.popleft())
+
+            while len(pending) > 0:
+                __write_strip(*pending.popleft())
+        except Exception:
+            for start_row, future in pending:
+                future.cancel()
+            raise
+
+    for writer in writers:
+        writer.close()
+        LOG.info(f"File {writer.fname} saved")
+
+def is_boolean_raster(fname):
+    """
+    Checks if a GDAL compatible file holds a boolean product saved by
+    TATSSI, stored as a bit-packed NBITS=1 GeoTIFF
+    :param fname: File name full path
+    :return: True if the bands have the bool data type metadata
+    """
+    d = gdal.Open(fname)
+    md = d.GetRasterBand(1).GetMetadata()
+
+    return md.get('dtype') == 'bool'
+
+def is_array_store(fname):
+    """
+    Checks if a file is a chunked array store, see array_store_formats
+    :param fname: File name full path
+    :return: True if fname has a NetCDF or Zarr extension
+    """
+    name, extension = os.path.splitext(fname.rstrip(os.sep))
+
+    return extension.lower() in array_store_formats
+
+def save_array_store(fname, data, data_var, tile_size=256,
+                     compression=None, complevel=4, encoding=None,
+                     progressBar=None):
+    """
+    Saves a (time, latitude, longitude) DataArray as a chunked NetCDF4
+    or Zarr store. Chunks hold the full time series of a block of
+    pixels. The time, dayofyear or year coordinate, the CRS, the
+    GeoTransform and the fill value are preserved, the CRS is also
+    stored as a CF grid mapping so that GDAL can read the store.
+    Dask chunks are computed with the execution configuration in use.
+    :param fname: Full path of the .nc file or .zarr directory
+    :param data: xarray Dataset/DataArray
+    :param data_var: String with the data variable name
+    :param tile_size: Number of rows and columns of every chunk when
+                      data is not chunked
+    :param compression: Compression codec, 'zlib' for NetCDF, a Blosc
+                        codec for Zarr, e.g. 'zstd' (default) or 'lz4',
+                        'none' to disable compression
+    :param complevel: Compression level
+    :param encoding: Scaled integer encoding, see save_dask_array
+    :param progressBar: Progress bar object
+    """
+    if is_array_store(fname) is False:
+        msg = f"File {fname} is not a NetCDF or Zarr store"
+        raise Exception(msg)
+
+    save_dask_array(fname, data, data_var, method=None,
+            tile_size=tile_size, compression=compression,
+            complevel=complevel, encoding=encoding,
+            progressBar=progressBar)
+
+def open_array_store(fname):
+    """
+    Opens lazily a NetCDF4 or Zarr store saved by save_array_store
+    using the store chunks. Values are not masked, as
+    xr.open_rasterio, and the transform, crs and nodatavals
+    attributes are the ones of xr.open_rasterio so that the data
+    can be used by all TATSSI modules. Scaled integers are decoded
+    to float32 with NaN as fill value, see get_scaled_encoding.
+    :param fname: Full path of the .nc file or .zarr directory
+    :return: xarray DataArray, the name is the data variable name
+    """
+    name, extension = os.path.splitext(fname.rstrip(os.sep))
+    extension = extension.lower()
+
+    if extension == '.nc':
+        dataset = xr.open_dataset(fname, engine='netcdf4',
+                                  mask_and_scale=False)
+    elif extension == '.zarr':
+        dataset = xr.open_zarr(fname, mask_and_scale=False)
+    else:
+        msg = f"File {fname} is not a NetCDF or Zarr store"
+        raise Exception(msg)
+
+    data_vars = [v for v in dataset.data_vars if v != 'spatial_ref']
+    if len(data_vars) == 0:
+        msg = f"File {fname} does not have a data variable"
+        raise Exception(msg)
+
+    data_array = dataset[data_vars[0]]
+
+    if extension == '.nc':
+        chunks = data_array.encoding.get('chunksizes')
+        if chunks is None:
+            chunks = data_array.shape
+        data_array = data_array.chunk(dict(zip(data_array.dims, chunks)))
+
+    # Same attributes as xr.open_rasterio
+    attrs = dict(data_array.attrs)
+    for key in ['transform', 'res']:
+        if key in attrs:
+            attrs[key] = tuple([float(v) for v in np.atleast_1d(attrs[key])])
+
+    fill_value = float(attrs.pop('_FillValue', np.nan))
+    attrs['nodatavals'] = tuple([fill_value] * data_array.shape[0])
+
+    # Scaled integers are decoded, see get_scaled_encoding
+    scale_factor = attrs.pop('scale_factor', None)
+    add_offset = attrs.pop('add_offset', 0.0)
 
-    if dask == True:
-        pass
-        # Close client
-        #client.close()
+    data_array.attrs = attrs
 
-    LOG.info(f"File {fname} saved")
+    if scale_factor is not None:
+        data_array = decode_scaled(data_array, float(scale_factor),
+                float(add_offset), fill_value)
+        data_array.name = data_vars[0]
 
+    return data_array
@@ -10,6 +10,7 @@ sys.path.append(str(src_dir.absolute()))
 
 from TATSSI.time_series.generator import Generator
 from TATSSI.time_series.parmap import parmap
+from TATSSI.time_series.compaction import pct_data_available
 from TATSSI.input_output.utils import *
 from TATSSI.qa.EOS.catalogue import Catalogue
 
@@ -496,11 +497,11 @@ class Analytics():
 
         # Create the percentage of data available mask
         # Get the per-pixel per-time step binary mask
-        pct_data_available = (self.mask.sum(axis=0) * 100.0) / _time
-        pct_data_available.latitude.data = v.latitude.data
-        pct_data_available.longitude.data = v.longitude.data
+        _pct_data_available = pct_data_available(self.mask, axis=0)
+        _pct_data_available.latitude.data = v.latitude.data
+        _pct_data_available.longitude.data = v.longitude.data
         # Set the pct_data_available object
-        self.pct_data_available = pct_data_available
+        self.pct_data_available = _pct_data_available
 
         # Using the computed mask get the max gap length
         self.__get_max_gap_length(b)
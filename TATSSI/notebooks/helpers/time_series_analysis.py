@@ -9,6 +9,8 @@ src_dir = Path(current_dir).parents[2]
 sys.path.append(str(src_dir.absolute()))
 
 from TATSSI.input_output.translate import Translate
+from TATSSI.input_output.pixel_cache import get_pixel_cache
+from TATSSI.input_output.execution import get_execution_config
 from .utils import *
 from TATSSI.time_series.analysis import Analysis
 from TATSSI.time_series.mk_test import mk_test
@@ -37,7 +39,6 @@ import numpy as np
 from rasterio import logging as rio_logging
 from datetime import datetime
 
-from dask.distributed import Client
 from dask.diagnostics import ProgressBar
 
 import matplotlib
@@ -314,18 +315,11 @@ class TimeSeriesAnalysis():
         self.right_p.plot(event.xdata, event.ydata,
                 marker='o', color='red', markersize=7, alpha=0.7)
 
-        # Non-masked data
-        left_plot_sd = self.left_ds.sel(longitude=event.xdata,
-                                        latitude=event.ydata,
-                                        method='nearest')
+        # Non-masked data, from the time-major pixel cache
+        pixel_cache = get_pixel_cache(self.left_ds, self.ts.fname)
+        left_plot_sd = pixel_cache.get(event.xdata, event.ydata)
         # Sinlge year dataset
-        single_year_ds = self.single_year_ds.sel(longitude=event.xdata,
-                                                 latitude=event.ydata,
-                                                 method='nearest')
-
-        if left_plot_sd.chunks is not None:
-            left_plot_sd = left_plot_sd.compute()
-            single_year_ds = single_year_ds.compute()
+        single_year_ds = left_plot_sd.sel(time=self.single_year_ds.time)
 
 
         # Seasonal decompose
@@ -414,14 +408,19 @@ class TimeSeriesAnalysis():
         # Redraw plot
         plt.draw()
 
-    def get_climatology(self, tile_size=256, n_workers=1,
-                    threads_per_worker=8, memory_limit='14GB'):
+    def get_climatology(self, tile_size=256, n_workers=None,
+                    threads_per_worker=None, memory_limit=None):
         """
-        Derives a climatology dataset
+        Derives a climatology dataset, n_workers, threads_per_worker
+        and memory_limit override the execution configuration in use
         """
         self.ts.climatology()
 
-        with ProgressBar():
+        config = get_execution_config(n_workers=n_workers,
+                threads_per_worker=threads_per_worker,
+                memory_limit=memory_limit)
+
+        with config, ProgressBar():
             self.ts.climatology_mean = self.ts.climatology_mean.compute()
             self.ts.climatology_std = self.ts.climatology_std.compute()
 
@@ -12,6 +12,7 @@ from TATSSI.time_series.generator import Generator
 from TATSSI.time_series.smoothn import smoothn
 from TATSSI.input_output.translate import Translate
 from TATSSI.input_output.utils import *
+from TATSSI.input_output.pixel_cache import get_pixel_cache
 from TATSSI.qa.EOS.catalogue import Catalogue
 
 # Widgets
@@ -27,6 +28,7 @@ from IPython.display import clear_output
 from IPython.display import display
 
 import json
+from glob import glob
 import gdal, ogr
 from osgeo import gdal_array
 from osgeo import osr
@@ -59,6 +61,8 @@ class TimeSeriesInterpolation():
 
         # Mask
         self.mask = qa_analytics.mask
+        # QA selection used to create the mask
+        self.user_qa_selection = qa_analytics.user_qa_selection
 
         # Data variables
         # set in __fill_data_variables
@@ -90,13 +94,21 @@ class TimeSeriesInterpolation():
         log = rio_logging.getLogger()
         log.setLevel(rio_logging.ERROR)
 
-    def interpolate(self, tile_size=256, n_workers=1,
-                    threads_per_worker=8, memory_limit='14GB',
-                    progressBar=None):
+    def interpolate(self, tile_size=256, n_workers=None,
+                    threads_per_worker=None, memory_limit=None,
+                    progressBar=None, cache=None):
         """
         Interpolates the data of a time series object using
         the method or methods provided
         :param method: list of interpolation methods
+        :param n_workers: If set, overrides the number of workers of
+                          the execution configuration in use
+        :param threads_per_worker: If set, overrides the number of
+                                   threads per worker
+        :param memory_limit: If set, overrides the memory limit
+        :param cache: ResultCache object, if set interpolated data is
+                      taken from the cache when interpolating the same
+                      layerstacks with the same QA selection and method
         """
         if self.mask is None:
             pass
@@ -168,6 +180,25 @@ class TimeSeriesInterpolation():
                 progress_bar.description = (f"Interpolation of {data_var}"
                                             f" using {method}")
 
+            # Output file name
+            fname = f"{self.product}.{self.version}.{data_var}.{method}.tif"
+            output_dir = os.path.join(self.source_dir, data_var[1::],
+                              'interpolated')
+
+            if os.path.exists(output_dir) is False:
+                os.mkdir(output_dir)
+            fname = os.path.join(output_dir, fname)
+
+            if cache is not None:
+                key = cache.get_key('interpolation',
+                        self.__get_input_fnames(data_var),
+                        self.__get_parameters(data_var, method))
+
+                if cache.get(key, fname) is not None:
+                    if self.isNotebook is True:
+                        _item += 1
+                    continue
+
             if method == 'smoothn':
                 # First, we need a linear interpolation
                 tmp_interpol_ds = tmp_ds.interpolate_na(dim='time',
@@ -201,14 +232,6 @@ class TimeSeriesInterpolation():
             tmp_interpol_ds.attrs = tmp_ds.attrs
 
             # Save to file
-            fname = f"{self.product}.{self.version}.{data_var}.{method}.tif"
-            output_dir = os.path.join(self.source_dir, data_var[1::],
-                              'interpolated')
-
-            if os.path.exists(output_dir) is False:
-                os.mkdir(output_dir)
-            fname = os.path.join(output_dir, fname)
-
             save_dask_array(fname=fname, data=tmp_interpol_ds,
                             data_var=data_var, method=method,
                             tile_size=tile_size, n_workers=n_workers,
@@ -216,6 +239,9 @@ class TimeSeriesInterpolation():
                             memory_limit=memory_limit,
                             progressBar=progressBar)
 
+            if cache is not None:
+                cache.put(key, fname, stage='interpolation')
+
             if self.isNotebook is True:
                 _item += 1
 
@@ -224,6 +250,39 @@ class TimeSeriesInterpolation():
             progress_bar.close()
             del progress_bar
 
+    def __get_input_fnames(self, data_var):
+        """
+        Get the layerstacks used to interpolate a data variable, the
+        data variable VRT and the decoded QA layers VRTs
+        """
+        input_fnames = [os.path.join(self.source_dir, data_var[1::],
+                                     f'{data_var[1::]}.vrt')]
+
+        qa_fnames = glob(os.path.join(self.source_dir, '*', '*', '*.vrt'))
+        qa_fnames.sort()
+
+        return input_fnames + qa_fnames
+
+    def __get_parameters(self, data_var, method):
+        """
+        Interpolation parameters that identify an interpolation output,
+        the time steps are included since the time series can be a
+        temporal subset of the layerstacks, see Generator
+        """
+        times = getattr(self.ts.data, data_var).time.data
+
+        parameters = {'product' : self.product,
+                      'version' : self.version,
+                      'data_var' : data_var,
+                      'method' : method,
+                      'user_qa_selection' : self.user_qa_selection,
+                      'time' : np.datetime_as_string(times).tolist()}
+
+        if method == 'smoothn':
+            parameters['s'] = float(self.smooth_factor.value)
+
+        return parameters
+
     def __create_plot_objects(self):
         """
         Create plot objects
@@ -390,19 +449,22 @@ class TimeSeriesInterpolation():
         self.right_p.plot(event.xdata, event.ydata,
                 marker='o', color='red', markersize=3)
 
-        # Non-masked data
-        left_plot_sd = self.left_ds.sel(longitude=event.xdata,
-                                        latitude=event.ydata,
-                                        method='nearest')
-        if left_plot_sd.chunks is not None:
-            left_plot_sd = left_plot_sd.compute()
+        # Non-masked data, from the time-major pixel cache of the
+        # data variable layer stack
+        data_var = self.data_vars.value
+        fname = os.path.join(self.source_dir, data_var[1::],
+                             f'{data_var[1::]}.vrt')
+        pixel_cache = get_pixel_cache(self.left_ds, fname)
+        left_plot_sd = pixel_cache.get(event.xdata, event.ydata)
 
         # Masked data
-        right_plot_sd = self.right_ds.sel(longitude=event.xdata,
-                                          latitude=event.ydata,
-                                          method='nearest')
-        if right_plot_sd.chunks is not None:
-            right_plot_sd = right_plot_sd.compute()
+        if self.mask is None:
+            right_plot_sd = left_plot_sd.copy(deep=True)
+        else:
+            _mask = self.mask.sel(longitude=event.xdata,
+                                  latitude=event.ydata,
+                                  method='nearest')
+            right_plot_sd = left_plot_sd * _mask.data
 
         # Plots
         left_plot_sd.plot(ax=self.ts_p, color='black',
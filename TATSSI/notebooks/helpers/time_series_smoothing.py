@@ -9,13 +9,13 @@ src_dir = Path(current_dir).parents[2]
 sys.path.append(str(src_dir.absolute()))
 
 from TATSSI.time_series.smoothn import smoothn
+from TATSSI.time_series.savgol import savgol
+from TATSSI.time_series.exp_smoothing import exp_smoothing
 from TATSSI.input_output.translate import Translate
 from TATSSI.input_output.utils import *
+from TATSSI.input_output.pixel_cache import get_pixel_cache
 from TATSSI.time_series.analysis import Analysis
 
-# Smoothing methods
-import statsmodels.tsa.api as tsa
-
 # Widgets
 import ipywidgets as widgets
 from ipywidgets import Layout
@@ -159,6 +159,7 @@ class TimeSeriesSmoothing():
         Fill smooth methods
         """
         smoothing_methods = ['smoothn',
+                             'savgol',
                              'ExponentialSmoothing',
                              'SimpleExpSmoothing',
                              'Holt']
@@ -236,11 +237,8 @@ class TimeSeriesSmoothing():
                 marker='o', color='red', markersize=7, alpha=0.7)
 
         # Interpolated data to smooth
-        img_plot_sd = self.img_ds.sel(longitude=event.xdata,
-                                        latitude=event.ydata,
-                                        method='nearest')
-        if img_plot_sd.chunks is not None:
-            img_plot_sd = img_plot_sd.compute()
+        pixel_cache = get_pixel_cache(self.img_ds, self.ts.fname)
+        img_plot_sd = pixel_cache.get(event.xdata, event.ydata)
 
         # Plots
         img_plot_sd.plot(ax=self.ts_p, color='black',
@@ -256,15 +254,14 @@ class TimeSeriesSmoothing():
                 fittedvalues = smoothn(y, isrobust=True,
                         s=s, TolZ=1e-6, axis=0)[0]
 
+            elif method == 'savgol':
+                # Savitzky-Golay with default window and order
+                fittedvalues = savgol(y, axis=0)
+
             else:
-                _method = getattr(tsa, method)
-                # Smoothing
-                #fit = _method(y).fit(smoothing_level=s, optimized=False)
-                fit = _method(y.astype(float)).fit(smoothing_level=s)
-                # Re-cast to original data type
-                fittedvalues = np.zeros_like(fit.fittedvalues)
-                fittedvalues[0:-1] = fit.fittedvalues[1::]
-                fittedvalues[-1] = y[-1]
+                # Exponential smoothing methods
+                fittedvalues = exp_smoothing(y, method,
+                        smoothing_level=s, axis=0)
 
             # Plot
             tmp_ds = img_plot_sd.copy(deep=True,
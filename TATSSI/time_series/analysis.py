@@ -8,7 +8,13 @@ from rasterio import logging as rio_logging
 
 from statsmodels.tsa.seasonal import seasonal_decompose
 
+from TATSSI.input_output.utils import is_array_store, \
+        open_array_store, is_boolean_raster, decode_scaled
+
 from .ts_utils import *
+from .climatology import ClimatologyStore, CLIMATOLOGY_STORE_MAX_SIZE
+
+LOG = logging.getLogger(__name__)
 
 class Analysis():
     """
@@ -56,15 +62,40 @@ class Analysis():
 
         pass
 
-    def climatology(self):
+    def climatology(self, persist=False, progressBar=None):
         """
-        Derives a climatology dataset
+        Derives a climatology dataset. If the data was loaded from a
+        file the climatology can be persisted alongside it, see
+        ClimatologyStore, and only the new time steps are processed
+        :param persist: If True the climatology is persisted, if None
+                        it is persisted only when the store is smaller
+                        than CLIMATOLOGY_STORE_MAX_SIZE, otherwise the
+                        climatology is computed lazily. If the store
+                        can't be written, e.g. a read-only directory,
+                        the climatology is computed lazily as well
+        :param progressBar: Progress bar object
         """
         tmp_ds = getattr(self.data, self.dataset_name)
 
-        # Compute mean and std
-        _mean = tmp_ds.groupby('time.dayofyear').mean('time')
-        _std = tmp_ds.groupby('time.dayofyear').std('time')
+        if persist is None and hasattr(self, 'fname'):
+            persist = ClimatologyStore.get_size(tmp_ds) <= \
+                    CLIMATOLOGY_STORE_MAX_SIZE
+
+        _mean, _std = None, None
+        if persist is True and hasattr(self, 'fname'):
+            store = ClimatologyStore(self.fname)
+            try:
+                store.update(tmp_ds, progressBar=progressBar)
+                _mean = store.get_mean()
+                _std = store.get_std()
+            except OSError as e:
+                LOG.warning(f"Climatology store {store.fname} can't be "
+                            f"saved, {e}")
+
+        if _mean is None:
+            # Compute mean and std
+            _mean = tmp_ds.groupby('time.dayofyear').mean('time')
+            _std = tmp_ds.groupby('time.dayofyear').std('time')
 
         # Copy attributes
         _mean.attrs = tmp_ds.attrs
@@ -76,8 +107,16 @@ class Analysis():
 
     def __get_dataset(self):
         """
-        Load all layers from a GDAL compatible file into an xarray
+        Load all layers from a GDAL compatible file, or a NetCDF or
+        Zarr store saved by TATSSI, into an xarray
         """
+        if is_array_store(self.fname):
+            # Chunked store, opened lazily with the store chunks
+            data_array = open_array_store(self.fname)
+            self.dataset_name = data_array.name
+            self.data = data_array.to_dataset()
+            return
+
         # Disable RasterIO logging, just show ERRORS
         log = rio_logging.getLogger()
         log.setLevel(rio_logging.ERROR)
@@ -105,8 +144,15 @@ class Analysis():
             times = get_times_from_file_band(self.fname)
         data_array['time'] = times
 
+        # Scaled integers and bit-packed boolean products, see
+        # save_dask_array
+        scaling = get_scale_band_metadata(self.fname)
+        if scaling is not None:
+            data_array = decode_scaled(data_array, *scaling)
+        elif is_boolean_raster(self.fname):
+            data_array = data_array.astype(bool)
         # Check that _FillValue is not NaN
-        if data_array.nodatavals[0] is np.NaN:
+        elif data_array.nodatavals[0] is np.NaN:
             # Use _FillValue from band metadata
             _fill_value = get_fill_value_band_metadata(self.fname)
 
@@ -0,0 +1,271 @@
+
+import numpy as np
+from numba import jit, prange
+
+from .compaction import compact_pixels, scatter_pixels
+
+# Change point detection methods
+change_point_methods = {'BinSeg' : 0, 'PELT' : 1}
+
+@jit(nopython=True)
+def _cost_meanvar(x, x2, n):
+    """
+    Normal mean and variance change cost, twice the negative
+    log-likelihood of a segment, same as mll.meanvar of the R
+    changepoint package
+    :param x: Sum of the segment observations
+    :param x2: Sum of the squared segment observations
+    :param n: Number of observations of the segment
+    """
+    sigsq = (x2 - ((x * x) / n)) / n
+    if sigsq <= 0:
+        sigsq = 0.00000000001
+
+    return n * (np.log(2 * np.pi) + np.log(sigsq) + 1)
+
+@jit(nopython=True)
+def _segment_cost(sum_x, sum_x2, start, end):
+    """
+    Cost of the segment of observations start+1 to end
+    """
+    return _cost_meanvar(sum_x[end] - sum_x[start],
+                         sum_x2[end] - sum_x2[start], end - start)
+
+@jit(nopython=True)
+def _cumulative_sums(y):
+    """
+    Cumulative sums of y and y^2 starting with 0
+    """
+    n = y.shape[0]
+    sum_x = np.zeros(n + 1)
+    sum_x2 = np.zeros(n + 1)
+    for i in range(n):
+        sum_x[i + 1] = sum_x[i] + y[i]
+        sum_x2[i + 1] = sum_x2[i] + y[i] * y[i]
+
+    return sum_x, sum_x2
+
+@jit(nopython=True)
+def binseg_meanvar(y, pen, Q=5, minseglen=2):
+    """
+    Binary segmentation for changes in mean and variance of normal
+    data, same as cpt.meanvar(test.stat='Normal', method='BinSeg')
+    of the R changepoint package
+    :param y: 1D float64 array
+    :param pen: Penalty value
+    :param Q: Maximum number of change points
+    :param minseglen: Minimum segment length, as in R the segment
+                      left of a split has at least minseglen + 1
+                      observations
+    :return: Sorted change points, as in R, the position of the last
+             observation of every segment but the last one, 1-based
+    """
+    n = y.shape[0]
+    if n < 2 * minseglen:
+        return np.zeros(0, dtype=np.int64)
+
+    sum_x, sum_x2 = _cumulative_sums(y)
+
+    # As in R gains can only decrease, every gain is the minimum of
+    # the gains of the splits so far
+    old_max = np.inf
+
+    # Segment boundaries
+    tau = np.zeros(Q + 2, dtype=np.int64)
+    tau[1] = n
+    n_tau = 2
+
+    cpts = np.zeros(Q, dtype=np.int64)
+    gain = np.zeros(Q)
+    n_cpts = 0
+
+    for q in range(Q):
+        _tau = np.sort(tau[0:n_tau])
+
+        best_gain = 0.0
+        best_cpt = -1
+        for p in range(n_tau - 1):
+            start, end = _tau[p], _tau[p + 1]
+            null = _segment_cost(sum_x, sum_x2, start, end)
+
+            for j in range(start + minseglen + 1, end - minseglen + 1):
+                _gain = 0.5 * (null - _segment_cost(sum_x, sum_x2, start, j)
+                                    - _segment_cost(sum_x, sum_x2, j, end))
+                if _gain > best_gain:
+                    best_gain = _gain
+                    best_cpt = j
+
+        if best_cpt < 0:
+            # No further split improves the fit
+            break
+
+        old_max = min(old_max, best_gain)
+
+        cpts[q] = best_cpt
+        gain[q] = old_max
+        tau[n_tau] = best_cpt
+        n_tau += 1
+        n_cpts += 1
+
+    # Number of change points is the largest q that passes the penalty
+    op_cpts = 0
+    for q in range(n_cpts):
+        if 2 * gain[q] >= pen:
+            op_cpts = q + 1
+
+    return np.sort(cpts[0:op_cpts])
+
+@jit(nopython=True)
+def pelt_meanvar(y, pen, minseglen=2):
+    """
+    Pruned Exact Linear Time (PELT) search for changes in mean and
+    variance of normal data, same as cpt.meanvar(test.stat='Normal',
+    method='PELT') of the R changepoint package
+    :param y: 1D float64 array
+    :param pen: Penalty value
+    :param minseglen: Minimum segment length
+    :return: Sorted change points, as in R, the position of the last
+             observation of every segment but the last one, 1-based
+    """
+    n = y.shape[0]
+    if n < 2 * minseglen:
+        return np.zeros(0, dtype=np.int64)
+
+    sum_x, sum_x2 = _cumulative_sums(y)
+
+    last_change_like = np.zeros(n + 1)
+    last_change_cpts = np.zeros(n + 1, dtype=np.int64)
+
+    last_change_like[0] = -pen
+    for j in range(minseglen, 2 * minseglen):
+        last_change_like[j] = _segment_cost(sum_x, sum_x2, 0, j)
+
+    check_list = np.zeros(n + 1, dtype=np.int64)
+    check_list[1] = minseglen
+    n_check = 2
+
+    tmp_like = np.zeros(n + 1)
+    for tstar in range(2 * minseglen, n + 1):
+        min_like = np.inf
+        which_min = 0
+        for i in range(n_check):
+            tmp_like[i] = last_change_like[check_list[i]] + \
+                    _segment_cost(sum_x, sum_x2, check_list[i], tstar) + pen
+
+            if tmp_like[i] < min_like:
+                min_like = tmp_like[i]
+                which_min = i
+
+        last_change_like[tstar] = min_like
+        last_change_cpts[tstar] = check_list[which_min]
+
+        # Pruning
+        n_check_tmp = 0
+        for i in range(n_check):
+            if tmp_like[i] <= min_like + pen:
+                check_list[n_check_tmp] = check_list[i]
+                n_check_tmp += 1
+
+        check_list[n_check_tmp] = tstar - minseglen + 1
+        n_check = n_check_tmp + 1
+
+    # Backtrack the optimal segmentation
+    cpts = np.zeros(n, dtype=np.int64)
+    n_cpts = 0
+    last = last_change_cpts[n]
+    while last > 0:
+        cpts[n_cpts] = last
+        n_cpts += 1
+        last = last_change_cpts[last]
+
+    return np.sort(cpts[0:n_cpts])
+
+@jit(nopython=True, parallel=True)
+def _change_points(x, method, pen, Q, minseglen, shift):
+    """
+    Change points for a 2D array (pixels, time), pixels are
+    processed in parallel
+    """
+    n_pixels, n = x.shape
+    output = np.zeros((n_pixels, n), dtype=np.int16)
+
+    for i in prange(n_pixels):
+        if not np.all(np.isfinite(x[i])):
+            continue
+
+        if method == 0:
+            cpts = binseg_meanvar(x[i], pen, Q, minseglen)
+        else:
+            cpts = pelt_meanvar(x[i], pen, minseglen)
+
+        for cpt in cpts:
+            if cpt + shift < n:
+                output[i, cpt + shift] = 1
+
+    return output
+
+def get_penalty(n, penalty='SIC'):
+    """
+    Penalty value for changes in mean and variance, same as the
+    penalty used by cpt.meanvar of the R changepoint package
+    :param n: Number of observations
+    :param penalty: 'SIC'/'BIC', 'AIC' or 'Hannan-Quinn'
+    :return: Penalty value
+    """
+    # Mean and variance change, two parameters plus the change point
+    n_params = 3
+
+    if penalty in ['SIC', 'BIC']:
+        return n_params * np.log(n)
+    elif penalty == 'AIC':
+        return 2.0 * n_params
+    elif penalty == 'Hannan-Quinn':
+        return 2.0 * n_params * np.log(np.log(n))
+    else:
+        msg = f"Penalty {penalty} is not valid"
+        raise Exception(msg)
+
+def change_points(x, method='BinSeg', penalty='SIC', Q=5, minseglen=2,
+                  shift=0, axis=0, fill_value=None,
+                  min_data_available=None):
+    """
+    Changes in mean and variance for every pixel of an N-D array,
+    e.g. a (time, rows, cols) chunk of a time series. Pixels with not
+    finite observations are skipped. Pixels are processed in parallel,
+    when used within dask the chunks should be computed with the
+    synchronous scheduler.
+    :param x: N-D NumPy array
+    :param method: 'BinSeg' or 'PELT'
+    :param penalty: Penalty name, see get_penalty
+    :param Q: Maximum number of change points, BinSeg only
+    :param minseglen: Minimum segment length
+    :param shift: Change points are flagged at the 0-based index
+                  cpt + shift, where cpt is the R changepoint position
+                  of the last observation before the change
+    :param axis: Time axis
+    :param fill_value: Fill value, used to assess the valid observations
+    :param min_data_available: If set, only pixels with at least this
+                               percentage of valid observations are
+                               processed, see compaction.compact_pixels,
+                               other pixels get no change points
+    :return: int16 array with the shape of x, 1 where there is a
+             change point, 0 otherwise
+    """
+    if method not in change_point_methods:
+        msg = f"Change point method {method} is not valid"
+        raise Exception(msg)
+
+    _x = np.moveaxis(np.asarray(x, dtype=np.float64), axis, -1)
+    shape = _x.shape
+    n = shape[-1]
+
+    pen = get_penalty(n, penalty)
+
+    _x = np.ascontiguousarray(_x.reshape(-1, n))
+    _x, valid_pixels = compact_pixels(_x, fill_value, min_data_available)
+
+    output = _change_points(_x, change_point_methods[method], pen,
+                            int(Q), int(minseglen), int(shift))
+    output = scatter_pixels(output, valid_pixels, 0)
+
+    return np.moveaxis(output.reshape(shape), -1, axis)
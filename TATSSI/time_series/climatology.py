@@ -0,0 +1,693 @@
+
+import os
+import json
+import numpy as np
+import pandas as pd
+import xarray as xr
+from numba import jit, prange
+
+import gdal
+
+from TATSSI.input_output.utils import get_dst_dataset, \
+        get_gt_proj_from_xarray, encode_scaled, decode_scaled, \
+        set_scaled_band_metadata
+from TATSSI.input_output.execution import uses_execution_config
+from TATSSI.input_output.cache import ResultCache
+
+from .ts_utils import get_chunk_size, get_scale_band_metadata
+
+import logging
+LOG = logging.getLogger(__name__)
+
+# Climatology statistics, in the order computed by the kernel
+#   minimum - Q1 - 1.5 * IQR
+#   maximum - Q3 + 1.5 * IQR
+climatology_statistics = ['mean', 'std', 'Q1', 'median', 'Q3',
+                          'minimum', 'maximum']
+
+# Outlier flags, bits of the outliers cube
+UPPER_OUTLIER = 1
+LOWER_OUTLIER = 2
+
+def get_doy_groups(times):
+    """
+    Groups the time steps of a time series by day of year
+    :param times: Array of datetime64 time steps
+    :return: doys, unique days of year
+             order, time step indices sorted by day of year
+             offsets, time steps of doys[i] are order[offsets[i]:offsets[i+1]]
+    """
+    doy = pd.DatetimeIndex(times).dayofyear.values
+
+    doys, doy_index = np.unique(doy, return_inverse=True)
+    order = np.argsort(doy_index, kind='mergesort').astype(np.int64)
+    offsets = np.zeros(doys.shape[0] + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(doy_index))
+
+    return doys, order, offsets
+
+@jit(nopython=True)
+def _quantile(values, q):
+    """
+    Quantile of a sorted 1D array, linear interpolation as np.quantile
+    """
+    position = q * (values.shape[0] - 1)
+    lower = int(np.floor(position))
+    upper = min(lower + 1, values.shape[0] - 1)
+    fraction = position - lower
+
+    return values[lower] + (values[upper] - values[lower]) * fraction
+
+@jit(nopython=True, parallel=True)
+def _climatology(x, order, offsets):
+    """
+    Climatology statistics for a 2D array (pixels, time), pixels are
+    processed in parallel
+    """
+    n_pixels, n = x.shape
+    n_doys = offsets.shape[0] - 1
+
+    output = np.full((n_pixels, 7, n_doys), np.nan, dtype=np.float32)
+
+    for i in prange(n_pixels):
+        _buffer = np.empty(n)
+        for d in range(n_doys):
+            # Finite observations for this day of year
+            m = 0
+            for k in range(offsets[d], offsets[d + 1]):
+                value = x[i, order[k]]
+                if np.isfinite(value):
+                    _buffer[m] = value
+                    m += 1
+
+            if m == 0:
+                continue
+
+            values = np.sort(_buffer[0:m])
+
+            mean = 0.0
+            for k in range(m):
+                mean += values[k]
+            mean /= m
+
+            variance = 0.0
+            for k in range(m):
+                variance += (values[k] - mean) ** 2
+            variance /= m
+
+            q1 = _quantile(values, 0.25)
+            q3 = _quantile(values, 0.75)
+            iqr = q3 - q1
+
+            output[i, 0, d] = mean
+            output[i, 1, d] = np.sqrt(variance)
+            output[i, 2, d] = q1
+            output[i, 3, d] = _quantile(values, 0.5)
+            output[i, 4, d] = q3
+            output[i, 5, d] = q1 - (1.5 * iqr)
+            output[i, 6, d] = q3 + (1.5 * iqr)
+
+    return output
+
+@jit(nopython=True, parallel=True)
+def _outliers(x, order, offsets, statistics):
+    """
+    Outlier flags for a 2D array (pixels, time) from the climatology
+    statistics computed by _climatology, pixels are processed in parallel
+    """
+    n_pixels, n = x.shape
+    n_doys = offsets.shape[0] - 1
+
+    output = np.zeros((n_pixels, n), dtype=np.uint8)
+
+    for i in prange(n_pixels):
+        for d in range(n_doys):
+            lower = statistics[i, 5, d]
+            upper = statistics[i, 6, d]
+            for k in range(offsets[d], offsets[d + 1]):
+                t = order[k]
+                if x[i, t] > upper:
+                    output[i, t] |= UPPER_OUTLIER
+                if x[i, t] < lower:
+                    output[i, t] |= LOWER_OUTLIER
+
+    return output
+
+def decode_outliers(outliers):
+    """
+    Decodes an outliers cube created by save_climatology
+    :param outliers: uint8 array or xarray with the outlier flags
+    :return: upper, lower, boolean arrays, True where the observation
+             is above Q3 + 1.5 * IQR or below Q1 - 1.5 * IQR of its
+             day of year
+    """
+    upper = (outliers & UPPER_OUTLIER) > 0
+    lower = (outliers & LOWER_OUTLIER) > 0
+
+    return upper, lower
+
+def climatology(x, times, axis=0):
+    """
+    Per day of year mean, standard deviation, quartiles and whisker
+    bounds of an N-D array, e.g. a (time, rows, cols) chunk of a time
+    series. Mean and standard deviation are the same as a groupby
+    dayofyear mean and std, quartiles are the same as np.quantile.
+    Non-finite observations are ignored. Pixels are processed in
+    parallel, when used within dask the chunks should be computed
+    with the synchronous scheduler.
+    :param x: N-D NumPy array
+    :param times: Array of datetime64 time steps
+    :param axis: Time axis
+    :return: doys, unique days of year
+             statistics, float32 array with shape
+             (len(climatology_statistics), len(doys), ...)
+    """
+    doys, order, offsets = get_doy_groups(times)
+
+    _x = np.moveaxis(np.asarray(x, dtype=np.float32), axis, -1)
+    shape = _x.shape[:-1]
+    n = _x.shape[-1]
+
+    _x = np.ascontiguousarray(_x.reshape(-1, n))
+
+    output = _climatology(_x, order, offsets)
+    output = np.moveaxis(output, 0, -1).reshape(
+            output.shape[1:] + shape)
+
+    return doys, output
+
+@uses_execution_config
+def save_climatology(data, output_fname, data_var, outliers=False,
+                     scale_factor=None, progressBar=None):
+    """
+    Computes the climatology statistics of a time series and saves
+    every statistic as a single multi-band file with one band per
+    day of year, e.g. for output_fname /path/file.tif:
+        /path/file_climatology_mean.tif
+        /path/file_climatology_std.tif
+        /path/file_climatology_quartile_Q1.tif
+        ...
+    Optionally, the outliers of every observation are saved in the
+    same pass as a single bit-packed cube with one NBITS=2 band per
+    time step in /path/file_climatology_outliers.tif, bit 0 flags
+    observations above Q3 + 1.5 * IQR and bit 1 observations below
+    Q1 - 1.5 * IQR of its day of year, see decode_outliers.
+    Data is processed in a single pass, reading every chunk of the
+    input, with the full time series, only once.
+    :param data: xarray DataArray with dimensions time, latitude
+                 and longitude
+    :param output_fname: Output file name template
+    :param data_var: String with the data variable name
+    :param outliers: If True, saves the outliers cube
+    :param scale_factor: If set, statistics are saved as int16 scaled
+                         integers, see save_anomalies, e.g. 1.0 for
+                         statistics of integer data
+    :param progressBar: Progress bar object
+    :return: Dictionary with the output file name of every statistic,
+             and of the outliers cube with key 'outliers' if requested
+    """
+    layers, rows, cols = data.shape
+
+    doys, order, offsets = get_doy_groups(data.time.data)
+
+    # GeoTransform and projection
+    gt, proj = get_gt_proj_from_xarray(data)
+
+    # Output file names
+    _fname, _ext = os.path.splitext(output_fname)
+    output_fnames = {}
+    for statistic in climatology_statistics:
+        if statistic in ['mean', 'std']:
+            output_fnames[statistic] = \
+                    f'{_fname}_climatology_{statistic}{_ext}'
+        else:
+            output_fnames[statistic] = \
+                    f'{_fname}_climatology_quartile_{statistic}{_ext}'
+
+    if scale_factor is None:
+        dtype, fill_value = gdal.GDT_Float32, np.nan
+    else:
+        dtype, fill_value = gdal.GDT_Int16, np.iinfo(np.int16).min
+
+    # Create destination datasets and set band metadata
+    dst_datasets = []
+    for statistic in climatology_statistics:
+        dst_ds = get_dst_dataset(dst_img=output_fnames[statistic],
+                cols=cols, rows=rows, layers=len(doys),
+                dtype=dtype, proj=proj, gt=gt)
+
+        for i, doy in enumerate(doys):
+            dst_band = dst_ds.GetRasterBand(i + 1)
+            dst_band.SetMetadataItem('_FillValue', str(fill_value))
+            dst_band.SetMetadataItem('RANGEBEGINNINGDATE', str(doy))
+            dst_band.SetMetadataItem('data_var', data_var)
+            if scale_factor is not None:
+                set_scaled_band_metadata(dst_band, scale_factor)
+
+        dst_datasets.append(dst_ds)
+
+    if outliers is True:
+        output_fnames['outliers'] = f'{_fname}_climatology_outliers{_ext}'
+
+        # Two flag bits per observation, bit-packed
+        outliers_ds = get_dst_dataset(dst_img=output_fnames['outliers'],
+                cols=cols, rows=rows, layers=layers,
+                dtype=gdal.GDT_Byte, proj=proj, gt=gt, nbits=2)
+
+        for layer in range(layers):
+            dst_band = outliers_ds.GetRasterBand(layer + 1)
+            # Both flags are never set, the only value left for 2 bits
+            dst_band.SetMetadataItem('_FillValue',
+                    str(UPPER_OUTLIER | LOWER_OUTLIER))
+            dst_band.SetMetadataItem('RANGEBEGINNINGDATE',
+                    data.time.data[layer].astype(str))
+            dst_band.SetMetadataItem('data_var', data_var)
+            dst_band.SetMetadataItem('flag_masks',
+                    f'{UPPER_OUTLIER} {LOWER_OUTLIER}')
+            dst_band.SetMetadataItem('flag_meanings',
+                    'upper_outlier lower_outlier')
+
+    # Process the data using the input chunks
+    if data.chunks is not None:
+        row_chunks, col_chunks = data.chunks[1], data.chunks[2]
+    else:
+        row_chunks, col_chunks = (rows,), (cols,)
+
+    start_row = 0
+    for row_chunk in row_chunks:
+        if progressBar is not None:
+            progressBar.setValue(max(1, (start_row/rows) * 100.0))
+
+        end_row = start_row + row_chunk
+
+        start_col = 0
+        for col_chunk in col_chunks:
+            end_col = start_col + col_chunk
+
+            # Single read of the input data for all statistics
+            _data = data[:, start_row:end_row, start_col:end_col]
+            if _data.chunks is not None:
+                _data = _data.compute()
+
+            _x = np.moveaxis(_data.data.astype(np.float32), 0, -1)
+            _x = np.ascontiguousarray(_x.reshape(-1, layers))
+
+            _statistics = _climatology(_x, order, offsets)
+
+            if outliers is True:
+                _outlier_flags = _outliers(_x, order, offsets, _statistics)
+                _outlier_flags = _outlier_flags.reshape(
+                        (row_chunk, col_chunk, layers))
+
+                for layer in range(layers):
+                    outliers_ds.GetRasterBand(layer + 1).WriteArray(
+                            _outlier_flags[:, :, layer],
+                            xoff=start_col, yoff=start_row)
+
+            _statistics = _statistics.reshape(
+                    (row_chunk, col_chunk) + _statistics.shape[1:])
+
+            if scale_factor is not None:
+                _statistics = encode_scaled(_statistics, scale_factor)
+
+            # Write data
+            for i, dst_ds in enumerate(dst_datasets):
+                for layer in range(len(doys)):
+                    dst_ds.GetRasterBand(layer + 1).WriteArray(
+                            _statistics[:, :, i, layer],
+                            xoff=start_col, yoff=start_row)
+
+            start_col = end_col
+
+        start_row = end_row
+
+    # Flush to disk
+    dst_datasets, dst_ds = None, None
+    outliers_ds = None
+
+    for output_fname in output_fnames.values():
+        LOG.info(f"File {output_fname} saved")
+
+    return output_fnames
+
+def anomalies(data, climatology_mean, climatology_std):
+    """
+    Lazy standardized anomalies of a full time series, the
+    climatology of every time step is broadcast by its day of year,
+    hence partial years are also handled
+    :param data: xarray DataArray with dimensions time, latitude
+                 and longitude
+    :param climatology_mean: Climatology mean from open_climatology
+    :param climatology_std: Climatology std from open_climatology
+    :return: xarray DataArray with the anomalies for all time steps,
+             chunked with the full time series in every chunk
+    """
+    doy = data.time.dt.dayofyear
+
+    # Only the data is used to avoid the alignment of coordinates
+    _mean = climatology_mean.sel(dayofyear=doy).data
+    _std = climatology_std.sel(dayofyear=doy).data
+
+    _anomalies = (data - _mean) / _std
+    _anomalies.attrs = data.attrs
+
+    return _anomalies.chunk({'time' : -1})
+
+@uses_execution_config
+def save_anomalies(data, output_fname, data_var, scale_factor=None,
+                   progressBar=None):
+    """
+    Saves an anomalies cube, e.g. from anomalies, as a single
+    multi-band file with one band per time step. Chunks are computed
+    and written one at a time.
+    :param data: xarray DataArray with dimensions time, latitude
+                 and longitude
+    :param output_fname: Output file name full path
+    :param data_var: String with the data variable name
+    :param scale_factor: If set, data is saved as int16 with
+                         value = round(anomaly / scale_factor) and
+                         -32768 as fill value, the scale_factor and
+                         add_offset band metadata are set accordingly,
+                         e.g. 0.001 for anomalies within +/- 32.767
+    :param progressBar: Progress bar object
+    :return: Output file name
+    """
+    layers, rows, cols = data.shape
+
+    # GeoTransform and projection
+    gt, proj = get_gt_proj_from_xarray(data)
+
+    if scale_factor is None:
+        dtype, fill_value = gdal.GDT_Float32, np.nan
+    else:
+        dtype, fill_value = gdal.GDT_Int16, np.iinfo(np.int16).min
+
+    dst_ds = get_dst_dataset(dst_img=output_fname, cols=cols, rows=rows,
+            layers=layers, dtype=dtype, proj=proj, gt=gt)
+
+    for layer in range(layers):
+        dst_band = dst_ds.GetRasterBand(layer + 1)
+        dst_band.SetMetadataItem('_FillValue', str(fill_value))
+        dst_band.SetMetadataItem('RANGEBEGINNINGDATE',
+                data.time.data[layer].astype(str))
+        dst_band.SetMetadataItem('data_var', data_var)
+        if scale_factor is not None:
+            set_scaled_band_metadata(dst_band, scale_factor)
+
+    # Process the data using the input chunks
+    if data.chunks is not None:
+        row_chunks, col_chunks = data.chunks[1], data.chunks[2]
+    else:
+        row_chunks, col_chunks = (rows,), (cols,)
+
+    start_row = 0
+    for row_chunk in row_chunks:
+        if progressBar is not None:
+            progressBar.setValue(max(1, (start_row/rows) * 100.0))
+
+        end_row = start_row + row_chunk
+
+        start_col = 0
+        for col_chunk in col_chunks:
+            end_col = start_col + col_chunk
+
+            _data = data[:, start_row:end_row, start_col:end_col]
+            if _data.chunks is not None:
+                _data = _data.compute()
+
+            _data = _data.data.astype(np.float32)
+
+            if scale_factor is not None:
+                _data = encode_scaled(_data, scale_factor)
+
+            for layer in range(layers):
+                dst_ds.GetRasterBand(layer + 1).WriteArray(
+                        _data[layer], xoff=start_col, yoff=start_row)
+
+            start_col = end_col
+
+        start_row = end_row
+
+    # Flush to disk
+    dst_ds = None
+
+    LOG.info(f"File {output_fname} saved")
+
+    return output_fname
+
+# Maximum size in bytes of the climatology store accumulators, larger
+# datasets use the lazy groupby climatology, see Analysis.climatology
+CLIMATOLOGY_STORE_MAX_SIZE = 1024**3
+
+class ClimatologyStore():
+    """
+    Per day of year climatology accumulators, number of observations,
+    mean and sum of squared differences from the mean (M2), persisted
+    alongside a dataset, e.g. for /path/file.tif:
+        /path/file_climatology_store.npz
+    Accumulators are updated online with the Welford algorithm, only
+    the time steps not in the store are read. Mean and std are the
+    same as a groupby dayofyear mean and std ignoring non-finite
+    observations.
+    Accumulators are kept only for the days of year in the dataset,
+    e.g. 23 for a 16-day product, as int16 counts and float32 mean
+    and M2, 10 bytes per day of year and pixel. The size and
+    modification time of the dataset file are saved in the store,
+    the store is rebuilt when they change, e.g. when the dataset is
+    overwritten with the same time steps.
+    """
+    def __init__(self, fname):
+        """
+        :param fname: Dataset file name full path
+        """
+        self.fname = f'{os.path.splitext(fname)[0]}_climatology_store.npz'
+
+        # Dataset path, size and modification time
+        self.source = json.dumps(ResultCache.get_file_identity(fname))
+
+        self.doys = np.array([], dtype=np.int64)
+        self.times = np.array([], dtype='datetime64[ns]')
+        self.count, self.mean, self.m2 = None, None, None
+        self.latitude, self.longitude = None, None
+
+        if os.path.exists(self.fname):
+            self.__load()
+
+    @staticmethod
+    def get_size(data):
+        """
+        Size in bytes of the accumulators of a dataset
+        :param data: xarray DataArray with dimensions time, latitude
+                     and longitude
+        """
+        layers, rows, cols = data.shape
+        doys = np.unique(pd.DatetimeIndex(data.time.data).dayofyear.values)
+
+        # int16 count, float32 mean and M2
+        return doys.shape[0] * rows * cols * 10
+
+    @uses_execution_config
+    def update(self, data, progressBar=None):
+        """
+        Adds to the accumulators the time steps of data not already
+        in the store, one time step at a time
+        :param data: xarray DataArray with dimensions time, latitude
+                     and longitude
+        :param progressBar: Progress bar object
+        :return: Number of time steps added
+        """
+        layers, rows, cols = data.shape
+
+        if self.count is None:
+            self.count = np.zeros((0, rows, cols), dtype=np.int16)
+            self.mean = np.zeros((0, rows, cols), dtype=np.float32)
+            self.m2 = np.zeros((0, rows, cols), dtype=np.float32)
+            self.latitude = data.latitude.data
+            self.longitude = data.longitude.data
+        elif self.count.shape[1:] != (rows, cols):
+            msg = (f"Data with shape {data.shape} does not match "
+                   f"climatology store {self.fname}")
+            raise Exception(msg)
+
+        new_times = np.where(np.isin(data.time.data, self.times,
+                                     invert=True))[0]
+
+        # Accumulators for the days of year not yet in the store
+        doys = pd.DatetimeIndex(data.time.data[new_times]).dayofyear.values
+        self.__add_doys(doys)
+
+        for i, layer in enumerate(new_times):
+            if progressBar is not None:
+                progressBar.setValue(max(1, (i/len(new_times)) * 100.0))
+
+            d = np.searchsorted(self.doys, doys[i])
+            x = np.asarray(data[layer].data, dtype=np.float64)
+            valid = np.isfinite(x)
+
+            # Welford update of the day of year accumulators
+            with np.errstate(invalid='ignore'):
+                self.count[d] += valid
+                mean = self.mean[d].astype(np.float64)
+                delta = np.where(valid, x - mean, 0.0)
+                mean += np.where(valid,
+                        delta / np.maximum(self.count[d], 1), 0.0)
+                self.m2[d] += np.where(valid,
+                        delta * (x - mean), 0.0).astype(np.float32)
+                self.mean[d] = mean
+
+        if len(new_times) > 0:
+            self.times = np.sort(np.concatenate(
+                    (self.times, data.time.data[new_times])))
+            self.__save()
+            LOG.info(f"{len(new_times)} time steps added to {self.fname}")
+
+        return len(new_times)
+
+    def get_mean(self):
+        """
+        Climatology mean of the days of year with observations
+        :return: xarray DataArray with dimensions dayofyear, latitude
+                 and longitude
+        """
+        mean = np.where(self.count > 0, self.mean, np.nan)
+
+        return self.__to_xarray(mean)
+
+    def get_std(self, ddof=0):
+        """
+        Climatology standard deviation of the days of year with
+        observations
+        :param ddof: Delta degrees of freedom
+        :return: xarray DataArray with dimensions dayofyear, latitude
+                 and longitude
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.where(self.count > ddof,
+                    np.sqrt(self.m2 / (self.count - ddof)), np.nan)
+
+        return self.__to_xarray(std)
+
+    def get_anomalies(self, data):
+        """
+        Standardized anomalies of data using only the accumulators of
+        the days of year of its time steps, e.g. for a new acquisition.
+        Time steps with a day of year not in the store are NaN.
+        :param data: xarray DataArray with dimensions time, latitude
+                     and longitude
+        :return: xarray DataArray with the anomalies
+        """
+        doys = pd.DatetimeIndex(data.time.data).dayofyear.values
+        d = np.minimum(np.searchsorted(self.doys, doys),
+                       self.doys.shape[0] - 1)
+        in_store = (self.doys[d] == doys)[:, np.newaxis, np.newaxis]
+
+        count = np.where(in_store, self.count[d], 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, self.mean[d], np.nan)
+            std = np.where(count > 0, np.sqrt(self.m2[d] / count), np.nan)
+
+        _anomalies = (data - mean) / std
+        _anomalies.attrs = data.attrs
+
+        return _anomalies
+
+    def __add_doys(self, doys):
+        """
+        Adds empty accumulators for the days of year not in the store
+        """
+        doys = np.setdiff1d(doys, self.doys)
+        if doys.shape[0] == 0:
+            return
+
+        all_doys = np.union1d(self.doys, doys)
+        index = np.searchsorted(all_doys, self.doys)
+
+        shape = (all_doys.shape[0],) + self.count.shape[1:]
+        for name in ['count', 'mean', 'm2']:
+            accumulator = getattr(self, name)
+            _accumulator = np.zeros(shape, dtype=accumulator.dtype)
+            _accumulator[index] = accumulator
+            setattr(self, name, _accumulator)
+
+        self.doys = all_doys
+
+    def __to_xarray(self, statistic):
+        """
+        DataArray of a statistic for the days of year with observations
+        """
+        doys = np.where(self.count.any(axis=(1, 2)))[0]
+
+        return xr.DataArray(statistic[doys].astype(np.float32),
+                coords=[self.doys[doys], self.latitude, self.longitude],
+                dims=['dayofyear', 'latitude', 'longitude'])
+
+    def __load(self):
+        """
+        Loads the accumulators from disk
+        """
+        with np.load(self.fname) as store:
+            if 'doys' not in store.files or 'source' not in store.files:
+                # Dense store with all days of year, created by an
+                # earlier version, it is rebuilt
+                LOG.warning(f"Climatology store {self.fname} is outdated, "
+                            f"it will be rebuilt")
+                return
+
+            if str(store['source']) != self.source:
+                LOG.info(f"Dataset of climatology store {self.fname} "
+                         f"has changed, it will be rebuilt")
+                return
+
+            self.doys = store['doys']
+            self.times = store['times']
+            self.count = store['count']
+            self.mean = store['mean']
+            self.m2 = store['m2']
+            self.latitude = store['latitude']
+            self.longitude = store['longitude']
+
+    def __save(self):
+        """
+        Saves the compressed accumulators, a temporary file is used so
+        that the store is always valid
+        """
+        tmp_fname = f'{self.fname[:-4]}.{os.getpid()}.tmp.npz'
+
+        np.savez_compressed(tmp_fname, source=self.source,
+                doys=self.doys, times=self.times,
+                count=self.count, mean=self.mean, m2=self.m2,
+                latitude=self.latitude, longitude=self.longitude)
+
+        os.replace(tmp_fname, self.fname)
+
+def open_climatology(fname):
+    """
+    Opens lazily a climatology statistic file created by
+    save_climatology
+    :param fname: Climatology statistic file name full path
+    :return: xarray DataArray with dimensions dayofyear, latitude
+             and longitude
+    """
+    chunks = get_chunk_size(fname)
+    data_array = xr.open_rasterio(fname, chunks=chunks)
+
+    data_array = data_array.rename(
+            {'x': 'longitude',
+             'y': 'latitude',
+             'band': 'dayofyear'})
+
+    # Days of year from band metadata
+    d = gdal.Open(fname)
+    doys = []
+    for band in range(d.RasterCount):
+        md = d.GetRasterBand(band + 1).GetMetadata()
+        doys.append(int(md['RANGEBEGINNINGDATE']))
+
+    data_array['dayofyear'] = doys
+
+    # Statistics saved as scaled integers
+    scaling = get_scale_band_metadata(fname)
+    if scaling is not None:
+        data_array = decode_scaled(data_array, *scaling)
+
+    return data_array
@@ -0,0 +1,165 @@
+
+import numpy as np
+
+def pct_data_available(valid, axis=0):
+    """
+    Percentage of data available along the time axis, same as the
+    pct_data_available computed by the TATSSI QA Analytics
+    :param valid: Boolean array, True where there are valid observations
+    :param axis: Time axis
+    :return: Percentage of valid observations for every pixel
+    """
+    n_obs = valid.shape[axis]
+
+    return (valid.sum(axis=axis) * 100.0) / n_obs
+
+def get_valid_observations(data, fill_value=None):
+    """
+    Get the per-observation validity of a (time, rows, cols) array,
+    an observation is valid if it is finite and different from the
+    fill value
+    :param data: (time, rows, cols) NumPy array
+    :param fill_value: Fill value, None if there is no fill value
+    :return: Boolean (time, rows, cols) array
+    """
+    if np.issubdtype(data.dtype, np.floating):
+        valid = np.isfinite(data)
+    else:
+        valid = np.ones(data.shape, dtype=bool)
+
+    if fill_value is not None and not np.isnan(fill_value):
+        valid &= (data != fill_value)
+
+    return valid
+
+def get_valid_pixels(data, fill_value=None, min_pct_data_available=0.0):
+    """
+    Get the pixels with enough valid observations to be processed
+    :param data: (time, rows, cols) NumPy array
+    :param fill_value: Fill value, None if there is no fill value
+    :param min_pct_data_available: Minimum percentage of valid
+                                   observations for a pixel to be valid,
+                                   pixels without valid observations
+                                   are never considered valid
+    :return: Boolean (rows, cols) array
+    """
+    valid = get_valid_observations(data, fill_value)
+    _pct_data_available = pct_data_available(valid, axis=0)
+
+    valid_pixels = (_pct_data_available >= min_pct_data_available) & \
+                   (_pct_data_available > 0.0)
+
+    return valid_pixels
+
+def compact(data, valid_pixels):
+    """
+    Gathers the valid pixels of a (time, rows, cols) array into a dense
+    (n_valid, time) C-contiguous array, one time series per row
+    :param data: (time, rows, cols) NumPy array
+    :param valid_pixels: Boolean (rows, cols) array
+    :return: (n_valid, time) NumPy array
+    """
+    return np.ascontiguousarray(data[:, valid_pixels].T)
+
+def scatter(compacted, valid_pixels, fill_value=0, dtype=None):
+    """
+    Scatters a dense (n_valid, n_out) array back to a (n_out, rows, cols)
+    array, pixels that are not valid are set to the fill value
+    :param compacted: (n_valid, n_out) NumPy array
+    :param valid_pixels: Boolean (rows, cols) array
+    :param fill_value: Value for non-valid pixels
+    :param dtype: Output data type, default is the compacted data type
+    :return: (n_out, rows, cols) NumPy array
+    """
+    if dtype is None:
+        dtype = compacted.dtype
+
+    rows, cols = valid_pixels.shape
+    n_out = compacted.shape[1]
+
+    data = np.full((n_out, rows, cols), fill_value, dtype=dtype)
+    data[:, valid_pixels] = compacted.T
+
+    return data
+
+def apply_compacted(func, data, fill_value=None, min_pct_data_available=0.0,
+                    output_fill_value=None, n_out=None, dtype=None,
+                    **kwargs):
+    """
+    Applies a per-pixel temporal kernel only on pixels with enough valid
+    observations. Valid pixels of the (time, rows, cols) block are
+    gathered into a dense (n_valid, time) array, func is applied on it
+    and the results are scattered back, all other pixels get the fill
+    value. Can be used as a block function of xr.apply_ufunc or
+    dask map_blocks.
+    :param func: Function that receives a (n_valid, time) array and
+                 returns a (n_valid, n_out) array
+    :param data: (time, rows, cols) NumPy array
+    :param fill_value: Input fill value
+    :param min_pct_data_available: Minimum percentage of valid
+                                   observations for a pixel to be processed
+    :param output_fill_value: Value for pixels that are not processed,
+                              default is the input fill value or 0
+    :param n_out: Number of outputs per pixel, default is the number
+                  of time steps
+    :param dtype: Output data type, default is the input data type
+    :param kwargs: Keyword arguments passed to func
+    :return: (n_out, rows, cols) NumPy array
+    """
+    if output_fill_value is None:
+        output_fill_value = 0 if fill_value is None else fill_value
+
+    if n_out is None:
+        n_out = data.shape[0]
+
+    if dtype is None:
+        dtype = data.dtype
+
+    valid_pixels = get_valid_pixels(data, fill_value, min_pct_data_available)
+
+    if not valid_pixels.any():
+        # Nothing to process
+        return np.full((n_out,) + valid_pixels.shape,
+                       output_fill_value, dtype=dtype)
+
+    result = func(compact(data, valid_pixels), **kwargs)
+
+    return scatter(result, valid_pixels, output_fill_value, dtype)
+
+def compact_pixels(x, fill_value=None, min_pct_data_available=None):
+    """
+    Gathers the valid pixels of a (pixels, time) array, the layout
+    used by the compiled per-pixel kernels, e.g. mann_kendall
+    :param x: (pixels, time) NumPy array
+    :param fill_value: Fill value, None if there is no fill value
+    :param min_pct_data_available: Minimum percentage of valid
+                                   observations for a pixel to be valid,
+                                   None to keep all pixels
+    :return: (n_valid, time) C-contiguous array and boolean (pixels)
+             array with the valid pixels, None if all pixels are kept
+    """
+    if min_pct_data_available is None:
+        return x, None
+
+    valid_pixels = get_valid_pixels(x.T, fill_value, min_pct_data_available)
+
+    return np.ascontiguousarray(x[valid_pixels]), valid_pixels
+
+def scatter_pixels(compacted, valid_pixels, fill_value=0):
+    """
+    Scatters a (n_valid, ...) kernel output back to (pixels, ...), see
+    compact_pixels, pixels that are not valid are set to the fill value
+    :param compacted: (n_valid, ...) NumPy array
+    :param valid_pixels: Boolean (pixels) array, None if all pixels
+                         were kept
+    :param fill_value: Value for non-valid pixels
+    :return: (pixels, ...) NumPy array
+    """
+    if valid_pixels is None:
+        return compacted
+
+    data = np.full(valid_pixels.shape + compacted.shape[1:], fill_value,
+                   dtype=compacted.dtype)
+    data[valid_pixels] = compacted
+
+    return data
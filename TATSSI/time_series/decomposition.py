@@ -0,0 +1,599 @@
+
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+import dask.array as da
+from numba import jit, prange
+
+from TATSSI.input_output.utils import save_dask_arrays
+
+import logging
+LOG = logging.getLogger(__name__)
+
+# Decomposition products, in the order computed by the kernel
+decomposition_products = ['trend', 'seasonality', 'residuals']
+
+@jit(nopython=True)
+def rolling_mean(x, window):
+    """
+    Centered moving average ignoring non-finite observations, same as
+    xarray rolling(time=window, min_periods=1, center=True).mean()
+    :param x: 1D float64 array
+    :param window: Window size
+    :return: 1D float64 array with the moving average
+    """
+    n = x.shape[0]
+    left = window // 2
+    right = window - left - 1
+
+    # Cumulative sum and number of finite observations
+    sum_x = np.zeros(n + 1)
+    count = np.zeros(n + 1, dtype=np.int64)
+    for i in range(n):
+        sum_x[i + 1] = sum_x[i]
+        count[i + 1] = count[i]
+        if np.isfinite(x[i]):
+            sum_x[i + 1] += x[i]
+            count[i + 1] += 1
+
+    output = np.full(n, np.nan)
+    for i in range(n):
+        start = max(0, i - left)
+        end = min(n, i + right + 1)
+        _count = count[end] - count[start]
+        if _count > 0:
+            output[i] = (sum_x[end] - sum_x[start]) / _count
+
+    return output
+
+@jit(nopython=True, parallel=True, error_model='numpy')
+def _decomposition(x, window, doy_index, n_doys, multiplicative):
+    """
+    Trend, seasonality and residuals for a 2D array (pixels, time),
+    pixels are processed in parallel, divisions by zero are not
+    raised to keep the multiplicative model as in NumPy
+    """
+    n_pixels, n = x.shape
+
+    trend = np.empty((n_pixels, n))
+    seasonality = np.full((n_pixels, n_doys), np.nan)
+    residuals = np.empty((n_pixels, n))
+
+    for i in prange(n_pixels):
+        trend[i] = rolling_mean(x[i], window)
+
+        # Day of year averages
+        _sum = np.zeros(n_doys)
+        _count = np.zeros(n_doys)
+        for t in range(n):
+            if np.isfinite(x[i, t]):
+                _sum[doy_index[t]] += x[i, t]
+                _count[doy_index[t]] += 1
+
+        mean, n_valid = 0.0, 0
+        for d in range(n_doys):
+            if _count[d] > 0:
+                seasonality[i, d] = _sum[d] / _count[d]
+                mean += seasonality[i, d]
+                n_valid += 1
+
+        if n_valid > 0:
+            mean /= n_valid
+
+        # Seasonality relative to the average of the period averages,
+        # broadcast to every time step by its day of year
+        for d in range(n_doys):
+            if multiplicative:
+                seasonality[i, d] /= mean
+            else:
+                seasonality[i, d] -= mean
+
+        for t in range(n):
+            if multiplicative:
+                residuals[i, t] = x[i, t] / seasonality[i, doy_index[t]] \
+                        / trend[i, t]
+            else:
+                residuals[i, t] = x[i, t] - trend[i, t] \
+                        - seasonality[i, doy_index[t]]
+
+    return trend, seasonality, residuals
+
+@jit(nopython=True)
+def _stl_est(y, n, length, ideg, xs, nleft, nright, w, userw, rw):
+    """
+    LOESS fit at xs using the observations nleft to nright, 1-based
+    as in the netlib STL stlest routine
+    :return: fitted value, False if the fit is not possible
+    """
+    _range = n - 1.0
+    h = max(xs - nleft, nright - xs)
+    if length > n:
+        h += (length - n) // 2
+
+    h9 = 0.999 * h
+    h1 = 0.001 * h
+
+    # Tricube weights
+    a = 0.0
+    for j in range(nleft, nright + 1):
+        w[j - 1] = 0.0
+        r = abs(j - xs)
+        if r <= h9:
+            if r <= h1:
+                w[j - 1] = 1.0
+            else:
+                w[j - 1] = (1.0 - (r / h) ** 3) ** 3
+            if userw:
+                w[j - 1] *= rw[j - 1]
+            a += w[j - 1]
+
+    if a <= 0.0:
+        return 0.0, False
+
+    for j in range(nleft, nright + 1):
+        w[j - 1] /= a
+
+    if h > 0.0 and ideg > 0:
+        # Local linear fit
+        a = 0.0
+        for j in range(nleft, nright + 1):
+            a += w[j - 1] * j
+
+        b = xs - a
+        c = 0.0
+        for j in range(nleft, nright + 1):
+            c += w[j - 1] * (j - a) ** 2
+
+        if np.sqrt(c) > 0.001 * _range:
+            b /= c
+            for j in range(nleft, nright + 1):
+                w[j - 1] *= (b * (j - a) + 1.0)
+
+    ys = 0.0
+    for j in range(nleft, nright + 1):
+        ys += w[j - 1] * y[j - 1]
+
+    return ys, True
+
+@jit(nopython=True)
+def _stl_ess(y, n, length, ideg, njump, userw, rw, ys, res):
+    """
+    LOESS smoothing of y evaluated every njump observations and
+    linearly interpolated in between, netlib STL stless routine
+    """
+    if n < 2:
+        ys[0] = y[0]
+        return
+
+    newnj = min(njump, n - 1)
+    nleft, nright = 0, 0
+
+    if length >= n:
+        nleft, nright = 1, n
+        for i in range(1, n + 1, newnj):
+            ys[i - 1], ok = _stl_est(y, n, length, ideg, float(i),
+                                     nleft, nright, res, userw, rw)
+            if not ok:
+                ys[i - 1] = y[i - 1]
+    elif newnj == 1:
+        nsh = (length + 1) // 2
+        nleft, nright = 1, length
+        for i in range(1, n + 1):
+            if i > nsh and nright != n:
+                nleft += 1
+                nright += 1
+            ys[i - 1], ok = _stl_est(y, n, length, ideg, float(i),
+                                     nleft, nright, res, userw, rw)
+            if not ok:
+                ys[i - 1] = y[i - 1]
+    else:
+        nsh = (length + 1) // 2
+        for i in range(1, n + 1, newnj):
+            if i < nsh:
+                nleft, nright = 1, length
+            elif i >= n - nsh + 1:
+                nleft, nright = n - length + 1, n
+            else:
+                nleft, nright = i - nsh + 1, length + i - nsh
+            ys[i - 1], ok = _stl_est(y, n, length, ideg, float(i),
+                                     nleft, nright, res, userw, rw)
+            if not ok:
+                ys[i - 1] = y[i - 1]
+
+    if newnj != 1:
+        for i in range(1, n - newnj + 1, newnj):
+            delta = (ys[i + newnj - 1] - ys[i - 1]) / newnj
+            for j in range(i + 1, i + newnj):
+                ys[j - 1] = ys[i - 1] + delta * (j - i)
+
+        k = ((n - 1) // newnj) * newnj + 1
+        if k != n:
+            ys[n - 1], ok = _stl_est(y, n, length, ideg, float(n),
+                                     nleft, nright, res, userw, rw)
+            if not ok:
+                ys[n - 1] = y[n - 1]
+            if k != n - 1:
+                delta = (ys[n - 1] - ys[k - 1]) / (n - k)
+                for j in range(k + 1, n):
+                    ys[j - 1] = ys[k - 1] + delta * (j - k)
+
+@jit(nopython=True)
+def _stl_ma(x, n, length, ave):
+    """
+    Moving average of length observations, netlib STL stlma routine
+    """
+    newn = n - length + 1
+    v = 0.0
+    for i in range(length):
+        v += x[i]
+
+    ave[0] = v / length
+    k, m = length, 0
+    for j in range(1, newn):
+        k += 1
+        m += 1
+        v = v - x[m - 1] + x[k - 1]
+        ave[j] = v / length
+
+@jit(nopython=True)
+def _stl_fts(x, n, period, trend, work):
+    """
+    Low-pass filter, moving averages of period, period and 3
+    observations, netlib STL stlfts routine
+    """
+    _stl_ma(x, n, period, trend)
+    _stl_ma(trend, n - period + 1, period, work)
+    _stl_ma(work, n - 2 * period + 2, 3, trend)
+
+@jit(nopython=True)
+def _stl_ss(y, n, period, ns, isdeg, nsjump, userw, rw, season,
+            work1, work2, work3, work4):
+    """
+    Seasonal smoothing of the cycle-subseries, extended one period
+    at both ends, netlib STL stlss routine
+    """
+    for j in range(1, period + 1):
+        k = (n - j) // period + 1
+        for i in range(1, k + 1):
+            work1[i - 1] = y[(i - 1) * period + j - 1]
+        if userw:
+            for i in range(1, k + 1):
+                work3[i - 1] = rw[(i - 1) * period + j - 1]
+
+        _stl_ess(work1, k, ns, isdeg, nsjump, userw, work3,
+                 work2[1:], work4)
+
+        nright = min(ns, k)
+        work2[0], ok = _stl_est(work1, k, ns, isdeg, 0.0, 1, nright,
+                                work4, userw, work3)
+        if not ok:
+            work2[0] = work2[1]
+
+        nleft = max(1, k - ns + 1)
+        work2[k + 1], ok = _stl_est(work1, k, ns, isdeg, float(k + 1),
+                                    nleft, k, work4, userw, work3)
+        if not ok:
+            work2[k + 1] = work2[k]
+
+        for m in range(1, k + 3):
+            season[(m - 1) * period + j - 1] = work2[m - 1]
+
+@jit(nopython=True)
+def _stl_rwt(y, n, fit, rw):
+    """
+    Robustness weights, bisquare of the residuals scaled by six
+    times their median absolute value, netlib STL stlrwt routine
+    """
+    r = np.abs(y - fit)
+    _r = np.sort(r)
+
+    mid0 = n // 2 + 1
+    mid1 = n - mid0 + 1
+    cmad = 3.0 * (_r[mid0 - 1] + _r[mid1 - 1])
+    c9 = 0.999 * cmad
+    c1 = 0.001 * cmad
+
+    for i in range(n):
+        if r[i] <= c1:
+            rw[i] = 1.0
+        elif r[i] <= c9:
+            rw[i] = (1.0 - (r[i] / cmad) ** 2) ** 2
+        else:
+            rw[i] = 0.0
+
+@jit(nopython=True)
+def stl(y, period, seasonal, trend, low_pass, seasonal_deg, trend_deg,
+        low_pass_deg, seasonal_jump, trend_jump, low_pass_jump,
+        inner, outer):
+    """
+    Seasonal-Trend decomposition using LOESS (STL) of a 1D array,
+    port of the netlib STL Fortran implementation by Cleveland et al.
+    (1990), same as statsmodels.tsa.seasonal.STL
+    :param y: 1D float64 array, all observations must be finite
+    :param period: Number of observations per cycle
+    :param seasonal: Seasonal smoother length, odd
+    :param trend: Trend smoother length, odd
+    :param low_pass: Low-pass filter smoother length, odd
+    :param seasonal_deg: Seasonal LOESS degree, 0 or 1
+    :param trend_deg: Trend LOESS degree, 0 or 1
+    :param low_pass_deg: Low-pass LOESS degree, 0 or 1
+    :param seasonal_jump: Seasonal LOESS evaluated every n observations
+    :param trend_jump: Trend LOESS evaluated every n observations
+    :param low_pass_jump: Low-pass LOESS evaluated every n observations
+    :param inner: Number of inner loop iterations
+    :param outer: Number of robustness iterations
+    :return: seasonal, trend and robustness weights 1D arrays
+    """
+    n = y.shape[0]
+
+    _trend = np.zeros(n)
+    _season = np.zeros(n)
+    rw = np.zeros(n)
+    work = np.zeros((5, n + 2 * period))
+
+    userw = False
+    k = 0
+    while True:
+        # Inner loop, netlib STL stlstp routine
+        for _ in range(inner):
+            for i in range(n):
+                work[0, i] = y[i] - _trend[i]
+
+            _stl_ss(work[0], n, period, seasonal, seasonal_deg,
+                    seasonal_jump, userw, rw, work[1], work[2], work[3],
+                    work[4], _season)
+            _stl_fts(work[1], n + 2 * period, period, work[2], work[0])
+            _stl_ess(work[2], n, low_pass, low_pass_deg, low_pass_jump,
+                     False, work[3], work[0], work[4])
+
+            for i in range(n):
+                _season[i] = work[1, period + i] - work[0, i]
+            for i in range(n):
+                work[0, i] = y[i] - _season[i]
+
+            _stl_ess(work[0], n, trend, trend_deg, trend_jump, userw, rw,
+                     _trend, work[2])
+
+        k += 1
+        if k > outer:
+            break
+
+        _stl_rwt(y, n, _trend + _season, rw)
+        userw = True
+
+    if outer <= 0:
+        rw[:] = 1.0
+
+    return _season, _trend, rw
+
+def get_stl_parameters(period, seasonal=7, robust=True, inner=None,
+                       outer=None):
+    """
+    STL smoother lengths, jumps and iterations. Smoother lengths,
+    degrees and iterations are the defaults of
+    statsmodels.tsa.seasonal.STL, jumps are the 10% jumps of the
+    netlib STL stlez routine, which speed up the LOESS fits, instead
+    of the statsmodels jumps of 1
+    :param period: Number of observations per cycle
+    :param seasonal: Seasonal smoother length, odd and >= 3
+    :param robust: Use robustness iterations
+    :param inner: Number of inner loop iterations, default is 2 if
+                  robust, 5 otherwise
+    :param outer: Number of robustness iterations, default is 15 if
+                  robust, 0 otherwise
+    :return: Tuple with the stl parameters after period
+    """
+    if period < 2:
+        msg = f"STL period must be at least 2"
+        raise Exception(msg)
+
+    if seasonal < 3 or seasonal % 2 == 0:
+        msg = f"STL seasonal smoother length {seasonal} must be odd and >= 3"
+        raise Exception(msg)
+
+    trend = int(np.ceil(1.5 * period / (1.0 - 1.5 / seasonal)))
+    trend = max(3, trend + ((trend + 1) % 2))
+
+    low_pass = period + 1
+    low_pass += (low_pass + 1) % 2
+
+    if inner is None:
+        inner = 2 if robust is True else 5
+    if outer is None:
+        outer = 15 if robust is True else 0
+
+    jumps = [int(np.ceil(length / 10.0))
+             for length in [seasonal, trend, low_pass]]
+
+    return (seasonal, trend, low_pass, 1, 1, 1) + tuple(jumps) + \
+           (inner, outer)
+
+@jit(nopython=True, parallel=True)
+def _stl_decomposition(x, period, parameters):
+    """
+    STL for a 2D array (pixels, time), pixels are processed in parallel
+    """
+    n_pixels, n = x.shape
+
+    trend = np.full((n_pixels, n), np.nan)
+    seasonality = np.full((n_pixels, n), np.nan)
+    residuals = np.full((n_pixels, n), np.nan)
+
+    (seasonal, _trend, low_pass, seasonal_deg, trend_deg, low_pass_deg,
+     seasonal_jump, trend_jump, low_pass_jump, inner, outer) = parameters
+
+    for i in prange(n_pixels):
+        if not np.all(np.isfinite(x[i])):
+            continue
+
+        _season, _trend_i, _ = stl(x[i], period, seasonal, _trend,
+                low_pass, seasonal_deg, trend_deg, low_pass_deg,
+                seasonal_jump, trend_jump, low_pass_jump, inner, outer)
+
+        trend[i] = _trend_i
+        seasonality[i] = _season
+        residuals[i] = x[i] - _trend_i - _season
+
+    return trend, seasonality, residuals
+
+def stl_decomposition(x, period, seasonal=7, robust=True, axis=0,
+                      inner=None, outer=None):
+    """
+    STL decomposition of an N-D array, e.g. a (time, rows, cols) chunk
+    of a time series. Pixels with not finite observations are skipped.
+    Pixels are processed in parallel, when used within dask the chunks
+    should be computed with the synchronous scheduler.
+    :param x: N-D NumPy array
+    :param period: Number of observations per cycle
+    :param seasonal: Seasonal smoother length, odd and >= 3
+    :param robust: Use robustness iterations
+    :param axis: Time axis
+    :param inner: Number of inner loop iterations, see
+                  get_stl_parameters
+    :param outer: Number of robustness iterations, see
+                  get_stl_parameters
+    :return: trend, seasonality, residuals, float64 arrays with
+             the shape of x
+    """
+    parameters = get_stl_parameters(period, seasonal, robust, inner,
+                                    outer)
+
+    _x = np.moveaxis(np.asarray(x, dtype=np.float64), axis, -1)
+    shape = _x.shape
+    n = shape[-1]
+
+    if n < 2 * period:
+        msg = f"STL requires at least two periods of observations"
+        raise Exception(msg)
+
+    _x = np.ascontiguousarray(_x.reshape(-1, n))
+
+    products = _stl_decomposition(_x, int(period), parameters)
+
+    return [np.moveaxis(product.reshape(shape), -1, axis)
+            for product in products]
+
+def decomposition(x, times, window, model='additive', axis=0):
+    """
+    Classical seasonal decomposition of an N-D array, e.g. a
+    (time, rows, cols) chunk of a time series. The trend is a centered
+    moving average, the seasonality the day of year average relative
+    to the average of all days of year and the residuals are computed
+    broadcasting the seasonality by day of year, hence partial years
+    are also handled. Pixels are processed in parallel, when used
+    within dask the chunks should be computed with the synchronous
+    scheduler.
+    :param x: N-D NumPy array
+    :param times: Array of datetime64 time steps
+    :param window: Moving average window size
+    :param model: 'additive' or 'multiplicative'
+    :param axis: Time axis
+    :return: doys, unique days of year
+             trend, float64 array with the shape of x
+             seasonality, float64 array, the time axis is replaced
+             by the days of year
+             residuals, float64 array with the shape of x
+    """
+    if model not in ['additive', 'multiplicative']:
+        msg = f"Decomposition model {model} is not valid"
+        raise Exception(msg)
+
+    doy = pd.DatetimeIndex(times).dayofyear.values
+    doys, doy_index = np.unique(doy, return_inverse=True)
+
+    _x = np.moveaxis(np.asarray(x, dtype=np.float64), axis, -1)
+    shape = _x.shape[:-1]
+    n = _x.shape[-1]
+
+    _x = np.ascontiguousarray(_x.reshape(-1, n))
+
+    trend, seasonality, residuals = _decomposition(_x, int(window),
+            doy_index.astype(np.int64), doys.shape[0],
+            model == 'multiplicative')
+
+    trend, seasonality, residuals = [
+            np.moveaxis(product.reshape(shape + (-1,)), -1, axis)
+            for product in [trend, seasonality, residuals]]
+
+    return doys, trend, seasonality, residuals
+
+def save_decomposition(data, output_fname, data_var, window,
+                       model='additive', progressBar=None):
+    """
+    Computes the seasonal decomposition of a time series and saves
+    every product as a single multi-band file, e.g. for output_fname
+    /path/file.tif:
+        /path/file_seasonal_decomposition_trend.tif
+        /path/file_seasonal_decomposition_seasonality.tif
+        /path/file_seasonal_decomposition_residuals.tif
+    Trend and residuals have one band per time step, seasonality one
+    band per day of year, or per time step for the STL model. Products
+    have the same data type as the input data. All products are
+    computed from a single read of every chunk of the input, with the
+    full time series, see save_dask_arrays.
+    :param data: xarray DataArray with dimensions time, latitude
+                 and longitude
+    :param output_fname: Output file name template
+    :param data_var: String with the data variable name
+    :param window: Moving average window size, for the STL model the
+                   number of observations per cycle
+    :param model: 'additive', 'multiplicative' or 'STL'
+    :param progressBar: Progress bar object
+    :return: Dictionary with the output file name of every product
+    """
+    if model not in ['additive', 'multiplicative', 'STL']:
+        msg = f"Decomposition model {model} is not valid"
+        raise Exception(msg)
+
+    layers, rows, cols = data.shape
+
+    times = data.time.data
+    doys = np.unique(data.time.dt.dayofyear.data)
+
+    # Seasonality layers
+    if model == 'STL':
+        n_seasonality = layers
+    else:
+        n_seasonality = doys.shape[0]
+
+    def __decomposition(x):
+        if model == 'STL':
+            products = stl_decomposition(x, window)
+        else:
+            _doys, *products = decomposition(x, times, window, model)
+
+        return np.concatenate(products, axis=0).astype(data.dtype)
+
+    # All products stacked along the time axis in a single graph
+    _data = data.chunk({'time' : -1}).data
+    _products = da.map_blocks(__decomposition, _data,
+            chunks=((2 * layers + n_seasonality,),) + _data.chunks[1:],
+            dtype=data.dtype)
+
+    offsets = np.cumsum([0, layers, n_seasonality, layers])
+
+    _fname, _ext = os.path.splitext(output_fname)
+    output_fnames, products = {}, {}
+    for i, product in enumerate(decomposition_products):
+        output_fnames[product] = \
+                f'{_fname}_seasonal_decomposition_{product}{_ext}'
+
+        if product == 'seasonality' and model != 'STL':
+            dim, coord = 'dayofyear', doys
+        else:
+            dim, coord = 'time', times
+
+        products[output_fnames[product]] = xr.DataArray(
+                _products[offsets[i]:offsets[i + 1]],
+                dims=(dim, 'latitude', 'longitude'),
+                coords={dim : coord, 'latitude' : data.latitude,
+                        'longitude' : data.longitude},
+                attrs=data.attrs)
+
+    # The kernels are already parallel over pixels, chunks are
+    # processed one at a time to avoid nested parallelism
+    save_dask_arrays(products, data_var, scheduler='synchronous',
+            progressBar=progressBar)
+
+    return output_fnames
@@ -0,0 +1,300 @@
+
+import os
+import json
+import numpy as np
+import xarray as xr
+
+from TATSSI.input_output.execution import uses_execution_config
+
+import logging
+LOG = logging.getLogger(__name__)
+
+# Event types, stored in the event column of the event tables
+event_types = {'change_point' : 0, 'peak' : 1}
+
+class EventTable():
+    """
+    Sparse representation of the events of a (time, latitude,
+    longitude) time series, e.g. change points or peaks, as a table
+    with one row per event and the columns:
+        pixel - Pixel index, row * cols + col
+        time - Time step index
+        event - Event type, see event_types
+        magnitude - Value of the time series at the event
+    Events are sorted by pixel and time. Tables are saved as a single
+    compressed columnar .npz file, e.g. a change points cube that is
+    almost all zeros is stored with only the events.
+    """
+    def __init__(self, pixel, time, event, magnitude, times, latitude,
+                 longitude, attrs=None):
+        """
+        :param pixel: Pixel index of every event
+        :param time: Time step index of every event
+        :param event: Event type of every event
+        :param magnitude: Magnitude of every event
+        :param times: Array of datetime64 time steps of the time series
+        :param latitude: Latitude or y coordinates
+        :param longitude: Longitude or x coordinates
+        :param attrs: Attributes of the time series, e.g. transform
+                      and crs, as xr.open_rasterio
+        """
+        self.times = np.asarray(times)
+        self.latitude = np.asarray(latitude)
+        self.longitude = np.asarray(longitude)
+        self.attrs = {} if attrs is None else dict(attrs)
+
+        n_pixels = self.latitude.shape[0] * self.longitude.shape[0]
+
+        # Smallest integer types for the index columns
+        pixel = np.asarray(pixel, dtype=np.min_scalar_type(n_pixels))
+        time = np.asarray(time,
+                dtype=np.min_scalar_type(self.times.shape[0]))
+
+        order = np.lexsort((time, pixel))
+
+        self.pixel = pixel[order]
+        self.time = time[order]
+        self.event = np.asarray(event, dtype=np.uint8)[order]
+        self.magnitude = np.asarray(magnitude, dtype=np.float32)[order]
+
+    def __len__(self):
+        return self.pixel.shape[0]
+
+    @property
+    def shape(self):
+        """
+        Shape of the time series, (time, latitude, longitude)
+        """
+        return (self.times.shape[0], self.latitude.shape[0],
+                self.longitude.shape[0])
+
+    def select(self, event_type=None):
+        """
+        Events of a single type
+        :param event_type: Event type name, see event_types, None for
+                           all event types
+        :return: EventTable object
+        """
+        if event_type is None:
+            return self
+
+        if event_type not in event_types:
+            msg = f"Event type {event_type} is not valid"
+            raise Exception(msg)
+
+        index = self.event == event_types[event_type]
+
+        return EventTable(self.pixel[index], self.time[index],
+                self.event[index], self.magnitude[index], self.times,
+                self.latitude, self.longitude, self.attrs)
+
+    def get_pixel(self, row, col):
+        """
+        Events of a single pixel
+        :param row: Row index
+        :param col: Column index
+        :return: time, event, magnitude arrays
+        """
+        pixel = row * self.longitude.shape[0] + col
+
+        start, end = np.searchsorted(self.pixel, [pixel, pixel + 1])
+
+        return (self.time[start:end], self.event[start:end],
+                self.magnitude[start:end])
+
+    def save(self, fname):
+        """
+        Saves the table as a compressed .npz file, a temporary file is
+        used so that the table is always valid
+        :param fname: File name full path
+        """
+        tmp_fname = f'{os.path.splitext(fname)[0]}.{os.getpid()}.tmp.npz'
+
+        np.savez_compressed(tmp_fname, pixel=self.pixel, time=self.time,
+                event=self.event, magnitude=self.magnitude,
+                times=self.times, latitude=self.latitude,
+                longitude=self.longitude,
+                attrs=np.array(json.dumps(self.attrs,
+                    default=lambda v: v.tolist())))
+
+        os.replace(tmp_fname, fname)
+
+        LOG.info(f"Event table {fname} with {len(self)} events saved")
+
+    @classmethod
+    def load(cls, fname):
+        """
+        Loads a table saved with EventTable.save
+        :param fname: File name full path
+        :return: EventTable object
+        """
+        with np.load(fname) as table:
+            attrs = json.loads(str(table['attrs']))
+
+            # JSON lists back to tuples, as xr.open_rasterio
+            for key, value in attrs.items():
+                if isinstance(value, list):
+                    attrs[key] = tuple(value)
+
+            return cls(table['pixel'], table['time'], table['event'],
+                       table['magnitude'], table['times'],
+                       table['latitude'], table['longitude'], attrs)
+
+    def to_xarray(self, raster, fill_value, dim=None, coords=None):
+        """
+        DataArray of a rasterized map with the table coordinates and
+        attributes, see rasterize_counts
+        :param raster: (rows, cols) or (layers, rows, cols) array
+        :param fill_value: Fill value of the map
+        :param dim: Name of the first dimension of a 3D map
+        :param coords: Coordinates of the first dimension of a 3D map
+        :return: xarray DataArray
+        """
+        if dim is None:
+            dims = ['latitude', 'longitude']
+            coords = [self.latitude, self.longitude]
+            layers = 1
+        else:
+            dims = [dim, 'latitude', 'longitude']
+            coords = [coords, self.latitude, self.longitude]
+            layers = raster.shape[0]
+
+        attrs = dict(self.attrs)
+        attrs['nodatavals'] = tuple([fill_value] * layers)
+
+        return xr.DataArray(raster, coords=coords, dims=dims, attrs=attrs)
+
+def get_events(flags, x, start_row, start_col, cols, event_type):
+    """
+    Events of a chunk of a time series
+    :param flags: (time, rows, cols) boolean array, True where there
+                  is an event
+    :param x: (time, rows, cols) array with the time series, the
+              magnitude of the events
+    :param start_row: First row of the chunk in the time series
+    :param start_col: First column of the chunk in the time series
+    :param cols: Number of columns of the time series
+    :param event_type: Event type name, see event_types
+    :return: pixel, time, event, magnitude arrays
+    """
+    time, rows, _cols = np.nonzero(flags)
+
+    pixel = ((rows.astype(np.int64) + start_row) * cols) + \
+            (_cols + start_col)
+
+    event = np.full(time.shape[0], event_types[event_type], np.uint8)
+    magnitude = x[time, rows, _cols]
+
+    return pixel, time, event, magnitude
+
+@uses_execution_config
+def build_event_table(data, detector, event_type, progressBar=None):
+    """
+    Builds the event table of a time series, data is processed using
+    the input chunks and only the events of every chunk are kept
+    :param data: xarray DataArray with dimensions time, latitude
+                 and longitude
+    :param detector: Function that takes a (time, rows, cols) NumPy
+                     array and returns a boolean array with the same
+                     shape, True where there is an event, e.g. a
+                     wrapper of change_points or peak_flags
+    :param event_type: Event type name, see event_types
+    :param progressBar: Progress bar object
+    :return: EventTable object
+    """
+    if event_type not in event_types:
+        msg = f"Event type {event_type} is not valid"
+        raise Exception(msg)
+
+    layers, rows, cols = data.shape
+
+    if data.chunks is not None:
+        row_chunks, col_chunks = data.chunks[1], data.chunks[2]
+    else:
+        row_chunks, col_chunks = (rows,), (cols,)
+
+    events = []
+
+    start_row = 0
+    for row_chunk in row_chunks:
+        if progressBar is not None:
+            progressBar.setValue(max(1, (start_row/rows) * 100.0))
+
+        end_row = start_row + row_chunk
+
+        start_col = 0
+        for col_chunk in col_chunks:
+            end_col = start_col + col_chunk
+
+            _data = data[:, start_row:end_row, start_col:end_col]
+            if _data.chunks is not None:
+                _data = _data.compute()
+
+            flags = detector(_data.data)
+            events.append(get_events(flags, _data.data, start_row,
+                    start_col, cols, event_type))
+
+            start_col = end_col
+
+        start_row = end_row
+
+    pixel, time, event, magnitude = [np.concatenate(column)
+                                     for column in zip(*events)]
+
+    return EventTable(pixel, time, event, magnitude, data.time.data,
+                      data.latitude.data, data.longitude.data,
+                      data.attrs)
+
+def rasterize_counts(table, event_type=None, groups=None):
+    """
+    Number of events of every pixel
+    :param table: EventTable object
+    :param event_type: Event type name, see event_types, None for all
+                       event types
+    :param groups: Optional array with a group label for every time
+                   step, e.g. the year, events are counted per group
+    :return: int16 xarray DataArray with dimensions latitude and
+             longitude, or group, latitude and longitude if groups
+             are used, the group coordinate is np.unique(groups)
+    """
+    table = table.select(event_type)
+    layers, rows, cols = table.shape
+
+    if groups is None:
+        counts = np.bincount(table.pixel.astype(np.int64),
+                             minlength=rows * cols)
+        counts = counts.reshape((rows, cols)).astype(np.int16)
+
+        return table.to_xarray(counts, -1)
+
+    unique_groups, group_index = np.unique(groups, return_inverse=True)
+    n_groups = unique_groups.shape[0]
+
+    index = (group_index[table.time].astype(np.int64) * rows * cols) + \
+            table.pixel
+    counts = np.bincount(index, minlength=n_groups * rows * cols)
+    counts = counts.reshape((n_groups, rows, cols)).astype(np.int16)
+
+    return table.to_xarray(counts, -1, dim='group',
+                                        coords=unique_groups)
+
+def rasterize_first_event(table, event_type=None):
+    """
+    Time step index of the first event of every pixel, the date is
+    table.times[index]
+    :param table: EventTable object
+    :param event_type: Event type name, see event_types, None for all
+                       event types
+    :return: int32 xarray DataArray with dimensions latitude and
+             longitude, -1 where there are no events
+    """
+    table = table.select(event_type)
+    layers, rows, cols = table.shape
+
+    first = np.full(rows * cols, -1, dtype=np.int32)
+
+    # Events are sorted by pixel and time
+    pixel, index = np.unique(table.pixel, return_index=True)
+    first[pixel] = table.time[index]
+
+    return table.to_xarray(first.reshape((rows, cols)), -1)
@@ -0,0 +1,139 @@
+
+import numpy as np
+from numba import jit
+
+@jit(nopython=True)
+def _simple_exp_smoothing(y, alpha, initial_level):
+    """
+    Recursive simple exponential smoothing for a 2D array
+    (time, pixels), all pixels are updated at every time step
+    """
+    n, n_pixels = y.shape
+    fitted = np.empty_like(y)
+
+    level = initial_level.copy()
+    for t in range(n):
+        for i in range(n_pixels):
+            # One-step ahead forecast
+            fitted[t, i] = level[i]
+            level[i] = alpha * y[t, i] + (1.0 - alpha) * level[i]
+
+    return fitted
+
+@jit(nopython=True)
+def _holt(y, alpha, beta, initial_level, initial_slope):
+    """
+    Recursive Holt's linear trend smoothing for a 2D array
+    (time, pixels), all pixels are updated at every time step
+    """
+    n, n_pixels = y.shape
+    fitted = np.empty_like(y)
+
+    level = initial_level.copy()
+    slope = initial_slope.copy()
+    for t in range(n):
+        for i in range(n_pixels):
+            # One-step ahead forecast
+            fitted[t, i] = level[i] + slope[i]
+
+            previous_level = level[i]
+            level[i] = alpha * y[t, i] + \
+                    (1.0 - alpha) * (previous_level + slope[i])
+            slope[i] = beta * (level[i] - previous_level) + \
+                    (1.0 - beta) * slope[i]
+
+    return fitted
+
+def _to_2d(y, axis):
+    """
+    Reshape an N-D array into a contiguous float64 2D array
+    (time, pixels) with the time axis first
+    """
+    _y = np.moveaxis(np.asarray(y, dtype=np.float64), axis, 0)
+    shape = _y.shape
+
+    _y = np.ascontiguousarray(_y.reshape(shape[0], -1))
+
+    return _y, shape
+
+def simple_exp_smoothing(y, smoothing_level, axis=0):
+    """
+    Simple exponential smoothing along a single axis of an N-D array.
+    Fitted values are the one-step ahead forecasts, same as the
+    fittedvalues of statsmodels.tsa SimpleExpSmoothing (or
+    ExponentialSmoothing without trend and seasonal components)
+    using a fixed smoothing_level and initial level equal to the
+    first observation.
+    :param y: N-D NumPy array
+    :param smoothing_level: Smoothing level (alpha) in [0, 1]
+    :param axis: Axis along which the smoothing is performed
+    :return: Fitted values N-D array as float64
+    """
+    _y, shape = _to_2d(y, axis)
+
+    fitted = _simple_exp_smoothing(_y, float(smoothing_level),
+                                   _y[0].copy())
+
+    return np.moveaxis(fitted.reshape(shape), 0, axis)
+
+def holt(y, smoothing_level, smoothing_slope=0.1, axis=0):
+    """
+    Holt's linear trend smoothing along a single axis of an N-D array.
+    Fitted values are the one-step ahead forecasts, same as the
+    fittedvalues of statsmodels.tsa Holt using fixed smoothing_level
+    and smoothing_slope, initial level equal to the first observation
+    and initial slope equal to the difference between the first two
+    observations.
+    :param y: N-D NumPy array
+    :param smoothing_level: Smoothing level (alpha) in [0, 1]
+    :param smoothing_slope: Smoothing slope (beta) in [0, 1]
+    :param axis: Axis along which the smoothing is performed
+    :return: Fitted values N-D array as float64
+    """
+    _y, shape = _to_2d(y, axis)
+
+    if shape[0] < 2:
+        msg = f"Holt smoothing requires at least two observations"
+        raise Exception(msg)
+
+    fitted = _holt(_y, float(smoothing_level), float(smoothing_slope),
+                   _y[0].copy(), _y[1] - _y[0])
+
+    return np.moveaxis(fitted.reshape(shape), 0, axis)
+
+# Exponential smoothing methods available, named as in statsmodels.tsa
+exp_smoothing_methods = {'ExponentialSmoothing' : simple_exp_smoothing,
+                         'SimpleExpSmoothing' : simple_exp_smoothing,
+                         'Holt' : holt}
+
+def exp_smoothing(y, method, smoothing_level, smoothing_slope=0.1, axis=0):
+    """
+    Smooths an N-D array along a single axis using any of the
+    exponential smoothing methods. As in the TATSSI smoothing
+    methods, fitted values are shifted one time step back so that
+    the output at time t is the level (plus slope) after observing
+    t, the last time step keeps the last observation.
+    :param y: N-D NumPy array
+    :param method: 'ExponentialSmoothing', 'SimpleExpSmoothing' or 'Holt'
+    :param smoothing_level: Smoothing level (alpha) in [0, 1]
+    :param smoothing_slope: Smoothing slope (beta) in [0, 1], Holt only
+    :param axis: Axis along which the smoothing is performed
+    :return: Smoothed N-D array as float64
+    """
+    if method not in exp_smoothing_methods:
+        msg = f"Exponential smoothing method {method} is not valid"
+        raise Exception(msg)
+
+    if method == 'Holt':
+        fitted = holt(y, smoothing_level, smoothing_slope, axis=axis)
+    else:
+        fitted = exp_smoothing_methods[method](y, smoothing_level, axis=axis)
+
+    fitted = np.moveaxis(fitted, axis, 0)
+    _y = np.moveaxis(np.asarray(y), axis, 0)
+
+    smoothed = np.empty_like(fitted)
+    smoothed[0:-1] = fitted[1::]
+    smoothed[-1] = _y[-1]
+
+    return np.moveaxis(smoothed, 0, axis)
@@ -7,10 +7,13 @@ Created on Wed Jul 29 09:16:06 2015
 """
 
 from __future__ import division
+import math
 import numpy as np
 from scipy.stats import norm
 
-from numba import jit
+from numba import jit, prange
+
+from .compaction import compact_pixels, scatter_pixels
 
 @jit(nopython=True)
 def get_s(x, n):
@@ -20,6 +23,147 @@ def get_s(x, n):
             s += np.sign(x[j] - x[k])
     return s
 
+@jit(nopython=True, parallel=True)
+def mann_kendall(x, t, sen_slope=True):
+    """
+    Mann-Kendall test and Theil-Sen slope for a 2D array (pixels, time),
+    pixels are processed in parallel, hence when used within dask the
+    chunks should be computed with the synchronous scheduler.
+    Non-finite observations are ignored, pixels with less than three
+    finite observations get NaN.
+    :param x: (pixels, time) float64 C-contiguous array
+    :param t: (time) float64 array with the time of every observation
+    :param sen_slope: If False the Theil-Sen slope, the most expensive
+                      part of the kernel, is not computed and set to NaN
+    :return: s, var_s, z, p, slope (pixels) float64 arrays
+             s: Mann-Kendall statistic
+             var_s: variance of s corrected for ties
+             z: normalized test statistic
+             p: p-value of the two tail test
+             slope: Theil-Sen slope, units of x per unit of t
+    """
+    n_pixels, n = x.shape
+
+    s = np.full(n_pixels, np.nan)
+    var_s = np.full(n_pixels, np.nan)
+    z = np.full(n_pixels, np.nan)
+    p = np.full(n_pixels, np.nan)
+    slope = np.full(n_pixels, np.nan)
+
+    for i in prange(n_pixels):
+        # Finite observations
+        _x = np.empty(n)
+        _t = np.empty(n)
+        m = 0
+        for k in range(n):
+            if np.isfinite(x[i, k]):
+                _x[m] = x[i, k]
+                _t[m] = t[k]
+                m += 1
+
+        if m < 3:
+            continue
+
+        # S statistic and pairwise slopes
+        _s = 0.0
+        if sen_slope:
+            slopes = np.empty(m * (m - 1) // 2)
+        else:
+            slopes = np.empty(0)
+        l = 0
+        for k in range(m - 1):
+            for j in range(k + 1, m):
+                d = _x[j] - _x[k]
+                if d > 0:
+                    _s += 1.0
+                elif d < 0:
+                    _s -= 1.0
+                if sen_slope:
+                    slopes[l] = d / (_t[j] - _t[k])
+                    l += 1
+
+        # Tie correction
+        sorted_x = np.sort(_x[0:m])
+        ties = 0.0
+        tp = 1
+        for k in range(1, m):
+            if sorted_x[k] == sorted_x[k - 1]:
+                tp += 1
+            else:
+                ties += tp * (tp - 1) * (2 * tp + 5)
+                tp = 1
+        ties += tp * (tp - 1) * (2 * tp + 5)
+
+        _var_s = (m * (m - 1) * (2 * m + 5) - ties) / 18.0
+
+        if _s > 0 and _var_s > 0:
+            _z = (_s - 1) / np.sqrt(_var_s)
+        elif _s < 0 and _var_s > 0:
+            _z = (_s + 1) / np.sqrt(_var_s)
+        else:
+            _z = 0.0
+
+        s[i] = _s
+        var_s[i] = _var_s
+        z[i] = _z
+        # Two tail test, same as 2*(1-norm.cdf(abs(z)))
+        p[i] = math.erfc(abs(_z) / math.sqrt(2.0))
+        if sen_slope:
+            slope[i] = np.median(slopes)
+
+    return s, var_s, z, p, slope
+
+def mk_test_chunk(x, alpha=0.05, t=None, axis=0, sen_slope=True,
+                  fill_value=None, min_data_available=None):
+    """
+    Mann-Kendall test and Theil-Sen slope for every pixel of an N-D
+    array, e.g. a (time, rows, cols) chunk of a time series
+    :param x: N-D NumPy array
+    :param alpha: Significance level
+    :param t: Time of every observation, default is the time step
+              index, hence the slope is in units of x per time step
+    :param axis: Time axis
+    :param sen_slope: If False the Theil-Sen slope is not computed
+    :param fill_value: Fill value, used to assess the valid observations
+    :param min_data_available: If set, only pixels with at least this
+                               percentage of valid observations are
+                               tested, see compaction.compact_pixels,
+                               other pixels get no trend and NaN p, z
+                               and slope
+    :return: trend, h, p, z, slope arrays with the shape of x
+             without the time axis
+             trend: -1 decreasing, +1 increasing, 0 no trend (int16)
+             h: 1 if there is a trend, 0 otherwise (int8)
+             p: p-value of the significance test (float32)
+             z: normalized test statistic (float32)
+             slope: Theil-Sen slope (float32)
+    """
+    _x = np.moveaxis(np.asarray(x, dtype=np.float64), axis, -1)
+    shape = _x.shape[:-1]
+    n = _x.shape[-1]
+
+    if t is None:
+        t = np.arange(n, dtype=np.float64)
+    else:
+        t = np.asarray(t, dtype=np.float64)
+
+    _x = np.ascontiguousarray(_x.reshape(-1, n))
+    _x, valid_pixels = compact_pixels(_x, fill_value, min_data_available)
+
+    s, var_s, z, p, slope = [scatter_pixels(output, valid_pixels, np.nan)
+            for output in mann_kendall(_x, t, sen_slope)]
+
+    h = np.abs(z) > norm.ppf(1 - alpha / 2)
+
+    trend = np.zeros(z.shape, dtype=np.int16)
+    trend[(z < 0) & h] = -1
+    trend[(z > 0) & h] = 1
+
+    return trend.reshape(shape), h.astype(np.int8).reshape(shape), \
+           p.astype(np.float32).reshape(shape), \
+           z.astype(np.float32).reshape(shape), \
+           slope.astype(np.float32).reshape(shape)
+
 def mk_test(x, alpha=0.05, _round=None):
     """
     This function is derived from code originally posted by Sat Kumar Tomer
@@ -58,30 +202,13 @@ def mk_test(x, alpha=0.05, _round=None):
 
     """
     n = len(x)
-    s = get_s(x, n)
-
-    # calculate the unique data
-    # unique_x, tp = np.unique(x, return_counts=True)
-    # g = len(unique_x)
-
-    # calculate the var(s)
-    # if n == g:  # there is no tie
-    #     var_s = (n*(n-1)*(2*n+5))/18
-    # else:  # there are some ties in data
-    #     var_s = (n*(n-1)*(2*n+5) - np.sum(tp*(tp-1)*(2*tp+5)))/18
-
-    # There is no unique data
-    var_s = (n*(n-1)*(2*n+5))/18
-
-    if s > 0:
-        z = (s - 1)/np.sqrt(var_s)
-    elif s < 0:
-        z = (s + 1)/np.sqrt(var_s)
-    else: # s == 0:
-        z = 0
-
-    # calculate the p_value
-    p = 2*(1-norm.cdf(abs(z)))  # two tail test
+    t = np.arange(n, dtype=np.float64)
+
+    # Same kernel used for the per-pixel Mann-Kendall test products,
+    # var(s) is corrected for ties
+    s, var_s, z, p, slope = mann_kendall(
+            np.asarray(x, dtype=np.float64).reshape(1, n), t, False)
+    z, p = z[0], p[0]
 
     h = abs(z) > norm.ppf(1-alpha/2)
 
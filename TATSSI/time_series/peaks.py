@@ -0,0 +1,187 @@
+
+import numpy as np
+from numba import jit, prange
+
+from .compaction import compact_pixels, scatter_pixels
+
+@jit(nopython=True)
+def find_peaks(x, distance=1):
+    """
+    Finds the local maxima of a 1D array with the algorithm of
+    scipy.signal.find_peaks(x, distance=distance).
+    Flat peaks are reported at their middle sample, then peaks closer
+    than distance to a higher peak are removed. Peaks with the same
+    height are ranked by position, the last one has priority. scipy
+    ranks them with an unstable sort, hence with ties, routine in
+    integer data, the peaks kept can differ from scipy, results are
+    the same as scipy with a stable sort of the peak heights.
+    :param x: 1D float64 array
+    :param distance: Minimum number of samples between peaks
+    :return: Boolean array, True where there is a peak
+    """
+    n = x.shape[0]
+    is_peak = np.zeros(n, dtype=np.bool_)
+
+    # Local maxima test, including plateaus
+    idx = np.empty(n, dtype=np.int64)
+    n_peaks = 0
+    i = 1
+    while i < n - 1:
+        if x[i - 1] < x[i]:
+            # Find the end of a possible plateau
+            i_ahead = i + 1
+            while i_ahead < n - 1 and x[i_ahead] == x[i]:
+                i_ahead += 1
+
+            if x[i_ahead] < x[i]:
+                idx[n_peaks] = (i + i_ahead - 1) // 2
+                n_peaks += 1
+                i = i_ahead
+        i += 1
+
+    if distance <= 1 or n_peaks < 2:
+        for k in range(n_peaks):
+            is_peak[idx[k]] = True
+        return is_peak
+
+    # Distance suppression, highest peaks first
+    peaks = idx[0:n_peaks]
+    heights = np.empty(n_peaks)
+    for k in range(n_peaks):
+        heights[k] = x[peaks[k]]
+
+    keep = np.ones(n_peaks, dtype=np.bool_)
+    priority = np.argsort(heights, kind='mergesort')
+
+    for k in range(n_peaks - 1, -1, -1):
+        j = priority[k]
+        if keep[j] == False:
+            continue
+
+        # Remove lower peaks within distance on both sides
+        l = j - 1
+        while l >= 0 and peaks[j] - peaks[l] < distance:
+            keep[l] = False
+            l -= 1
+
+        l = j + 1
+        while l < n_peaks and peaks[l] - peaks[j] < distance:
+            keep[l] = False
+            l += 1
+
+    for k in range(n_peaks):
+        if keep[k]:
+            is_peak[peaks[k]] = True
+
+    return is_peak
+
+@jit(nopython=True, parallel=True)
+def _annual_peaks(x, year_index, n_years, distance):
+    """
+    Number of peaks per year for a 2D array (pixels, time), pixels
+    are processed in parallel
+    """
+    n_pixels, n = x.shape
+    counts = np.zeros((n_pixels, n_years), dtype=np.int8)
+
+    for i in prange(n_pixels):
+        is_peak = find_peaks(x[i], distance)
+        for t in range(n):
+            if is_peak[t]:
+                counts[i, year_index[t]] += 1
+
+    return counts
+
+def annual_peaks(x, years, distance, axis=0, fill_value=None,
+                 min_data_available=None):
+    """
+    Number of peaks per calendar year for every pixel of an N-D array.
+    Peaks are found on the full time series with find_peaks and
+    accumulated per year, hence no per-observation peaks array is
+    kept. Pixels are processed in parallel, when used within dask
+    the chunks should be computed with the synchronous scheduler.
+    :param x: N-D NumPy array
+    :param years: Year of every observation
+    :param distance: Minimum number of observations between peaks
+    :param axis: Time axis
+    :param fill_value: Fill value, used to assess the valid observations
+    :param min_data_available: If set, only pixels with at least this
+                               percentage of valid observations are
+                               processed, see compaction.compact_pixels,
+                               other pixels get no peaks
+    :return: int8 array with the number of peaks per year, the time
+             axis is replaced by the years in the order of
+             np.unique(years)
+    """
+    _x = np.moveaxis(np.asarray(x, dtype=np.float64), axis, -1)
+    shape = _x.shape[:-1]
+    n = _x.shape[-1]
+
+    unique_years, year_index = np.unique(years, return_inverse=True)
+
+    _x = np.ascontiguousarray(_x.reshape(-1, n))
+    _x, valid_pixels = compact_pixels(_x, fill_value, min_data_available)
+
+    counts = _annual_peaks(_x, year_index.astype(np.int64),
+                           unique_years.shape[0], int(distance))
+    counts = scatter_pixels(counts, valid_pixels, 0)
+
+    counts = counts.T.reshape((unique_years.shape[0],) + shape)
+
+    return np.moveaxis(counts, 0, axis)
+
+@jit(nopython=True, parallel=True)
+def _peak_flags(x, distance):
+    """
+    Peaks for a 2D array (pixels, time), pixels are processed in
+    parallel
+    """
+    n_pixels, n = x.shape
+    flags = np.zeros((n_pixels, n), dtype=np.bool_)
+
+    for i in prange(n_pixels):
+        flags[i] = find_peaks(x[i], distance)
+
+    return flags
+
+def peak_flags(x, distance, axis=0, fill_value=None,
+               min_data_available=None):
+    """
+    Peaks of every pixel of an N-D array, e.g. to build an event
+    table, see TATSSI.time_series.events. Pixels are processed in
+    parallel, when used within dask the chunks should be computed
+    with the synchronous scheduler.
+    :param x: N-D NumPy array
+    :param distance: Minimum number of observations between peaks
+    :param axis: Time axis
+    :param fill_value: Fill value, used to assess the valid observations
+    :param min_data_available: If set, only pixels with at least this
+                               percentage of valid observations are
+                               processed, see compaction.compact_pixels,
+                               other pixels get no peaks
+    :return: Boolean array with the shape of x, True where there is
+             a peak
+    """
+    _x = np.moveaxis(np.asarray(x, dtype=np.float64), axis, -1)
+    shape = _x.shape
+    n = shape[-1]
+
+    _x = np.ascontiguousarray(_x.reshape(-1, n))
+    _x, valid_pixels = compact_pixels(_x, fill_value, min_data_available)
+
+    flags = scatter_pixels(_peak_flags(_x, int(distance)), valid_pixels,
+                           False)
+
+    return np.moveaxis(flags.reshape(shape), -1, axis)
+
+def peak_frequency(counts, n_peaks, axis=0):
+    """
+    Frequency of the years with a specific number of peaks
+    :param counts: Number of peaks per year, e.g. from annual_peaks
+    :param n_peaks: Number of peaks, e.g. 1 for a single growing season
+    :param axis: Year axis
+    :return: Fraction of years with n_peaks peaks
+    """
+    n_years = counts.shape[axis]
+
+    return (counts == n_peaks).sum(axis=axis) / n_years
@@ -0,0 +1,290 @@
+
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+import dask.array as da
+from numba import jit, prange
+
+from TATSSI.input_output.utils import save_dask_arrays
+
+from .compaction import get_valid_observations
+
+import logging
+LOG = logging.getLogger(__name__)
+
+# Phenology metrics, in the order computed by the kernel
+#   SOS - Start of season, day of year
+#   EOS - End of season, day of year
+#   peak_time - Day of year of the maximum
+#   peak_value - Maximum value
+#   amplitude - Maximum minus the average of the left and right minima
+#   integral - Integral of the values between SOS and EOS, value * days
+phenology_metrics = ['SOS', 'EOS', 'peak_time', 'peak_value',
+                     'amplitude', 'integral']
+_n_metrics = len(phenology_metrics)
+
+# Phenology methods
+phenology_methods = {'threshold' : 0, 'derivative' : 1}
+
+@jit(nopython=True)
+def _interp(t, x, start, end, tq):
+    """
+    Linear interpolation of x at tq using the samples start to end - 1
+    """
+    for k in range(start, end - 1):
+        if t[k] <= tq <= t[k + 1]:
+            if t[k + 1] == t[k]:
+                return x[k]
+            return x[k] + (x[k + 1] - x[k]) * (tq - t[k]) / (t[k + 1] - t[k])
+
+    return np.nan
+
+@jit(nopython=True)
+def season_metrics(x, t, start, end, method, threshold):
+    """
+    Phenology metrics of a single season
+    :param x: 1D float64 array with the time series
+    :param t: 1D float64 array with the day of year of every sample
+    :param start: First sample of the season
+    :param end: Last sample of the season + 1
+    :param method: 0 for threshold, 1 for derivative, see
+                   phenology_methods
+    :param threshold: Fraction of the amplitude used to define the
+                      start and end of the season, threshold method only
+    :return: 1D float64 array with the metrics, see phenology_metrics
+    """
+    output = np.full(_n_metrics, np.nan)
+
+    if end - start < 3:
+        return output
+
+    for k in range(start, end):
+        if not np.isfinite(x[k]):
+            return output
+
+    # Peak
+    peak = start
+    for k in range(start + 1, end):
+        if x[k] > x[peak]:
+            peak = k
+
+    # Left and right minima
+    left_min = x[peak]
+    for k in range(start, peak + 1):
+        left_min = min(left_min, x[k])
+
+    right_min = x[peak]
+    for k in range(peak, end):
+        right_min = min(right_min, x[k])
+
+    sos, eos = np.nan, np.nan
+
+    if method == 0:
+        # First crossing of the threshold level before and after peak
+        level = left_min + threshold * (x[peak] - left_min)
+        for k in range(peak, start, -1):
+            if x[k - 1] < level <= x[k]:
+                sos = t[k - 1] + (t[k] - t[k - 1]) * \
+                        (level - x[k - 1]) / (x[k] - x[k - 1])
+                break
+
+        level = right_min + threshold * (x[peak] - right_min)
+        for k in range(peak, end - 1):
+            if x[k + 1] < level <= x[k]:
+                eos = t[k] + (t[k + 1] - t[k]) * \
+                        (x[k] - level) / (x[k] - x[k + 1])
+                break
+    else:
+        # Largest increase before and largest decrease after peak
+        max_slope, min_slope = 0.0, 0.0
+        for k in range(start, end - 1):
+            dt = t[k + 1] - t[k]
+            if dt <= 0:
+                continue
+            slope = (x[k + 1] - x[k]) / dt
+            if k < peak and slope > max_slope:
+                max_slope = slope
+                sos = (t[k] + t[k + 1]) / 2.0
+            elif k >= peak and slope < min_slope:
+                min_slope = slope
+                eos = (t[k] + t[k + 1]) / 2.0
+
+    output[2] = t[peak]
+    output[3] = x[peak]
+    output[4] = x[peak] - ((left_min + right_min) / 2.0)
+
+    if np.isfinite(sos) and np.isfinite(eos) and sos < eos:
+        output[0] = sos
+        output[1] = eos
+
+        # Trapezoidal integral between SOS and EOS
+        t0, x0 = sos, _interp(t, x, start, end, sos)
+        integral = 0.0
+        for k in range(start, end):
+            if sos < t[k] < eos:
+                integral += (t[k] - t0) * (x[k] + x0) / 2.0
+                t0, x0 = t[k], x[k]
+
+        integral += (eos - t0) * (_interp(t, x, start, end, eos) + x0) / 2.0
+        output[5] = integral
+
+    return output
+
+@jit(nopython=True, parallel=True)
+def _phenology(x, t, offsets, method, threshold):
+    """
+    Phenology metrics for a 2D array (pixels, time), seasons are
+    defined by offsets, pixels are processed in parallel
+    """
+    n_pixels, n = x.shape
+    n_seasons = offsets.shape[0] - 1
+
+    output = np.full((n_pixels, _n_metrics, n_seasons),
+                     np.nan, dtype=np.float32)
+
+    for i in prange(n_pixels):
+        for s in range(n_seasons):
+            metrics = season_metrics(x[i], t, offsets[s], offsets[s + 1],
+                                     method, threshold)
+            for m in range(metrics.shape[0]):
+                output[i, m, s] = metrics[m]
+
+    return output
+
+def get_year_groups(times):
+    """
+    Groups the time steps of a time series by calendar year, same
+    grouping used for the annual peaks
+    :param times: Sorted array of datetime64 time steps
+    :return: years, unique years
+             t, day of year of every time step
+             offsets, time steps of years[i] are offsets[i]:offsets[i+1]
+    """
+    times = pd.DatetimeIndex(times)
+
+    years, year_index = np.unique(times.year.values, return_inverse=True)
+    offsets = np.zeros(years.shape[0] + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(np.bincount(year_index))
+
+    t = times.dayofyear.values.astype(np.float64)
+
+    return years, t, offsets
+
+def phenology(x, times, method='threshold', threshold=0.2, axis=0,
+              fill_value=None):
+    """
+    Per calendar year phenology metrics of an N-D array, e.g. a
+    (time, rows, cols) chunk of a smoothed time series. Years with
+    non-finite observations, observations equal to the fill value or
+    less than three observations are set to NaN. Pixels are processed in parallel, when used within dask
+    the chunks should be computed with the synchronous scheduler.
+    :param x: N-D NumPy array
+    :param times: Sorted array of datetime64 time steps
+    :param method: 'threshold' or 'derivative', start and end of season
+                   are defined either when the time series crosses a
+                   fraction of the amplitude or as the largest increase
+                   and decrease
+    :param threshold: Fraction of the amplitude, threshold method only
+    :param axis: Time axis
+    :param fill_value: Fill value, None if there is no fill value
+    :return: years, unique years
+             metrics, float32 array with shape
+             (len(phenology_metrics), len(years), ...)
+    """
+    if method not in phenology_methods:
+        msg = f"Phenology method {method} is not valid"
+        raise Exception(msg)
+
+    years, t, offsets = get_year_groups(times)
+
+    _x = np.moveaxis(np.asarray(x, dtype=np.float64), axis, -1)
+    shape = _x.shape[:-1]
+    n = _x.shape[-1]
+
+    _x = np.ascontiguousarray(_x.reshape(-1, n))
+
+    # Fill values are not observations
+    _x = np.where(get_valid_observations(_x, fill_value), _x, np.nan)
+
+    output = _phenology(_x, t, offsets, phenology_methods[method],
+                        float(threshold))
+    output = np.moveaxis(output, 0, -1).reshape(
+            output.shape[1:] + shape)
+
+    return years, output
+
+def save_phenology(data, output_fname, data_var, method='threshold',
+                   threshold=0.2, encoding=None, progressBar=None):
+    """
+    Computes the phenology metrics of a time series and saves every
+    metric as a single multi-band file with one band per year, e.g.
+    for output_fname /path/file.tif:
+        /path/file_phenology_SOS.tif
+        /path/file_phenology_EOS.tif
+        ...
+    All metrics are computed from a single read of every chunk of the
+    input, with the full time series, see save_dask_arrays.
+    :param data: xarray DataArray with dimensions time, latitude
+                 and longitude
+    :param output_fname: Output file name template
+    :param data_var: String with the data variable name
+    :param method: 'threshold' or 'derivative', see phenology
+    :param threshold: Fraction of the amplitude, threshold method only
+    :param encoding: Dictionary with metric names as keys and the
+                     scaled integer encoding of every metric as values,
+                     see save_dask_array, metrics not in the dictionary
+                     are saved as float32
+    :param progressBar: Progress bar object
+    :return: Dictionary with the output file name of every metric
+    """
+    if method not in phenology_methods:
+        msg = f"Phenology method {method} is not valid"
+        raise Exception(msg)
+
+    if encoding is None:
+        encoding = {}
+
+    times = data.time.data
+    years, t, offsets = get_year_groups(times)
+    n_years = years.shape[0]
+
+    fill_value = data.attrs.get('nodatavals', [None])[0]
+
+    def __phenology(x):
+        _years, metrics = phenology(x, times, method, threshold, axis=0,
+                                    fill_value=fill_value)
+
+        # Metrics stacked along the first axis, one layer per year
+        return metrics.reshape((-1,) + metrics.shape[2:])
+
+    # All metrics stacked along the time axis in a single graph
+    _data = data.chunk({'time' : -1}).data
+    _metrics = da.map_blocks(__phenology, _data,
+            chunks=((_n_metrics * n_years,),) + _data.chunks[1:],
+            dtype=np.float32)
+
+    attrs = dict(data.attrs)
+    attrs['nodatavals'] = tuple([np.nan] * n_years)
+
+    _fname, _ext = os.path.splitext(output_fname)
+    output_fnames, metrics, _encoding = {}, {}, {}
+    for i, metric in enumerate(phenology_metrics):
+        output_fnames[metric] = f'{_fname}_phenology_{metric}{_ext}'
+
+        metrics[output_fnames[metric]] = xr.DataArray(
+                _metrics[i * n_years:(i + 1) * n_years],
+                dims=('year', 'latitude', 'longitude'),
+                coords={'year' : years, 'latitude' : data.latitude,
+                        'longitude' : data.longitude},
+                attrs=attrs)
+
+        if metric in encoding:
+            _encoding[output_fnames[metric]] = encoding[metric]
+
+    # The kernel is already parallel over pixels, chunks are
+    # processed one at a time to avoid nested parallelism
+    save_dask_arrays(metrics, data_var, scheduler='synchronous',
+            encoding=_encoding, progressBar=progressBar)
+
+    return output_fnames
@@ -0,0 +1,94 @@
+
+import numpy as np
+from scipy.signal import savgol_coeffs
+
+def get_savgol_kernels(window_length, polyorder):
+    """
+    Precompute the Savitzky-Golay convolution kernel and the
+    least squares projection matrix used to fit the edges of the
+    time series, same as scipy.signal.savgol_filter(mode='interp')
+    :param window_length: Odd integer, length of the filter window
+    :param polyorder: Order of the polynomial used to fit the samples
+    :return kernel, edge_projection: 1D kernel (window_length) and
+                                     2D projection matrix
+                                     (window_length x window_length)
+    """
+    if window_length % 2 != 1 or window_length < 1:
+        msg = f"Window length {window_length} must be a positive odd integer"
+        raise Exception(msg)
+
+    if polyorder >= window_length:
+        msg = (f"Polynomial order {polyorder} must be less "
+               f"than window length {window_length}")
+        raise Exception(msg)
+
+    # Coefficients in convolution order
+    kernel = savgol_coeffs(window_length, polyorder, use='conv')
+
+    # Projection matrix of a polynomial least squares fit over
+    # a full window, used for the first and last half windows
+    x = np.arange(window_length, dtype=np.float64)
+    vander = np.vander(x, polyorder + 1)
+    edge_projection = vander.dot(np.linalg.pinv(vander))
+
+    return kernel, edge_projection
+
+def savgol(y, window_length=7, polyorder=2, axis=0, n_envelope=0):
+    """
+    Savitzky-Golay smoothing along a single axis of an N-D array.
+    The filter is applied as a single precomputed convolution over
+    the whole array, hence all pixels of a chunk are smoothed
+    simultaneously. Edges are fitted with a polynomial of the same
+    order over the first and last windows.
+    Optionally an upper envelope adaptation is performed following
+    the TIMESAT approach (Jonsson & Eklundh, 2004): observations
+    below the smoothed curve, e.g. cloud depressed NDVI, are replaced
+    by the fitted values and the filter is applied again.
+    :param y: N-D NumPy array
+    :param window_length: Odd integer, length of the filter window
+    :param polyorder: Order of the polynomial used to fit the samples
+    :param axis: Axis along which the filter is applied
+    :param n_envelope: Number of upper envelope iterations,
+                       0 to perform a single smoothing
+    :return: Smoothed N-D array as float64
+    """
+    kernel, edge_projection = get_savgol_kernels(window_length, polyorder)
+
+    # Put the time axis first to work on contiguous layers
+    _y = np.moveaxis(np.asarray(y, dtype=np.float64), axis, 0)
+    n_obs = _y.shape[0]
+
+    if n_obs < window_length:
+        msg = (f"Window length {window_length} must be less or "
+               f"equal than the number of observations {n_obs}")
+        raise Exception(msg)
+
+    half_window = window_length // 2
+
+    def __filter(_data):
+        _smoothed = np.zeros_like(_data)
+
+        # Convolution, interior points only
+        for i, coefficient in enumerate(kernel):
+            _smoothed[half_window:n_obs - half_window] += coefficient * \
+                    _data[window_length - 1 - i:n_obs - i]
+
+        # Polynomial fit of the first and last windows
+        _smoothed[0:half_window] = np.tensordot(
+                edge_projection[0:half_window],
+                _data[0:window_length], axes=1)
+
+        _smoothed[n_obs - half_window:] = np.tensordot(
+                edge_projection[window_length - half_window:],
+                _data[n_obs - window_length:], axes=1)
+
+        return _smoothed
+
+    smoothed = __filter(_y)
+
+    for i in range(n_envelope):
+        # Keep observations above the fitted curve
+        _y = np.maximum(_y, smoothed)
+        smoothed = __filter(_y)
+
+    return np.moveaxis(smoothed, 0, axis)
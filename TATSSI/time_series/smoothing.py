@@ -1,18 +1,27 @@
 
 import os
 import gdal
+from osgeo import gdal_array
 import xarray as xr
-from dask.distributed import Client
 from dask.diagnostics import ProgressBar
 import rasterio as rio
 import logging
 from rasterio import logging as rio_logging
-import statsmodels.tsa.api as tsa
 
-from TATSSI.input_output.utils import save_dask_array
+from TATSSI.input_output.utils import save_dask_array, \
+        get_dst_dataset, get_gt_proj_from_xarray, is_array_store, \
+        open_array_store, decode_scaled
+from TATSSI.input_output.cache import ResultCache
+from TATSSI.input_output.execution import uses_execution_config
 
 from .ts_utils import *
 from .smoothn import *
+from .savgol import savgol
+from .exp_smoothing import exp_smoothing
+from .smoothn_sweep import smoothn_sweep
+from .compaction import apply_compacted, get_valid_pixels
+
+LOG = logging.getLogger(__name__)
 
 class Smoothing():
     """
@@ -21,7 +30,10 @@ class Smoothing():
     def __init__(self, data=None, fname=None,
                  output_fname=None,
                  smoothing_method='smoothn',
-                 s=0.75, progressBar=None):
+                 s=0.75, smoothing_slope=0.1,
+                 window_length=7, polyorder=2,
+                 n_envelope=0, min_data_available=None,
+                 encoding=None, cache=None, progressBar=None):
         """
         TATSSI smoother. Can receive either:
         - an xarray with dimensions time, latitude and longitude
@@ -33,60 +45,147 @@ class Smoothing():
         :param fname: Input filename full path
         :param output_fname: Output filename full path
         :param smoothing_method: A valid TATSSI smoothing method
-        :param s: Smoothing factor
+        :param s: Smoothing factor, smoothing level for the
+                  exponential smoothing methods
+        :param smoothing_slope: Smoothing slope for Holt method
+        :param window_length: Savitzky-Golay window length
+        :param polyorder: Savitzky-Golay polynomial order
+        :param n_envelope: Savitzky-Golay upper envelope iterations
+        :param min_data_available: If set, only pixels with at least
+                                   this percentage of valid observations
+                                   are smoothed, the rest is set to the
+                                   fill value
+        :param encoding: Scaled integer encoding of the output, see
+                         save_dask_array, default is the encoding of
+                         the input if it was saved as scaled integers
+        :param cache: ResultCache object, if set and fname is provided
+                      the smoothed data is taken from the cache when
+                      smoothing the same file with the same parameters
         :param progressBar: Progress bar object
         """
+        # Input filename, used as well to identify cached outputs
+        self.fname = fname
+
         # Set self.data
         if data is not None:
             if self.__check_is_xarray(data) is True:
                 self.data = data
                 self.dataset_name = list(data.data_vars.keys())[0]
         elif fname is not None:
-            self.fname = fname
             self.dataset_name = None # set in self.__get_dataset
             self.__get_dataset()
 
+        # Scaled integer inputs are saved with the same encoding, see
+        # decode_scaled
+        if encoding is None and hasattr(self, 'data'):
+            encoding = self.data[self.dataset_name].encoding
+            if 'scale_factor' not in encoding:
+                encoding = None
+
+        self.encoding = encoding
+
         # Output filename
         self.output_fname = output_fname
 
         self.smoothing_method = smoothing_method
 
         self.s = s
+        self.smoothing_slope = smoothing_slope
+
+        # Savitzky-Golay parameters
+        self.window_length = window_length
+        self.polyorder = polyorder
+        self.n_envelope = n_envelope
+
+        self.min_data_available = min_data_available
+
+        self.cache = cache
+
         self.progressBar = progressBar
 
+    @uses_execution_config
     def smooth(self):
         """
         Method to perform a smoothing on a time series
         """
+        if self.cache is not None and self.fname is not None:
+            key = self.cache.get_key('smoothing', [self.fname],
+                    self.__get_parameters())
+
+            if self.cache.get(key, self.output_fname) is not None:
+                LOG.info(f"File {self.output_fname} saved")
+                return
+
         def __smoothn(_data, s):
             _smoothed_data = smoothn(_data, isrobust=True, s=s,
                      TolZ=1e-6, axis=0)[0].astype(_data.dtype)
 
             return _smoothed_data
 
-        def __smooth_tsa(_data, _method, s):
-            #fit = _method(_data.astype(float)).fit(smoothing_level=s)
-            fit = _method(_data).fit(smoothing_level=s)
+        def __savgol(_data, window_length, polyorder, n_envelope):
+            _smoothed_data = savgol(_data, window_length=window_length,
+                    polyorder=polyorder, axis=0,
+                    n_envelope=n_envelope).astype(_data.dtype)
+
+            return _smoothed_data
+
+        def __smooth_tsa(_data, _method, s, smoothing_slope):
+            _smoothed_data = exp_smoothing(_data, _method,
+                    smoothing_level=s, smoothing_slope=smoothing_slope,
+                    axis=0).astype(_data.dtype)
+
+            return _smoothed_data
 
-            # Re-cast to original data type
-            fittedvalues = np.zeros_like(fit.fittedvalues)
-            fittedvalues[0:-1] = fit.fittedvalues[1::]
-            fittedvalues[-1] = y[-1]
+        def __compacted(_data, _kernel, fill_value, min_data_available,
+                        *args):
+            # Kernels work along axis 0, compacted data is (n_valid, time)
+            _smoothed_data = apply_compacted(
+                    lambda x: _kernel(x.T, *args).T, _data,
+                    fill_value=fill_value,
+                    min_pct_data_available=min_data_available)
 
-            return fittedvalues
+            return _smoothed_data
+
+        def __masked(_data, _kernel, fill_value, min_data_available,
+                     *args):
+            # smoothn is not independent per pixel, the robust weights
+            # and the convergence depend on the whole block, hence the
+            # block is smoothed and only the output is masked
+            _smoothed_data = _kernel(_data, *args)
+
+            valid_pixels = get_valid_pixels(_data, fill_value,
+                                            min_data_available)
+            _smoothed_data[:, ~valid_pixels] = \
+                    0 if fill_value is None else fill_value
+
+            return _smoothed_data
 
         # Create output array
         # Smooth data like a porco!
         y = self.data[self.dataset_name]
 
-        # Only for smoothn
         if self.smoothing_method == 'smoothn':
-            smoothed_data = xr.apply_ufunc(__smoothn, y, self.s,
+            _kernel, _args = __smoothn, [self.s]
+        elif self.smoothing_method == 'savgol':
+            _kernel, _args = __savgol, [self.window_length,
+                    self.polyorder, self.n_envelope]
+        else:
+            _kernel, _args = __smooth_tsa, [self.smoothing_method,
+                    self.s, self.smoothing_slope]
+
+        if self.min_data_available is None:
+            smoothed_data = xr.apply_ufunc(_kernel, y, *_args,
                     dask='parallelized', output_dtypes=[y.data.dtype])
         else:
-            _method = getattr(tsa, self.smoothing_method)
-            smoothed_data = xr.apply_ufunc(
-                    __smooth_tsa, y, _method, self.s,
+            # Smooth only pixels with enough valid observations
+            fill_value = y.attrs['nodatavals'][0]
+            if self.smoothing_method == 'smoothn':
+                _block = __masked
+            else:
+                _block = __compacted
+
+            smoothed_data = xr.apply_ufunc(_block, y, _kernel,
+                    fill_value, self.min_data_available, *_args,
                     dask='parallelized', output_dtypes=[y.data.dtype])
 
         # Copy attributes
@@ -97,15 +196,166 @@ class Smoothing():
 
         save_dask_array(fname=self.output_fname, data=smoothed_data,
                 data_var=self.dataset_name, method=self.smoothing_method,
-                progressBar=self.progressBar)
-                #dask=False)
-                #tile_size=256, n_workers=3,
-                #threads_per_worker=1, memory_limit='7GB')
+                encoding=self.encoding, progressBar=self.progressBar)
+
+        if self.cache is not None and self.fname is not None:
+            self.cache.put(key, self.output_fname, stage='smoothing')
+
+    @uses_execution_config
+    def smooth_sweep(self, s_values, gcv=False):
+        """
+        Method to perform a smoothn smoothing for several smoothing
+        factors reading the input data only once. Each chunk is
+        smoothed for all s values sharing the finite-data weights
+        and the first forward DCT. Outputs are saved as one file per
+        s value using self.output_fname as template, e.g.:
+            output_fname = /path/file.smoothn.tif
+            /path/file.smoothn.s_0.5.tif
+            /path/file.smoothn.s_1.0.tif
+        :param s_values: List of smoothing factors
+        :param gcv: If True, saves the per-pixel generalized
+                    cross-validation score with one layer per s value
+                    in /path/file.smoothn.gcv.tif, the best s for
+                    every pixel is the one with the minimum score
+        :return: List of output file names, the GCV file is the last
+                 element if requested
+        """
+        y = self.data[self.dataset_name]
+        layers, rows, cols = y.shape
+        dtype = y.data.dtype
+
+        # GeoTransform and projection
+        gt, proj = get_gt_proj_from_xarray(y)
+
+        # Output file names
+        _fname, _ext = os.path.splitext(self.output_fname)
+        output_fnames = [f'{_fname}.s_{_s}{_ext}' for _s in s_values]
+
+        # Create destination datasets and set band metadata
+        dst_datasets = []
+        for output_fname in output_fnames:
+            dst_ds = get_dst_dataset(dst_img=output_fname,
+                    cols=cols, rows=rows, layers=layers,
+                    dtype=gdal_array.NumericTypeCodeToGDALTypeCode(dtype),
+                    proj=proj, gt=gt)
+
+            for layer in range(layers):
+                dst_band = dst_ds.GetRasterBand(layer + 1)
+                dst_band.SetMetadataItem('_FillValue',
+                        str(y.attrs['nodatavals'][layer]))
+                dst_band.SetMetadataItem('RANGEBEGINNINGDATE',
+                        y.time.data[layer].astype(str))
+                dst_band.SetMetadataItem('data_var', self.dataset_name)
+
+            dst_datasets.append(dst_ds)
+
+        if gcv is True:
+            gcv_fname = f'{_fname}.gcv{_ext}'
+            output_fnames.append(gcv_fname)
+
+            gcv_ds = get_dst_dataset(dst_img=gcv_fname,
+                    cols=cols, rows=rows, layers=len(s_values),
+                    dtype=gdal.GDT_Float32, proj=proj, gt=gt)
+
+            for i, _s in enumerate(s_values):
+                dst_band = gcv_ds.GetRasterBand(i + 1)
+                dst_band.SetMetadataItem('s', str(_s))
+                dst_band.SetMetadataItem('data_var', self.dataset_name)
+
+        # Process the data using the same chunks used by smooth()
+        # so that the robust weights are identical
+        if y.chunks is not None:
+            row_chunks, col_chunks = y.chunks[1], y.chunks[2]
+        else:
+            row_chunks, col_chunks = (rows,), (cols,)
+
+        start_row = 0
+        for row_chunk in row_chunks:
+            if self.progressBar is not None:
+                self.progressBar.setValue(max(1, (start_row/rows) * 100.0))
+
+            end_row = start_row + row_chunk
+
+            # Single read of the input data for all s values
+            _data = y[:, start_row:end_row, :]
+            if _data.chunks is not None:
+                _data = _data.compute()
+            _data = _data.data
+
+            _smoothed = [np.zeros(_data.shape, dtype) for _s in s_values]
+            _gcv = np.zeros((len(s_values),) + _data.shape[1:], np.float32)
+
+            start_col = 0
+            for col_chunk in col_chunks:
+                end_col = start_col + col_chunk
+
+                z, gcv_scores = smoothn_sweep(
+                        _data[:, :, start_col:end_col], s_values,
+                        isrobust=True, TolZ=1e-6, axis=0, gcv=gcv)
+
+                for i in range(len(s_values)):
+                    _smoothed[i][:, :, start_col:end_col] = z[i]
+
+                if gcv is True:
+                    _gcv[:, :, start_col:end_col] = gcv_scores
+
+                start_col = end_col
+
+            # Write data
+            for i, dst_ds in enumerate(dst_datasets):
+                for layer in range(layers):
+                    dst_ds.GetRasterBand(layer + 1).WriteArray(
+                            _smoothed[i][layer], xoff=0, yoff=start_row)
+
+            if gcv is True:
+                for i in range(len(s_values)):
+                    gcv_ds.GetRasterBand(i + 1).WriteArray(
+                            _gcv[i], xoff=0, yoff=start_row)
+
+            start_row = end_row
+
+        # Flush to disk
+        dst_datasets, dst_ds = None, None
+        gcv_ds = None
+
+        for output_fname in output_fnames:
+            LOG.info(f"File {output_fname} saved")
+
+        return output_fnames
+
+    def __get_parameters(self):
+        """
+        Smoothing parameters that identify a smoothing output
+        """
+        parameters = {'dataset_name' : self.dataset_name,
+                      'method' : self.smoothing_method,
+                      'min_data_available' : self.min_data_available,
+                      'encoding' : self.encoding}
+
+        if self.smoothing_method == 'savgol':
+            parameters.update({'window_length' : self.window_length,
+                               'polyorder' : self.polyorder,
+                               'n_envelope' : self.n_envelope})
+        else:
+            parameters.update({'s' : self.s})
+
+        if self.smoothing_method == 'Holt':
+            parameters.update({'smoothing_slope' : self.smoothing_slope})
+
+        return parameters
 
     def __get_dataset(self):
         """
-        Load all layers from a GDAL compatible file into an xarray
+        Load all layers from a GDAL compatible file, or a NetCDF or
+        Zarr store saved by TATSSI, into an xarray
         """
+        if is_array_store(self.fname):
+            # Chunked store, opened lazily with the store chunks
+            data_array = open_array_store(self.fname)
+            self.dataset_name = data_array.name
+            self.data = data_array.to_dataset()
+            return
+
         # Disable RasterIO logging, just show ERRORS
         log = rio_logging.getLogger()
         log.setLevel(rio_logging.ERROR)
@@ -133,6 +383,11 @@ class Smoothing():
             times = get_times_from_file_band(self.fname)
         data_array['time'] = times
 
+        # Scaled integers, see save_dask_array
+        scaling = get_scale_band_metadata(self.fname)
+        if scaling is not None:
+            data_array = decode_scaled(data_array, *scaling)
+
         # Create new dataset
         self.dataset_name = self.__get_dataset_name()
         dataset = data_array.to_dataset(name=self.dataset_name)
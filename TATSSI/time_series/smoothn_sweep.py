@@ -0,0 +1,124 @@
+
+import numpy as np
+from numpy.linalg import norm
+from scipy.fftpack.realtransforms import dct, idct
+
+from .smoothn import RobustWeights
+
+def smoothn_sweep(y, s_values, isrobust=True, TolZ=1e-6, MaxIter=100,
+                  smoothOrder=2.0, axis=0, weightstr='bisquare',
+                  gcv=False):
+    """
+    Robust spline smoothing (Garcia, 2010) along a single axis for
+    several smoothing parameters in a single pass. The results are
+    the same as calling smoothn(y, isrobust=isrobust, s=s, TolZ=TolZ,
+    axis=axis) for every s, but the finite-data weights, the Lambda
+    eigenvalues and the forward DCT of the first iteration, which do
+    not depend on s, are computed only once for all s values.
+    Since the penalty only acts along the smoothing axis the
+    DCT/IDCT are applied along that axis only.
+    :param y: N-D NumPy array
+    :param s_values: List of smoothing parameters
+    :param isrobust: Perform a robust smoothing
+    :param TolZ: Termination tolerance on Z
+    :param MaxIter: Maximum number of iterations allowed
+    :param smoothOrder: Smoothing order
+    :param axis: Axis along which the smoothing is performed
+    :param weightstr: Robust weighting function, 'bisquare',
+                      'cauchy' or 'talworth'
+    :param gcv: If True, the per-pixel generalized cross-validation
+                score is returned for every s
+    :return: z, list of smoothed N-D arrays, one per s
+             gcv_scores, (len(s_values), ...) array with the GCV score
+             of every pixel or None if gcv is False
+    """
+    # Put the smoothing axis first
+    _y = np.moveaxis(np.array(y, dtype=np.float64), axis, 0)
+    n = _y.shape[0]
+    # Tensor rank of the y-array, as in smoothn
+    N = np.sum(np.array(_y.shape) != 1)
+
+    # Weights, zero weights are assigned to not finite values
+    IsFinite = np.isfinite(_y)
+    W = IsFinite.astype(np.float64)
+    isweighted = np.any(W != 1)
+    _y[~IsFinite] = 0.
+
+    # Lambda contains the eingenvalues of the difference matrix
+    shape = [1] * _y.ndim
+    shape[0] = n
+    Lambda = -2. * (1 - np.cos(np.pi * np.arange(n) / n)).reshape(shape)
+
+    # Relaxation factor RF: to speedup convergence
+    RF = 1 + 0.75 * isweighted
+
+    # First iteration is independent of s:
+    # without weights z = 0, otherwise z = y, hence W*(y-z)+z = y
+    DCTy_0 = dct(_y, norm='ortho', type=2, axis=0)
+
+    z_list = []
+    if gcv is True:
+        gcv_scores = np.zeros((len(s_values),) + _y.shape[1:])
+    else:
+        gcv_scores = None
+
+    for i, s in enumerate(s_values):
+        Gamma = 1. / (1 + (s * np.abs(Lambda))**smoothOrder)
+
+        Wtot = W
+        _isweighted = isweighted
+        if _isweighted:
+            z = _y.copy()
+        else:
+            z = np.zeros_like(_y)
+        z0 = z
+
+        RobustStep = 1
+        RobustIterativeProcess = True
+        tol = 1.
+        nit = 0
+
+        while RobustIterativeProcess:
+            while tol > TolZ and nit < MaxIter:
+                nit = nit + 1
+                if RobustStep == 1 and nit == 1:
+                    DCTy = DCTy_0
+                else:
+                    DCTy = dct(Wtot * (_y - z) + z, norm='ortho',
+                               type=2, axis=0)
+
+                z = RF * idct(Gamma * DCTy, norm='ortho', type=2, axis=0) \
+                        + (1 - RF) * z
+                # If no weighted/missing data => tol=0 (no iteration)
+                tol = _isweighted * norm(z0 - z) / norm(z)
+
+                z0 = z
+
+            if isrobust:
+                # Average leverage
+                h = np.sqrt(1 + 16. * s)
+                h = np.sqrt(1 + h) / np.sqrt(2) / h
+                h = h**N
+                # Take robust weights into account
+                Wtot = W * RobustWeights(_y - z, IsFinite, h, weightstr)
+                # Re-initialize for another iterative weighted process
+                _isweighted = True
+                tol = 1
+                nit = 0
+
+                RobustStep = RobustStep + 1
+                # 3 robust steps are enough
+                RobustIterativeProcess = RobustStep < 3
+            else:
+                RobustIterativeProcess = False
+
+        z_list.append(np.moveaxis(z, 0, axis))
+
+        if gcv is True:
+            # Per-pixel weighted residual sum-of-squares
+            RSS = np.sum(Wtot * (_y - z)**2 * IsFinite, axis=0)
+            nof = np.maximum(IsFinite.sum(axis=0), 1)
+            TrH = np.sum(Gamma)
+            gcv_scores[i] = RSS / nof / (1. - TrH / n)**2
+
+    return z_list, gcv_scores
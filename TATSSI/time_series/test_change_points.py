@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from TATSSI.time_series.change_points import binseg_meanvar, \
+        get_penalty
+
+def r_binseg_meanvar_norm(data, Q, pen, minseglen):
+    """
+    Line by line transcription of binseg.meanvar.norm of the R
+    changepoint package, indices are 1-based as in R. Change points
+    are the ones of cpt.meanvar(data, method='BinSeg', Q=Q,
+    penalty='Manual', pen.value=pen, minseglen=minseglen)
+    """
+    def mll_meanvar(x, x2, n):
+        # Empty segments once no split is left, NaN as in R
+        if n == 0:
+            return np.nan
+        sigmasq = (1 / n) * (x2 - (x ** 2) / n)
+        if sigmasq <= 0:
+            sigmasq = 0.00000000001
+        return n * (np.log(2 * np.pi) + np.log(sigmasq) + 1)
+
+    n = len(data)
+    # y[i] and y2[i] are y[i+1] and y2[i+1] in R
+    y = np.concatenate(([0.0], np.cumsum(data)))
+    y2 = np.concatenate(([0.0], np.cumsum(data ** 2)))
+    tau = [0, n]
+    cpt = np.zeros((2, Q))
+    oldmax = np.inf
+
+    for q in range(Q):
+        # lambda[j-1] is lambda[j] in R
+        lambda_ = np.zeros(n - 1)
+        i = 1
+        st, end = tau[0] + 1, tau[1]
+        null = mll_meanvar(y[end] - y[st - 1], y2[end] - y2[st - 1],
+                           end - st + 1)
+        for j in range(1, n):
+            if j == end:
+                st, i = end + 1, i + 1
+                end = tau[i]
+                null = mll_meanvar(y[end] - y[st - 1],
+                                   y2[end] - y2[st - 1], end - st + 1)
+            elif (j - st) >= minseglen and (end - j) >= minseglen:
+                lambda_[j - 1] = null - \
+                    mll_meanvar(y[j] - y[st - 1], y2[j] - y2[st - 1],
+                                j - st + 1) - \
+                    mll_meanvar(y[end] - y[j], y2[end] - y2[j], end - j)
+
+        k = np.argmax(lambda_) + 1
+        cpt[0, q] = k
+        cpt[1, q] = min(oldmax, lambda_.max())
+        oldmax = min(oldmax, lambda_.max())
+        tau = sorted(tau + [k])
+
+    criterion = np.where(cpt[1] >= pen)[0]
+    if len(criterion) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    return np.sort(cpt[0, 0:criterion.max() + 1]).astype(np.int64)
+
+@pytest.mark.parametrize('minseglen', [2, 3])
+def test_binseg_meanvar_random(minseglen):
+    rng = np.random.default_rng(minseglen)
+
+    for i in range(2000):
+        n = rng.integers(12, 80)
+        y = rng.normal(size=n)
+
+        # Changes in mean and variance
+        for cpt in rng.integers(1, n, size=rng.integers(0, 4)):
+            y[cpt:] = y[cpt:] * rng.uniform(0.2, 3.0) + rng.normal(0, 3)
+
+        pen = get_penalty(n, 'SIC')
+        expected = r_binseg_meanvar_norm(y, 5, pen, minseglen)
+
+        assert np.array_equal(binseg_meanvar(y, pen, 5, minseglen),
+                              expected), (y.tolist(), expected)
+
+def test_binseg_meanvar_step():
+    y = np.concatenate((np.zeros(20), np.full(20, 10.0)))
+    y += np.tile([0.1, -0.1], 20)
+
+    pen = get_penalty(y.shape[0], 'SIC')
+
+    assert np.array_equal(binseg_meanvar(y, pen), [20])
+    assert np.array_equal(r_binseg_meanvar_norm(y, 5, pen, 2), [20])
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+seasonal_module = pytest.importorskip('statsmodels.tsa.seasonal')
+
+from TATSSI.time_series.decomposition import get_stl_parameters, \
+        stl_decomposition
+
+def get_time_series(n_pixels, period=23, n_years=10, seed=0):
+    """
+    (time, pixels) NDVI-like time series with trend, noise and outliers
+    """
+    rng = np.random.default_rng(seed)
+    n = period * n_years
+    t = np.arange(n)
+
+    x = 5000 + 2.0 * t[:, None] + \
+        2000 * np.sin(2 * np.pi * t[:, None] / period) + \
+        rng.normal(0, 300, (n, n_pixels))
+
+    # Outliers, e.g. clouds
+    outliers = rng.random((n, n_pixels)) < 0.05
+    x[outliers] -= 3000
+
+    return np.round(x)
+
+def statsmodels_stl(y, period, seasonal, robust, inner, outer):
+    (seasonal, trend, low_pass, seasonal_deg, trend_deg, low_pass_deg,
+     seasonal_jump, trend_jump, low_pass_jump, _inner, _outer) = \
+            get_stl_parameters(period, seasonal, robust, inner, outer)
+
+    result = seasonal_module.STL(y, period=period, seasonal=seasonal,
+            trend=trend, low_pass=low_pass, seasonal_deg=seasonal_deg,
+            trend_deg=trend_deg, low_pass_deg=low_pass_deg,
+            robust=robust, seasonal_jump=seasonal_jump,
+            trend_jump=trend_jump,
+            low_pass_jump=low_pass_jump).fit(inner_iter=_inner,
+                                             outer_iter=_outer)
+
+    return result.trend, result.seasonal, result.resid
+
+@pytest.mark.parametrize('robust,inner,outer',
+        [(True, None, None), (False, None, None), (True, 1, 3),
+         (False, 2, 0)])
+def test_stl_same_as_statsmodels(robust, inner, outer):
+    period = 23
+    x = get_time_series(4, period)
+
+    products = stl_decomposition(x, period, seasonal=7, robust=robust,
+                                 inner=inner, outer=outer, axis=0)
+
+    for pixel in range(x.shape[1]):
+        expected = statsmodels_stl(x[:, pixel], period, 7, robust,
+                                   inner, outer)
+
+        for product, _expected in zip(products, expected):
+            np.testing.assert_allclose(product[:, pixel], _expected,
+                                       rtol=0, atol=1e-8)
+
+def test_stl_default_iterations():
+    assert get_stl_parameters(23, robust=True)[-2:] == (2, 15)
+    assert get_stl_parameters(23, robust=False)[-2:] == (5, 0)
+
+def test_stl_skips_not_finite_pixels():
+    x = get_time_series(2)
+    x[10, 1] = np.nan
+
+    trend, seasonality, residuals = stl_decomposition(x, 23, axis=0)
+
+    assert np.isfinite(trend[:, 0]).all()
+    assert np.isnan(trend[:, 1]).all()
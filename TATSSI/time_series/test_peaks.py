@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('scipy')
+from scipy.signal import find_peaks as scipy_find_peaks
+from scipy.signal._peak_finding_utils import _select_by_peak_distance
+
+from TATSSI.time_series.peaks import find_peaks, peak_flags
+
+def stable_find_peaks(x, distance):
+    """
+    scipy.signal.find_peaks(x, distance=distance) with the peaks of
+    the same height ranked by position, the last one has priority
+    """
+    peaks, _ = scipy_find_peaks(x)
+    if distance <= 1:
+        return peaks
+
+    # Unique priorities, scipy sorts them with an unstable sort
+    priority = np.argsort(np.lexsort((peaks, x[peaks])))
+    keep = _select_by_peak_distance(peaks, priority.astype(np.float64),
+                                    np.float64(distance))
+
+    return peaks[keep]
+
+@pytest.mark.parametrize('distance', [1, 3, 6, 12])
+def test_find_peaks_integer_data(distance):
+    rng = np.random.default_rng(distance)
+
+    for i in range(1000):
+        # Small range, plenty of plateaus and peaks with equal heights
+        x = rng.integers(0, 8, 46).astype(np.float64)
+
+        peaks = np.flatnonzero(find_peaks(x, distance))
+
+        np.testing.assert_array_equal(peaks, stable_find_peaks(x, distance))
+
+@pytest.mark.parametrize('distance', [1, 3, 6, 12])
+def test_find_peaks_same_as_scipy_without_ties(distance):
+    rng = np.random.default_rng(distance)
+
+    for i in range(1000):
+        x = rng.permutation(46).astype(np.float64)
+
+        peaks = np.flatnonzero(find_peaks(x, distance))
+        _peaks, _ = scipy_find_peaks(x, distance=distance)
+
+        np.testing.assert_array_equal(peaks, _peaks)
+
+def test_find_peaks_ties_last_peak_has_priority():
+    x = np.zeros(23)
+    x[[11, 16]] = 5
+
+    peaks = np.flatnonzero(find_peaks(x, 6))
+
+    np.testing.assert_array_equal(peaks, [16])
+
+def test_peak_flags():
+    rng = np.random.default_rng(0)
+    x = rng.integers(0, 8, (46, 5, 4)).astype(np.int16)
+
+    flags = peak_flags(x, 6, axis=0)
+
+    for row in range(5):
+        for col in range(4):
+            np.testing.assert_array_equal(flags[:, row, col],
+                    find_peaks(x[:, row, col].astype(np.float64), 6))
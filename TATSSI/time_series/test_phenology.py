@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from TATSSI.time_series.phenology import phenology, phenology_metrics
+
+FILL_VALUE = -3000
+
+def get_data():
+    times = pd.date_range('2001-01-01', '2003-12-31', freq='8D').values
+    doy = pd.DatetimeIndex(times).dayofyear.values
+
+    season = np.exp(-(((doy - 200) / 40.0) ** 2))
+    x = (2000 + 5000 * season)[:, None, None] * np.ones((1, 3, 3))
+
+    return times, x.astype(np.int16)
+
+@pytest.mark.parametrize('method', ['threshold', 'derivative'])
+def test_phenology_fill_values(method):
+    times, x = get_data()
+
+    # Fill value in the 2002 season of a pixel, a pixel without data
+    x[70, 1, 1] = FILL_VALUE
+    x[:, 2, 2] = FILL_VALUE
+    x_copy = x.copy()
+
+    years, metrics = phenology(x, times, method, fill_value=FILL_VALUE)
+
+    assert np.array_equal(x, x_copy)
+    assert metrics.shape == (len(phenology_metrics), 3, 3, 3)
+
+    # Same as the data with NaN
+    _x = np.where(x == FILL_VALUE, np.nan, x)
+    _years, expected = phenology(_x, times, method)
+    np.testing.assert_array_equal(metrics, expected)
+
+    assert np.all(np.isfinite(metrics[:, :, 0, 0]))
+    assert np.all(np.isnan(metrics[:, 1, 1, 1]))
+    assert np.all(np.isfinite(metrics[:, [0, 2], 1, 1]))
+    assert np.all(np.isnan(metrics[:, :, 2, 2]))
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+import pytest
+
+from TATSSI.time_series import smoothing
+from TATSSI.time_series.smoothing import Smoothing
+from TATSSI.time_series.compaction import get_valid_pixels
+
+FILL_VALUE = -3000.0
+
+def get_dataset():
+    rng = np.random.default_rng(0)
+    times = pd.date_range('2001-01-01', periods=46, freq='8D')
+
+    x = 5000 + 3000 * np.sin(np.arange(46) * 2 * np.pi / 46)[:, None, None]
+    x = x + rng.normal(0, 300, size=(46, 8, 8))
+
+    # Gaps and a pixel with 25% of valid observations
+    x[rng.random(x.shape) < 0.2] = FILL_VALUE
+    x[rng.random(46) < 0.75, 0, 0] = FILL_VALUE
+
+    data = xr.DataArray(x.astype(np.float32),
+            coords=[times, np.arange(8.0), np.arange(8.0)],
+            dims=['time', 'latitude', 'longitude'], name='evi')
+    data.attrs['nodatavals'] = (FILL_VALUE,)
+
+    return data.to_dataset()
+
+def smooth(monkeypatch, **kwargs):
+    output = {}
+
+    def save_dask_array(fname, data, **_kwargs):
+        output['data'] = data.compute().data
+
+    monkeypatch.setattr(smoothing, 'save_dask_array', save_dask_array)
+
+    Smoothing(data=get_dataset(), output_fname='smoothed.tif',
+              **kwargs).smooth()
+
+    return output['data']
+
+@pytest.mark.parametrize('smoothing_method', ['smoothn', 'savgol'])
+@pytest.mark.parametrize('min_data_available', [0.0, 50.0])
+def test_min_data_available(monkeypatch, smoothing_method,
+                            min_data_available):
+    expected = smooth(monkeypatch, smoothing_method=smoothing_method)
+    smoothed = smooth(monkeypatch, smoothing_method=smoothing_method,
+                      min_data_available=min_data_available)
+
+    x = get_dataset().evi.data
+    valid = get_valid_pixels(x, FILL_VALUE, min_data_available)
+    assert valid.sum() == 64 - (min_data_available > 0)
+
+    np.testing.assert_array_equal(smoothed[:, valid], expected[:, valid])
+    assert np.all(smoothed[:, ~valid] == FILL_VALUE)
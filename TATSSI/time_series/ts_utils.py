@@ -7,6 +7,8 @@ from rasterio import logging as rio_logging
 import subprocess
 from datetime import datetime as dt
 
+from TATSSI.input_output.utils import SCALED_ENCODING_METADATA
+
 def get_times(vrt_fname):
     """
     Extract time info from file metadata
@@ -173,3 +175,32 @@ def get_fill_value_band_metadata(fname):
         return _tmp_fill_values[0]
     else:
         return 0
+
+def get_scale_band_metadata(fname):
+    """
+    Get the scaled integer encoding from the first layer of a GDAL
+    compatible file, see TATSSI.input_output.utils.get_scaled_encoding.
+    Only files encoded by TATSSI are decoded, other files can have a
+    scale_factor with a different convention, e.g. MODIS products.
+    :return: scale_factor, add_offset, fill_value or None if data is
+             not encoded by TATSSI
+    """
+    # Open file
+    _d = gdal.Open(fname)
+    # Get first file from VRT layerstack
+    file_list = _d.GetFileList()
+    if len(file_list) <= 2:
+        _file = file_list[0]
+    else:
+        _file = file_list[1]
+
+    _d = gdal.Open(_file)
+    # Get metatada from band
+    _md = _d.GetRasterBand(1).GetMetadata()
+
+    if 'scale_factor' not in _md or \
+            _md.get(SCALED_ENCODING_METADATA) != 'true':
+        return None
+
+    return (float(_md['scale_factor']), float(_md.get('add_offset', 0.0)),
+            get_fill_value_band_metadata(fname))
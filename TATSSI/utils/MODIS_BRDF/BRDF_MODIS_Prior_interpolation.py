@@ -7,7 +7,8 @@ import xarray as xr
 import numpy as np
 from glob import glob
 import subprocess
-from dask.distributed import Client
+
+from TATSSI.input_output.execution import get_execution_config
 
 def create_vrt(files_path, nBand=1, wings=8):
     """
@@ -100,11 +101,10 @@ if __name__ == "__main__":
     # Copy metadata
     data_interpolated.attrs = data.attrs
 
-    # Setup DASK client
-    client = Client(n_workers=7, threads_per_worker=1, memory_limit='8GB')
-
-    # Number crunching!
-    data_interpolated = data_interpolated.compute()
+    # Number crunching! Workers and memory limit are set by the
+    # execution configuration, see TATSSI.input_output.execution
+    with get_execution_config():
+        data_interpolated = data_interpolated.compute()
 
     # Save file
     proj = ds.GetProjection()
@@ -131,7 +131,3 @@ if __name__ == "__main__":
         dst_band.WriteArray(data_interpolated[nband + wings].data)
 
     dst_ds = None
-
-    # Close client
-    client.close()
-    client = None
@@ -10,6 +10,7 @@ from glob import glob
 from datetime import datetime
 
 from TATSSI.input_output.utils import *
+from TATSSI.input_output.execution import get_execution_config
 
 import logging
 LOG = logging.getLogger(__name__)
@@ -243,14 +244,11 @@ if __name__ == "__main__":
 
     #tmp = data.sel(time=slice('2015-01-01','2015-12-31')).interpolate_na(dim='time', method='linear')
 
-    from dask.distributed import Client
-    #client = Client()
-    client = Client(n_workers=7, threads_per_worker=1, memory_limit='8GB')
-
     LOG.info("Performing interpolation...")
-    #computed_data_interpolated = data_interpolated.compute(scheduler='processes', num_workers=3, memory_limit='20GB')
-    # Launched with default settings
-    computed_data_interpolated = data_interpolated.compute()
+    # Workers and memory limit are set by the execution configuration,
+    # see TATSSI.input_output.execution
+    with get_execution_config():
+        computed_data_interpolated = data_interpolated.compute()
 
     # Change dtype to the original one
     #computed_data_interpolated.data = computed_data_interpolated.data.astype(data.data.dtype)
@@ -262,8 +260,5 @@ if __name__ == "__main__":
     fname = os.path.join(data_dir, 'output_interpolated')
     save_to_file(computed_data_interpolated, fname, method)
 
-    # Close client
-    client.close()
-
     LOG.info("Interpolation finished.")
 
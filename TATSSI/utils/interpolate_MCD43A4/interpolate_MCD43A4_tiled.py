@@ -10,6 +10,7 @@ from glob import glob
 from datetime import datetime
 
 from TATSSI.input_output.utils import *
+from TATSSI.input_output.execution import get_execution_config
 
 import logging
 LOG = logging.getLogger(__name__)
@@ -255,20 +256,16 @@ if __name__ == "__main__":
     # Copy metadata
     data_interpolated.attrs = data.attrs
 
-    from dask.distributed import Client
-    client = Client(n_workers=7, threads_per_worker=1, memory_limit='8GB')
-
     LOG.info("Performing interpolation...")
 
-    # Save data
+    # Save data, workers and memory limit are set by the execution
+    # configuration, see TATSSI.input_output.execution
     fname = os.path.join(data_dir, 'output_interpolated')
-    save_to_file(data_interpolated, fname, method)
+    with get_execution_config():
+        save_to_file(data_interpolated, fname, method)
 
     data_interpolated = None
     del(data_interpolated)
 
-    # Close client
-    client.close()
-
     LOG.info("Interpolation finished.")
 